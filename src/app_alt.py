@@ -1,21 +1,145 @@
-from fastapi import FastAPI, File, UploadFile, Form, Request, Query, HTTPException
-from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse, Response
-from fastapi.staticfiles import StaticFiles
+from fastapi import FastAPI, Request, Query, HTTPException
+from fastapi.responses import FileResponse, HTMLResponse, JSONResponse, RedirectResponse, Response, StreamingResponse
 from fastapi.templating import Jinja2Templates
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
-from pathlib import Path
+import asyncio
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
 from loguru import logger
 import uuid
 from .ocr import *
 from .dummydata import generate_dummy_data
 from .whatsapp_order import send_order_via_whatsapp, format_whatsapp_message
+from .jobs import JobQueue
+from .pages import MAX_PAGES, pack_pages, split_pages, unpack_pages
+from .uploads import UPLOAD_MAX_BYTES, SpooledUpload, receive_upload_form
+from .preprocessing import sniff_mime_type
+from .assets import StaticAssets, accepted_encodings
+from .images import IMAGE_CACHE_CONTROL, IMAGE_SIZES, RenditionStore, etag_matches, image_etag, parse_range
+from .results import RESULT_GZIP_MIN_BYTES, encode_result, gzip_body, gzip_etag, result_body
+from .cache import spell_check_cache, result_cache
+from .brands import brand_index
+from .clients import gemini_clients
+from .keys import key_scheduler
+from .policies import call_policies
+from . import metrics
+from .sessions import SESSION_TTL, create_session_backend
+from .exceptions import JobQueueFull, UploadTooLarge
+from .lexicon import get_drug_lexicon
+
+# Background job settings for /upload
+JOB_CONCURRENCY = int(os.getenv("JOB_CONCURRENCY", "8"))
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", "100"))
+# Seconds between keep-alive comments on idle job event streams
+JOB_EVENTS_KEEPALIVE = float(os.getenv("JOB_EVENTS_KEEPALIVE", "15"))
+# Room for multipart boundaries and form fields on top of the files in an upload request
+UPLOAD_FORM_OVERHEAD = 64 * 1024
+
+# Store session data in the backend selected by SESSION_BACKEND
+session_store = create_session_backend()
+# Job statuses are written from sync callbacks, so they are handed to this thread when the backend blocks
+session_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="session-writer")
+
+async def session_io(function, *args):
+    """Call a session backend method, in a worker thread when the backend waits on disk or network I/O"""
+    if session_store.blocking_io:
+        return await asyncio.to_thread(function, *args)
+    return function(*args)
+
+# Thumbnails and screen-sized copies of uploaded pages, served from disk
+rendition_store = RenditionStore()
+
+async def run_prescription_job(job, uploads: list[SpooledUpload]):
+    """Process an uploaded prescription in the background and store the result under the job's session ID"""
+    def on_event(event: str, data):
+        job.add_event(event, data.model_dump() if hasattr(data, "model_dump") else data)
+
+    # Queued jobs hold spool files rather than bytes; they are only read once a worker gets to them
+    try:
+        files = await asyncio.to_thread(lambda: [upload.read() for upload in uploads])
+    finally:
+        for upload in uploads:
+            upload.close()
+    # PDFs are rendered once here, so the stored pages can be shown and reprocessed as images
+    pages = await asyncio.to_thread(split_pages, files)
+    # Without PDFs every file is one page, so the hashes taken while receiving them identify the pages
+    page_hashes = [upload.sha256 for upload in uploads] if len(pages) == len(uploads) and not any(
+        upload.content_type == "application/pdf" for upload in uploads) else None
+    # Renditions are made while Gemini works on the pages
+    renditions = asyncio.ensure_future(asyncio.to_thread(rendition_store.render_pages, pages, page_hashes))
+    try:
+        final_data, spell_check_data = await process_prescription_with_spell_check_async(
+            pages, on_stage=job.set_status, on_event=on_event, page_hashes=page_hashes, pages_split=True
+        )
+    except BaseException:
+        renditions.cancel()
+        raise
+    await session_io(session_store.put, job.job_id, {
+        "final_data": final_data,
+        "spell_check_data": spell_check_data,
+        "result": encode_result(final_data, spell_check_data),
+        "edited_data": None,
+        "whatsapp_message": "",
+        "page_count": len(pages),
+        "page_hashes": await renditions
+    }, pack_pages(pages))
+    logger.info(f"Image processing complete for session: {job.job_id}")
+
+def write_job_status(job_id: str, status: dict):
+    """Store a job's status in the session backend, logging rather than raising on failure"""
+    try:
+        session_store.put_job(job_id, status)
+    except Exception as e:
+        logger.error(f"Failed to store the status of job {job_id}: {e}")
+
+def record_job_status(job):
+    """Mirror a job's status to the session backend without holding up the event loop"""
+    if session_store.blocking_io:
+        # One writer thread, so statuses are stored in the order they happened
+        session_writer.submit(write_job_status, job.job_id, job.to_dict())
+    else:
+        write_job_status(job.job_id, job.to_dict())
+
+# Job statuses are mirrored to the session backend so any worker can answer a poll
+job_queue = JobQueue(run_prescription_job, concurrency=JOB_CONCURRENCY, max_queue_size=JOB_QUEUE_SIZE,
+                     on_update=record_job_status)
+
+async def prune_renditions_forever():
+    """Delete image renditions older than a session can live, once an hour"""
+    while True:
+        try:
+            await asyncio.to_thread(rendition_store.prune, SESSION_TTL)
+        except Exception as e:
+            logger.error(f"Rendition pruning failed: {e}")
+        await asyncio.sleep(3600)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Size the Gemini executor, load the drug lexicon and run the background job workers for the app's lifetime"""
+    executor = use_gemini_executor()
+    await asyncio.to_thread(get_drug_lexicon)
+    await job_queue.start()
+    await session_store.start()
+    pruner = asyncio.create_task(prune_renditions_forever())
+    yield
+    pruner.cancel()
+    await session_store.stop()
+    await job_queue.stop()
+    session_writer.shutdown(wait=True)
+    await gemini_clients.aclose()
+    executor.shutdown(wait=False, cancel_futures=True)
 
 # Initialize FastAPI app
 app = FastAPI(
     title="Pharmacist's Assistant",
     description="Extract and verify medication information from prescription images",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Add CORS middleware
@@ -27,14 +151,57 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Set up static files and templates
-static_path = Path("public")
-templates = Jinja2Templates(directory="templates")
-app.mount("/static", StaticFiles(directory=static_path), name="static")
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """Count in-flight requests and time each one by its route template"""
+    metrics.http_in_flight.inc()
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        metrics.http_in_flight.dec()
+        route = request.scope.get("route")
+        metrics.http_request_duration.observe(
+            time.perf_counter() - start,
+            method=request.method,
+            route=getattr(route, "path", "unmatched"),
+            status=status,
+        )
 
-# Store session data (in memory for demo purposes)
-# In production, use a proper session management system
-session_store = {}
+@app.middleware("http")
+async def limit_upload_size(request: Request, call_next):
+    """Refuse uploads that declare a body larger than the limits allow before any of it is read"""
+    if request.url.path == "/upload":
+        length = request.headers.get("content-length", "")
+        if length.isdigit() and int(length) > UPLOAD_MAX_BYTES * MAX_PAGES + UPLOAD_FORM_OVERHEAD:
+            return JSONResponse(
+                status_code=413,
+                content={"detail": f"Uploads are limited to {MAX_PAGES} files of {UPLOAD_MAX_BYTES // (1024 * 1024)} MB"}
+            )
+    return await call_next(request)
+
+def collect_metrics():
+    """Mirror the key scheduler, session backend and job queue into their gauges before a scrape"""
+    metrics.gemini_in_flight.clear()
+    for name, key in key_scheduler.stats()["keys"].items():
+        metrics.gemini_in_flight.set(key["in_flight"], key=name)
+    session_stats = session_store.stats()
+    metrics.sessions.set(session_stats["entries"])
+    if session_stats["bytes"] is not None:
+        metrics.session_bytes.set(session_stats["bytes"])
+    for status, count in job_queue.stats()["jobs"].items():
+        metrics.jobs.set(count, status=status)
+
+metrics.registry.add_collector(collect_metrics)
+
+# Set up static files and templates; templates link assets through asset_url so built ones are fingerprinted
+static_assets = StaticAssets()
+templates = Jinja2Templates(directory="templates")
+templates.env.globals["asset_url"] = static_assets.url
+app.mount("/static", static_assets.files(), name="static")
 
 @app.get("/", response_class=HTMLResponse)
 async def home(request: Request):
@@ -44,47 +211,186 @@ async def home(request: Request):
         {"request": request, "title": "Pharmacist's Assistant"}
     )
 
-@app.post("/upload")
-async def upload_file(file: UploadFile = File(None), use_dummy: bool = Form(False)):
-    """Handle file upload and process prescription"""
+# The upload form is parsed here rather than through File()/Form() parameters, so each file is
+# size-checked and spooled once while it streams in
+@app.post("/upload", openapi_extra={"requestBody": {"required": True, "content": {"multipart/form-data": {
+    "schema": {"type": "object", "properties": {
+        "file": {"type": "string", "format": "binary"},
+        "files": {"type": "array", "items": {"type": "string", "format": "binary"}},
+        "use_dummy": {"type": "boolean", "default": False}}}}}}})
+async def upload_file(request: Request):
+    """Handle file upload and queue the prescription for background processing.
+
+    A prescription can be one image in file, or several images and PDFs in
+    files, in page order.
+    """
+    received, queued = [], False
     try:
         session_id = str(uuid.uuid4())
 
-        if use_dummy:
+        try:
+            form = await receive_upload_form(request)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        for name, uploads in form.files.items():
+            if name in ("file", "files"):
+                received.extend(uploads)
+            else:
+                for upload in uploads:
+                    upload.close()
+
+        if form.fields.get("use_dummy", "").lower() in ("1", "true", "on", "yes"):
             logger.info("Using dummy data for testing")
             final_data, spell_check_data = generate_dummy_data()
-            image_data = None
-        else:
-            if not file:
-                raise HTTPException(status_code=400, detail="No file uploaded")
-
-            # Read the file content
-            file_content = await file.read()
 
-            logger.info("Processing image")
-            final_data, spell_check_data = process_prescription_with_spell_check(file_content)
-            image_data = file_content
+            # Store session data
+            await session_io(session_store.put, session_id, {
+                "final_data": final_data,
+                "spell_check_data": spell_check_data,
+                "result": encode_result(final_data, spell_check_data),
+                "edited_data": None,
+                "whatsapp_message": ""
+            })
+            return JSONResponse({"session_id": session_id, "job_id": None, "status": "done"})
 
-            logger.info("Image processing complete")
+        if not received:
+            raise HTTPException(status_code=400, detail="No file uploaded")
 
-        # Store session data
-        session_store[session_id] = {
-            "final_data": final_data,
-            "spell_check_data": spell_check_data,
-            "edited_data": None,
-            "whatsapp_message": "",
-            "image_data": image_data
-        }
+        logger.info(f"Queueing {len(received)} file(s) for processing: "
+                    + ", ".join(f"{item.sha256[:12]} ({item.size} bytes)" for item in received))
+        job = job_queue.submit(session_id, received)
+        queued = True
 
-        return JSONResponse({"session_id": session_id})
+        return JSONResponse(
+            status_code=202,
+            content={"session_id": session_id, "job_id": job.job_id, "status": job.status}
+        )
+    except HTTPException:
+        raise
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=e.message)
+    except JobQueueFull as e:
+        raise HTTPException(status_code=429, detail=e.message)
     except Exception as e:
         logger.error(f"Error processing upload: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        # The job deletes the spooled files once it has read them; nothing else will if it wasn't queued
+        if not queued:
+            for upload in received:
+                upload.close()
+
+@app.get("/api/jobs/{job_id}")
+async def get_job_status(job_id: str):
+    """Get the processing status of an uploaded prescription"""
+    job = job_queue.get(job_id)
+    status = job.to_dict() if job else await session_io(session_store.get_job, job_id)
+    if not status:
+        return JSONResponse(
+            status_code=404,
+            content={"error": "Job not found"}
+        )
+
+    return JSONResponse(status)
+
+def format_sse(event: str, data) -> str:
+    """Format one Server-Sent Events message"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.get("/api/jobs/{job_id}/events")
+async def stream_job_events(job_id: str):
+    """
+    Stream a job's progress as Server-Sent Events.
+
+    Jobs running in this worker stream "status" events plus partial results as
+    they are produced: "ocr_text" chunks, the "medications" table once OCR is
+    done and a "spell_check" event per medicine. Jobs running in another worker
+    only stream their status, polled from the session backend.
+    """
+    job = job_queue.get(job_id)
+    if not job and not await session_io(session_store.get_job, job_id):
+        return JSONResponse(
+            status_code=404,
+            content={"error": "Job not found"}
+        )
+
+    async def local_events():
+        async for event in job.stream_events(keepalive=JOB_EVENTS_KEEPALIVE):
+            yield format_sse(event["event"], event["data"]) if event else ": keep-alive\n\n"
+
+    async def remote_events():
+        last_status = None
+        while True:
+            status = await session_io(session_store.get_job, job_id)
+            if not status:
+                return
+            if status != last_status:
+                yield format_sse("status", status)
+                last_status = status
+            if status["status"] in ("done", "failed"):
+                return
+            await asyncio.sleep(1)
+
+    return StreamingResponse(
+        local_events() if job else remote_events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/api/jobs")
+async def get_job_queue_stats():
+    """Get job queue depth and job counts by status"""
+    return JSONResponse(job_queue.stats())
+
+@app.get("/api/sessions")
+async def get_session_stats():
+    """Get the session backend's entry count, bytes held and eviction counters"""
+    return JSONResponse(await session_io(session_store.stats))
+
+@app.get("/api/keys")
+async def get_key_stats():
+    """Get per-key request, token and rate limit counters, and per-stage latency and retry counters"""
+    return JSONResponse({
+        **key_scheduler.stats(),
+        "stages": {stage: policy.stats() for stage, policy in call_policies.items()}
+    })
+
+@app.get("/api/ocr")
+async def get_ocr_stats():
+    """Get the OCR mode, how often OCR text needed the fallback structuring call and the pooled Gemini clients"""
+    total = structuring_stats["local"] + structuring_stats["fallback"]
+    return JSONResponse({
+        "mode": OCR_MODE,
+        "clients": gemini_clients.stats(),
+        "structuring": {
+            **structuring_stats,
+            "fallback_rate": structuring_stats["fallback"] / total if total else 0.0
+        }
+    })
+
+@app.get("/api/cache")
+async def get_cache_stats():
+    """Get hit/miss counters and sizes for the on-disk caches"""
+    return JSONResponse({
+        "spell_check": spell_check_cache.stats() if spell_check_cache else None,
+        "results": result_cache.stats() if result_cache else None,
+        "brands": brand_index.stats() if brand_index else None
+    })
+
+@app.get("/metrics")
+async def get_metrics():
+    """Expose stage latencies, Gemini call and token counters and in-flight gauges for Prometheus"""
+    return Response(
+        # Collecting the session gauges may query the session backend
+        content=await asyncio.to_thread(metrics.registry.render),
+        media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
 
 @app.get("/prescription/{session_id}")
 async def get_prescription_data(request: Request, session_id: str):
     """Get processed prescription data and render the prescription page"""
-    if session_id not in session_store:
+    session_data = await session_io(session_store.get, session_id)
+    if session_data is None:
         logger.warning(f"Session not found: {session_id}")
         return templates.TemplateResponse(
             "index.html",
@@ -93,40 +399,94 @@ async def get_prescription_data(request: Request, session_id: str):
 
     return templates.TemplateResponse(
         "prescription.html",
-        {"request": request, "session_id": session_id, "has_image": "image_data" in session_store[session_id]}
+        {
+            "request": request,
+            "session_id": session_id,
+            "has_image": await session_io(session_store.has_image, session_id),
+            "page_count": session_data.get("page_count", 1)
+        }
     )
 
 @app.get("/api/prescription-image/{session_id}")
-async def get_prescription_image(session_id: str):
-    """Get the prescription image data"""
-    if session_id not in session_store or "image_data" not in session_store[session_id]:
-        return JSONResponse(
-            status_code=404,
-            content={"error": "Image not found"}
-        )
-
-    return Response(
-        content=session_store[session_id]["image_data"],
-        media_type="image/jpeg"
-    )
+async def get_prescription_image(request: Request, session_id: str, page: int = Query(0, ge=0),
+                                 size: str = Query("original", pattern="^(" + "|".join(IMAGE_SIZES) + ")$")):
+    """Get one page of the prescription image, as uploaded or as a thumbnail or screen-sized copy.
+
+    Responses carry a strong ETag and may be cached by the browser, so a
+    page viewed again is answered with 304 without reading the image.
+    """
+    session_data = await session_io(session_store.get, session_id)
+    page_hashes = (session_data or {}).get("page_hashes") or []
+    sha256 = page_hashes[page] if page < len(page_hashes) else None
+    # The hash is stored with the session, so a current copy is confirmed without loading the image
+    if sha256 and etag_matches(request.headers.get("if-none-match"), image_etag(sha256, size)):
+        return Response(status_code=304, headers={"ETag": image_etag(sha256, size), "Cache-Control": IMAGE_CACHE_CONTROL})
+
+    path = rendition_store.get(sha256, size) if sha256 and size != "original" else None
+    image = None
+    if path is None:
+        image_data = await session_io(session_store.get_image, session_id) if session_data is not None else None
+        try:
+            pages = unpack_pages(image_data) if image_data is not None else []
+        except ValueError as e:
+            logger.error(f"Stored image of session {session_id} is corrupt: {e}")
+            return JSONResponse(status_code=500, content={"error": "Stored image is corrupt"})
+        if page >= len(pages):
+            return JSONResponse(
+                status_code=404,
+                content={"error": "Image not found"}
+            )
+        image = pages[page]
+        if size != "original":
+            # Sessions from before renditions existed, or whose renditions were pruned
+            sha256 = await asyncio.to_thread(rendition_store.render, image, sha256)
+            path = rendition_store.get(sha256, size)
+        sha256 = sha256 or hashlib.sha256(image).hexdigest()
+
+    headers = {"ETag": image_etag(sha256, size), "Cache-Control": IMAGE_CACHE_CONTROL}
+    if etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    if path is not None:
+        # Served with sendfile, with Range requests handled by FileResponse
+        return FileResponse(path, media_type=rendition_store.mime_type(path), headers=headers,
+                            content_disposition_type="inline")
+
+    headers["Accept-Ranges"] = "bytes"
+    if_range = request.headers.get("if-range")
+    try:
+        byte_range = parse_range(request.headers.get("range"), len(image)) if if_range in (None, headers["ETag"]) else None
+    except ValueError:
+        return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{len(image)}"})
+    if byte_range is None:
+        return Response(content=image, media_type=sniff_mime_type(image), headers=headers)
+    first, last = byte_range
+    headers["Content-Range"] = f"bytes {first}-{last}/{len(image)}"
+    return Response(content=image[first:last + 1], status_code=206, media_type=sniff_mime_type(image), headers=headers)
 
 @app.get("/reprocess-image/{session_id}")
-async def reprocess_image(session_id: str):
-    """Reprocess the prescription image for a given session"""
-    if session_id not in session_store or "image_data" not in session_store[session_id]:
+async def reprocess_image(session_id: str, force: bool = Query(False)):
+    """Reprocess the prescription image for a given session, bypassing the result cache when force is set"""
+    # Get the stored image data
+    image_data = await session_io(session_store.get_image, session_id)
+    if image_data is None:
         raise HTTPException(status_code=404, detail="Image not found")
+    session_data = await session_io(session_store.get, session_id)
+    # Hashes stored with the session spare hashing every page again
+    page_hashes = (session_data or {}).get("page_hashes")
 
     try:
-        # Get the stored image data
-        image_data = session_store[session_id]["image_data"]
-        
         # Reprocess the image
-        final_data, spell_check_data = process_prescription_with_spell_check(image_data)
+        pages = unpack_pages(image_data)
+        final_data, spell_check_data = await process_prescription_with_spell_check_async(
+            pages, force=force, page_hashes=page_hashes if page_hashes and len(page_hashes) == len(pages) else None,
+            pages_split=True
+        )
         
         # Update session data with new results
-        session_store[session_id].update({
+        await session_io(session_store.update, session_id, {
             "final_data": final_data,
             "spell_check_data": spell_check_data,
+            "result": encode_result(final_data, spell_check_data),
             "edited_data": None,
             "whatsapp_message": ""
         })
@@ -136,88 +496,90 @@ async def reprocess_image(session_id: str):
         logger.error(f"Error reprocessing image: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/api/prescription/{session_id}")
-async def get_prescription_json(session_id: str):
-    """Get processed prescription data as JSON"""
-    if session_id not in session_store:
+# Results change when a prescription is reprocessed, so browsers must revalidate their copy
+RESULT_CACHE_CONTROL = "private, no-cache"
+
+async def result_response(request: Request, session_id: str, view: str) -> Response:
+    """
+    Serves one view of a session's result from its precomputed JSON.
+
+    Args:
+        request: The incoming request, for its If-None-Match and Accept-Encoding headers
+        session_id: Session holding the result
+        view: "result", "medications" or "spell_check"
+
+    Returns:
+        Response: The JSON body, 304 if the client's copy is current, or 404
+    """
+    session_data = await session_io(session_store.get, session_id)
+    if session_data is None:
         logger.warning(f"Session not found: {session_id}")
         return JSONResponse(
             status_code=404,
             content={"error": "Session not found"}
         )
 
-    session_data = session_store[session_id]
-    final_data = session_data["final_data"]
-
-    if not final_data or not hasattr(final_data, "medications"):
+    result = session_data.get("result")
+    if result is None:
+        # Sessions from before results were encoded when produced
+        result = encode_result(session_data.get("final_data"), session_data.get("spell_check_data"))
+        await session_io(session_store.update, session_id, {"result": result})
+
+    if view == "spell_check":
+        if result["spell_check"] is None:
+            return JSONResponse(
+                status_code=404,
+                content={"error": "No spell check data found"}
+            )
+    elif result["medications"] is None:
         logger.warning(f"No medication data found for session: {session_id}")
         return JSONResponse(
             status_code=404,
             content={"error": "No medication data found"}
         )
 
-    # Convert medication data to table format
-    table_data = []
-    for med in final_data.medications:
-        med_dict = {
-            "Medication Name": med.medication_name,
-            "Dosage": med.dosage,
-            "Quantity": med.quantity,
-            "How to Take": med.instructions.how,
-            "How Much": med.instructions.how_much,
-            "When to Take": med.instructions.when
-        }
-        table_data.append(med_dict)
+    etag = result["etags"][view]
+    body = result_body(result, view)
+    gzipped = len(body) >= RESULT_GZIP_MIN_BYTES and "gzip" in accepted_encodings(request.headers.get("accept-encoding"))
+    # The gzipped body is a different representation, so it gets its own ETag; either one proves the client's copy current
+    headers = {"ETag": gzip_etag(etag) if gzipped else etag, "Cache-Control": RESULT_CACHE_CONTROL, "Vary": "Accept-Encoding"}
+    if etag_matches(request.headers.get("if-none-match"), etag, gzip_etag(etag)):
+        return Response(status_code=304, headers=headers)
+    if gzipped:
+        headers["Content-Encoding"] = "gzip"
+        body = gzip_body(headers["ETag"], body)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+@app.get("/api/result/{session_id}")
+async def get_result_json(request: Request, session_id: str):
+    """Get the medications and spell check results as JSON, in one response
+
+    The body is encoded once when the result is produced and carries an
+    ETag, so a page loaded again is answered with 304.
+    """
+    return await result_response(request, session_id, "result")
 
-    return JSONResponse({"medications": table_data})
+@app.get("/api/prescription/{session_id}")
+async def get_prescription_json(request: Request, session_id: str):
+    """Get processed prescription data as JSON"""
+    return await result_response(request, session_id, "medications")
 
 @app.get("/api/spellcheck/{session_id}")
-async def get_spellcheck_json(session_id: str):
+async def get_spellcheck_json(request: Request, session_id: str):
     """Get spell check results as JSON"""
-    if session_id not in session_store:
-        return JSONResponse(
-            status_code=404,
-            content={"error": "Session not found"}
-        )
-
-    spell_check_data = session_store[session_id]["spell_check_data"]
-
-    if not spell_check_data or not hasattr(spell_check_data, "drugs"):
-        return JSONResponse(
-            status_code=404,
-            content={"error": "No spell check data found"}
-        )
-
-    # Convert spell check data to table format
-    spell_check_table = []
-    for drug in spell_check_data.drugs:
-        drug_dict = {
-            "Original Name": drug.input_name,
-            "Corrected Name": drug.corrected_name,
-            "Generic Names": ", ".join(drug.generic_name),
-            "Brand Names": ", ".join(drug.brand_names),
-            "Correctly Spelled": "✓" if drug.is_correct else "✗",
-            "Is Generic": "Yes" if drug.is_generic else "No",
-            "Notes": drug.notes
-        }
-        spell_check_table.append(drug_dict)
-
-    return JSONResponse({"spell_check": spell_check_table})
+    return await result_response(request, session_id, "spell_check")
 
 @app.post("/update-medications/{session_id}")
 async def update_medications(session_id: str, medications: list):
     """Update medication data"""
-    if session_id not in session_store:
+    whatsapp_message = format_whatsapp_message(medications)
+    if not await session_io(session_store.update, session_id, {"edited_data": medications, "whatsapp_message": whatsapp_message}):
         logger.warning(f"Session not found for update: {session_id}")
         return JSONResponse(
             status_code=404,
             content={"error": "Session not found"}
         )
 
-    session_store[session_id]["edited_data"] = medications
-    whatsapp_message = format_whatsapp_message(medications)
-    session_store[session_id]["whatsapp_message"] = whatsapp_message
-
     logger.info(f"Medications updated successfully for session: {session_id}")
     return JSONResponse({
         "message": "Medications updated successfully",
@@ -231,13 +593,13 @@ async def send_whatsapp(
     custom_message: str = Query(None)
 ):
     """Send order via WhatsApp"""
-    if session_id not in session_store:
+    session_data = await session_io(session_store.get, session_id)
+    if session_data is None:
         return JSONResponse(
             status_code=404,
             content={"error": "Session not found"}
         )
 
-    session_data = session_store[session_id]
     medications = session_data["edited_data"] or []
     message = custom_message or session_data["whatsapp_message"]
 
@@ -0,0 +1,294 @@
+import argparse
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import shutil
+import stat
+import urllib.parse
+import urllib.request
+from pathlib import Path
+import anyio
+from loguru import logger
+from starlette.datastructures import Headers
+from starlette.staticfiles import StaticFiles
+
+# Static asset settings
+STATIC_SOURCE_DIR = os.getenv("STATIC_SOURCE_DIR", "public")
+STATIC_BUILD_DIR = os.getenv("STATIC_BUILD_DIR", os.path.join("build", "static"))
+
+# URL prefix the static files are mounted at
+STATIC_URL = "/static/"
+MANIFEST_NAME = "manifest.json"
+
+# Fingerprinted names change with their content, so browsers may keep them for good
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# Names that keep their content's name, e.g. links into an unbuilt public/ directory
+SHORT_CACHE_CONTROL = "public, max-age=300"
+
+# Third-party scripts served from public/ instead of a CDN, pinned so a build is reproducible
+VENDOR_ASSETS = {
+    "vendor/lottie-player.js": "https://unpkg.com/@lottiefiles/lottie-player@2.0.12/dist/lottie-player.js",
+}
+
+# Text formats worth precompressing
+COMPRESSIBLE_SUFFIXES = {".css", ".html", ".js", ".json", ".map", ".svg", ".txt"}
+
+# Precompressed variants, in order of preference
+ENCODINGS = {"br": ".br", "gzip": ".gz"}
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+def minify(name: str, data: bytes) -> bytes:
+    """
+    Strips whitespace from assets that can be minified without extra tools.
+
+    JSON (the Lottie animations) is re-serialized compactly. Scripts and
+    styles are copied as they are; vendored ones are already minified.
+
+    Args:
+        name: Asset path relative to the source directory
+        data: Asset content
+
+    Returns:
+        bytes: The minified content
+    """
+    if name.endswith(".json"):
+        return json.dumps(json.loads(data), separators=(",", ":"), ensure_ascii=False).encode()
+    return data
+
+def fingerprint(name: str, data: bytes) -> str:
+    """
+    Puts a hash of an asset's content in its file name.
+
+    Args:
+        name: Asset path relative to the source directory, e.g. "Animation - Upload.json"
+        data: Asset content as served
+
+    Returns:
+        str: e.g. "Animation - Upload.3b0a8c5d1e.json"
+    """
+    path = Path(name)
+    digest = hashlib.sha256(data).hexdigest()[:10]
+    return str(path.with_name(f"{path.stem}.{digest}{path.suffix}"))
+
+def compress(data: bytes) -> dict[str, bytes]:
+    """
+    Precompresses an asset with every available encoding.
+
+    Brotli needs the optional brotli package; gzip is always available.
+
+    Args:
+        data: Asset content
+
+    Returns:
+        dict[str, bytes]: Compressed content by file suffix, only where it is smaller than the original
+    """
+    variants = {".gz": gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants[".br"] = brotli.compress(data, quality=11)
+    return {suffix: variant for suffix, variant in variants.items() if len(variant) < len(data)}
+
+def build(source_dir: str = STATIC_SOURCE_DIR, build_dir: str = STATIC_BUILD_DIR) -> dict[str, str]:
+    """
+    Builds the static assets: minified, fingerprinted and precompressed.
+
+    The build is written next to build_dir and swapped in at the end, so a
+    running app never sees half of it.
+
+    Args:
+        source_dir: Directory of assets as committed
+        build_dir: Directory the app serves /static from once built
+
+    Returns:
+        dict[str, str]: Manifest mapping each asset's name to its fingerprinted name
+    """
+    if brotli is None:
+        logger.warning("Install the brotli package to precompress assets with Brotli as well as gzip")
+    staging = build_dir.rstrip(os.sep) + ".tmp"
+    shutil.rmtree(staging, ignore_errors=True)
+    manifest = {}
+    original_bytes = served_bytes = 0
+    for path in sorted(Path(source_dir).rglob("*")):
+        if not path.is_file():
+            continue
+        name = path.relative_to(source_dir).as_posix()
+        data = minify(name, path.read_bytes())
+        hashed = fingerprint(name, data)
+        manifest[name] = hashed
+        target = Path(staging, hashed)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        target.write_bytes(data)
+        original_bytes += path.stat().st_size
+        smallest = len(data)
+        if path.suffix.lower() in COMPRESSIBLE_SUFFIXES:
+            for suffix, variant in compress(data).items():
+                Path(f"{target}{suffix}").write_bytes(variant)
+                smallest = min(smallest, len(variant))
+        served_bytes += smallest
+    Path(staging, MANIFEST_NAME).write_text(json.dumps(manifest, indent=2))
+
+    shutil.rmtree(build_dir, ignore_errors=True)
+    os.makedirs(os.path.dirname(os.path.abspath(build_dir)), exist_ok=True)
+    os.replace(staging, build_dir)
+    logger.info(f"Built {len(manifest)} static assets into {build_dir}: {original_bytes} bytes served as {served_bytes}")
+    return manifest
+
+def vendor(source_dir: str = STATIC_SOURCE_DIR, force: bool = False) -> list[str]:
+    """
+    Downloads the pinned third-party scripts into the source directory.
+
+    Args:
+        source_dir: Directory of assets as committed
+        force: Download files that are already present again
+
+    Returns:
+        list[str]: Names of the files downloaded
+    """
+    downloaded = []
+    for name, url in VENDOR_ASSETS.items():
+        target = Path(source_dir, name)
+        if target.exists() and not force:
+            continue
+        with urllib.request.urlopen(url, timeout=60) as response:
+            data = response.read()
+        target.parent.mkdir(parents=True, exist_ok=True)
+        target.write_bytes(data)
+        logger.info(f"Vendored {url} as {target}")
+        downloaded.append(name)
+    return downloaded
+
+def accepted_encodings(accept_encoding: str | None) -> set[str]:
+    """
+    Parses an Accept-Encoding header.
+
+    Args:
+        accept_encoding: Header value, if sent
+
+    Returns:
+        set[str]: Encodings the client accepts, leaving out those with q=0
+    """
+    encodings = set()
+    for item in (accept_encoding or "").split(","):
+        encoding, _, params = item.partition(";")
+        quality = params.strip().removeprefix("q=").strip() if params.strip().startswith("q=") else "1"
+        try:
+            accepted = float(quality) > 0
+        except ValueError:
+            accepted = False
+        if encoding.strip() and accepted:
+            encodings.add(encoding.strip().lower())
+    return encodings
+
+class PrecompressedStaticFiles(StaticFiles):
+    """
+    StaticFiles that serves precompressed variants and caches fingerprinted names for good.
+
+    A request for an asset's plain name is answered with its latest
+    fingerprinted build under a short cache lifetime, so old links keep
+    working.
+
+    Attributes:
+        manifest: Asset names mapped to their fingerprinted names
+    """
+    def __init__(self, directory: str, manifest: dict[str, str]):
+        super().__init__(directory=directory)
+        self.manifest = manifest
+        self._fingerprinted = set(manifest.values())
+
+    async def get_response(self, path: str, scope):
+        name = path.replace(os.sep, "/")
+        served = self.manifest.get(name, name)
+        cache_control = IMMUTABLE_CACHE_CONTROL if served in self._fingerprinted and served == name else SHORT_CACHE_CONTROL
+        accepted = accepted_encodings(Headers(scope=scope).get("accept-encoding"))
+        if scope["method"] in ("GET", "HEAD"):
+            for encoding, suffix in ENCODINGS.items():
+                if encoding not in accepted:
+                    continue
+                full_path, stat_result = await anyio.to_thread.run_sync(self.lookup_path, served + suffix)
+                if stat_result and stat.S_ISREG(stat_result.st_mode):
+                    response = self.file_response(full_path, stat_result, scope)
+                    response.headers["content-encoding"] = encoding
+                    response.headers["content-type"] = self.content_type(served)
+                    response.headers["vary"] = "Accept-Encoding"
+                    response.headers["cache-control"] = cache_control
+                    return response
+
+        response = await super().get_response(served, scope)
+        response.headers["cache-control"] = cache_control
+        if os.path.splitext(served)[1].lower() in COMPRESSIBLE_SUFFIXES:
+            response.headers["vary"] = "Accept-Encoding"
+        return response
+
+    def content_type(self, name: str) -> str:
+        media_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+        return f"{media_type}; charset=utf-8" if media_type.startswith("text/") or name.endswith((".js", ".json")) else media_type
+
+class StaticAssets:
+    """
+    The UI's static files: the build when there is one, the source directory otherwise.
+
+    Attributes:
+        directory: Directory /static is served from
+        manifest: Asset names mapped to their fingerprinted names (empty without a build)
+    """
+    def __init__(self, source_dir: str = STATIC_SOURCE_DIR, build_dir: str = STATIC_BUILD_DIR):
+        self.source_dir = source_dir
+        manifest_path = Path(build_dir, MANIFEST_NAME)
+        if manifest_path.exists():
+            self.directory = build_dir
+            self.manifest = json.loads(manifest_path.read_text())
+            logger.info(f"Serving {len(self.manifest)} built static assets from {build_dir}")
+        else:
+            self.directory = source_dir
+            self.manifest = {}
+            logger.warning(f"Serving unbuilt static assets from {source_dir}; run python -m src.assets build")
+
+    def url(self, name: str) -> str:
+        """
+        Returns the URL of an asset, for templates.
+
+        Args:
+            name: Asset path relative to the source directory
+
+        Returns:
+            str: The fingerprinted URL if built, the plain one if not, or the pinned CDN URL of a
+                 vendored script that hasn't been downloaded
+        """
+        if name in self.manifest:
+            return STATIC_URL + urllib.parse.quote(self.manifest[name])
+        if name in VENDOR_ASSETS and not Path(self.source_dir, name).exists():
+            return VENDOR_ASSETS[name]
+        return STATIC_URL + urllib.parse.quote(name)
+
+    def files(self) -> PrecompressedStaticFiles:
+        """Returns the ASGI app serving the assets, to mount at STATIC_URL."""
+        return PrecompressedStaticFiles(self.directory, self.manifest)
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the UI's static assets")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = subparsers.add_parser("build", help="Minify, fingerprint and precompress the assets")
+    build_parser.add_argument("--source", default=STATIC_SOURCE_DIR, help="Directory of assets as committed")
+    build_parser.add_argument("--output", default=STATIC_BUILD_DIR, help="Directory to write the build to")
+
+    vendor_parser = subparsers.add_parser("vendor", help="Download the pinned third-party scripts into the source directory")
+    vendor_parser.add_argument("--source", default=STATIC_SOURCE_DIR, help="Directory of assets as committed")
+    vendor_parser.add_argument("--force", action="store_true", help="Download scripts that are already present again")
+
+    args = parser.parse_args()
+    if args.command == "build":
+        build(args.source, args.output)
+    else:
+        try:
+            vendor(args.source, args.force)
+        except OSError as e:
+            raise SystemExit(f"Could not download the pinned scripts ({e}); the app keeps loading them from the CDN")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,295 @@
+import argparse
+import asyncio
+import csv
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+from loguru import logger
+from .keys import TokenBucket
+from .ocr import process_prescription_with_spell_check_async, use_gemini_executor
+
+# Bulk processing settings
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", "8"))
+BATCH_MAX_PER_MINUTE = int(os.getenv("BATCH_MAX_PER_MINUTE", "0"))
+BATCH_PROGRESS_INTERVAL = float(os.getenv("BATCH_PROGRESS_INTERVAL", "10"))
+
+# Files picked up from the input directory
+PRESCRIPTION_SUFFIXES = {".jpg", ".jpeg", ".png", ".webp", ".gif", ".heic", ".pdf"}
+
+CSV_FIELDS = [
+    "path", "sha256", "medication_name", "dosage", "quantity", "how", "how_much", "when",
+    "original_name", "generic_name", "error",
+]
+
+def find_prescriptions(directory: str):
+    """
+    Yields prescription files under a directory in a stable order, without listing them all first.
+
+    Args:
+        directory: Directory to search recursively
+
+    Yields:
+        Path: Each image or PDF file
+    """
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(files):
+            path = Path(root, name)
+            if path.suffix.lower() in PRESCRIPTION_SUFFIXES:
+                yield path
+
+def read_prescription(path: Path) -> tuple[bytes, str]:
+    """
+    Reads a prescription file and hashes its content.
+
+    Args:
+        path: File to read
+
+    Returns:
+        tuple: (bytes, str) with the file content and its SHA-256
+    """
+    data = path.read_bytes()
+    return data, hashlib.sha256(data).hexdigest()
+
+class Checkpoint:
+    """
+    Append-only log of the files a batch run has finished, by content hash.
+
+    Every finished file is written and flushed straight away, so a crashed
+    or interrupted run resumes where it stopped.
+
+    Attributes:
+        path: Path to the checkpoint JSONL file
+        done: Hashes of files processed successfully
+        failed: Hashes of files that failed, retried on the next run
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.done: set[str] = set()
+        self.failed: set[str] = set()
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # A line cut short by a crash
+                        continue
+                    if record["status"] == "done":
+                        self.done.add(record["sha256"])
+                        self.failed.discard(record["sha256"])
+                    else:
+                        self.failed.add(record["sha256"])
+        self._file = open(path, "a")
+
+    def record(self, sha256: str, path: Path, status: str):
+        """
+        Records a finished file.
+
+        Args:
+            sha256: Hash of the file's content
+            path: Where the file was found
+            status: "done" or "failed"
+        """
+        (self.done if status == "done" else self.failed).add(sha256)
+        self._file.write(json.dumps({"sha256": sha256, "path": str(path), "status": status, "time": time.time()}) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
+
+class ResultWriter:
+    """
+    Appends results to a JSONL file (one prescription per line) or a CSV file (one medication per row).
+
+    Attributes:
+        path: Output file
+        format: "jsonl" or "csv"
+    """
+    def __init__(self, path: str, output_format: str):
+        self.path = path
+        self.format = output_format
+        new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+        self._file = open(path, "a", newline="")
+        if output_format == "csv":
+            self._writer = csv.DictWriter(self._file, fieldnames=CSV_FIELDS)
+            if new_file:
+                self._writer.writeheader()
+
+    def write(self, path: Path, sha256: str, result: tuple | None, error: str | None):
+        """
+        Writes the outcome of one prescription and flushes it to disk.
+
+        Args:
+            path: Where the file was found
+            sha256: Hash of the file's content
+            result: (MedicationResponse, SpellCheckResponse), or None if processing failed
+            error: Error message if processing failed
+        """
+        if self.format == "jsonl":
+            record = {"path": str(path), "sha256": sha256, "medications": None, "spell_check": None, "error": error}
+            if result:
+                record["medications"] = result[0].model_dump()["medications"]
+                record["spell_check"] = result[1].model_dump()["drugs"]
+            self._file.write(json.dumps(record) + "\n")
+        elif result is None:
+            self._writer.writerow({"path": str(path), "sha256": sha256, "error": error})
+        else:
+            medications, spell_check = result
+            # Medications carry the corrected name, or the original one if it was spelled correctly
+            by_name = {drug.input_name: drug for drug in spell_check.drugs}
+            by_name.update({drug.corrected_name: drug for drug in spell_check.drugs})
+            for medication in medications.medications:
+                drug = by_name.get(medication.medication_name)
+                self._writer.writerow({
+                    "path": str(path),
+                    "sha256": sha256,
+                    "medication_name": medication.medication_name,
+                    "dosage": medication.dosage,
+                    "quantity": medication.quantity,
+                    "how": medication.instructions.how,
+                    "how_much": medication.instructions.how_much,
+                    "when": medication.instructions.when,
+                    "original_name": drug.input_name if drug else "",
+                    "generic_name": " + ".join(drug.generic_name) if drug else "",
+                })
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+class Progress:
+    """
+    Counts processed files and reports throughput.
+
+    Attributes:
+        done: Files processed successfully in this run
+        failed: Files that failed in this run
+        skipped: Files skipped because an earlier run or duplicate already covered them
+    """
+    def __init__(self):
+        self.done = 0
+        self.failed = 0
+        self.skipped = 0
+        self._start = time.monotonic()
+
+    def per_minute(self) -> float:
+        elapsed = time.monotonic() - self._start
+        return (self.done + self.failed) * 60 / elapsed if elapsed else 0.0
+
+    def report(self):
+        logger.info(
+            f"Processed {self.done} prescriptions ({self.failed} failed, {self.skipped} skipped), "
+            f"{self.per_minute():.1f} images/min"
+        )
+
+async def run_batch(directory: str, output_path: str, output_format: str = "jsonl", checkpoint_path: str = None,
+                    workers: int = BATCH_WORKERS, max_per_minute: int = BATCH_MAX_PER_MINUTE,
+                    retry_failed: bool = True, force: bool = False) -> Progress:
+    """
+    Processes every prescription under a directory, writing results as they finish.
+
+    Files are read lazily, so directories of any size stream through a
+    bounded queue to the workers. Files whose content was already processed,
+    by this run or one recorded in the checkpoint, are skipped.
+
+    Args:
+        directory: Directory to search recursively for images and PDFs
+        output_path: JSONL or CSV file results are appended to
+        output_format: "jsonl" or "csv"
+        checkpoint_path: Checkpoint file (defaults to the output path with .checkpoint appended)
+        workers: Prescriptions processed at once
+        max_per_minute: Prescriptions started per minute across all workers (0 for no limit)
+        retry_failed: Process files that failed in an earlier run again
+        force: Skip the result cache and process every file with Gemini
+
+    Returns:
+        Progress: Counts for this run
+    """
+    checkpoint = Checkpoint(checkpoint_path or output_path + ".checkpoint")
+    writer = ResultWriter(output_path, output_format)
+    progress = Progress()
+    rate_limit = TokenBucket(max_per_minute)
+    rate_lock = asyncio.Lock()
+    queue = asyncio.Queue(maxsize=workers * 2)
+    seen: set[str] = set()
+
+    async def wait_for_rate_limit():
+        async with rate_lock:
+            wait = rate_limit.wait_time(1, time.monotonic())
+            if wait:
+                await asyncio.sleep(wait)
+            rate_limit.take(1, time.monotonic())
+
+    async def produce():
+        for path in find_prescriptions(directory):
+            try:
+                data, sha256 = await asyncio.to_thread(read_prescription, path)
+            except OSError as e:
+                logger.error(f"Could not read {path}: {e}")
+                progress.failed += 1
+                continue
+            if sha256 in seen or sha256 in checkpoint.done or (sha256 in checkpoint.failed and not retry_failed):
+                progress.skipped += 1
+                continue
+            seen.add(sha256)
+            await queue.put((path, data, sha256))
+        for _ in range(workers):
+            await queue.put(None)
+
+    async def work():
+        while (item := await queue.get()) is not None:
+            path, data, sha256 = item
+            await wait_for_rate_limit()
+            try:
+                result = await process_prescription_with_spell_check_async(data, force=force)
+            except Exception as e:
+                logger.error(f"Could not process {path}: {e}")
+                writer.write(path, sha256, None, str(e))
+                checkpoint.record(sha256, path, "failed")
+                progress.failed += 1
+                continue
+            writer.write(path, sha256, result, None)
+            checkpoint.record(sha256, path, "done")
+            progress.done += 1
+
+    async def report():
+        while True:
+            await asyncio.sleep(BATCH_PROGRESS_INTERVAL)
+            progress.report()
+
+    logger.info(f"Processing prescriptions under {directory} with {workers} workers, writing to {output_path}")
+    executor = use_gemini_executor()
+    reporter = asyncio.create_task(report())
+    try:
+        await asyncio.gather(produce(), *(work() for _ in range(workers)))
+    finally:
+        reporter.cancel()
+        executor.shutdown(wait=False, cancel_futures=True)
+        writer.close()
+        checkpoint.close()
+        progress.report()
+    return progress
+
+def main():
+    parser = argparse.ArgumentParser(description="Process a directory of prescription images and PDFs")
+    parser.add_argument("directory", help="Directory to search recursively for prescriptions")
+    parser.add_argument("-o", "--output", default="results.jsonl", help="JSONL or CSV file to append results to")
+    parser.add_argument("--format", choices=["jsonl", "csv"], help="Output format (defaults to the output file's extension)")
+    parser.add_argument("--checkpoint", help="Checkpoint file (defaults to the output file with .checkpoint appended)")
+    parser.add_argument("--workers", type=int, default=BATCH_WORKERS, help="Prescriptions processed at once")
+    parser.add_argument("--max-per-minute", type=int, default=BATCH_MAX_PER_MINUTE,
+                        help="Prescriptions started per minute across all workers (0 for no limit)")
+    parser.add_argument("--skip-failed", action="store_true", help="Don't retry files that failed in an earlier run")
+    parser.add_argument("--force", action="store_true", help="Skip the result cache")
+
+    args = parser.parse_args()
+    output_format = args.format or ("csv" if args.output.lower().endswith(".csv") else "jsonl")
+    asyncio.run(run_batch(args.directory, args.output, output_format, args.checkpoint, args.workers,
+                          args.max_per_minute, not args.skip_failed, args.force))
+
+if __name__ == "__main__":
+    main()
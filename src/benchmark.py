@@ -0,0 +1,1039 @@
+import argparse
+import asyncio
+import gc
+import hashlib
+import io
+import itertools
+import json
+import os
+import platform
+import random
+import resource
+import socket
+import statistics
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from pathlib import Path
+from loguru import logger
+
+# Environment the pipeline is benchmarked with unless already set
+BENCHMARK_ENV = {
+    "API_KEY": "benchmark",
+    "RESULT_CACHE_ENABLED": "false",
+    "SPELL_CHECK_CACHE_ENABLED": "false",
+    "BRAND_INDEX_ENABLED": "false",
+}
+
+# Settings recorded with every result, so runs with different configurations aren't compared by accident
+RECORDED_SETTINGS = [
+    "OCR_MODE", "SPELL_CHECK_MODE", "STRUCTURING_MODEL", "SPELL_CHECK_CONCURRENCY", "GEMINI_MAX_WORKERS",
+    "JOB_CONCURRENCY", "IMAGE_PREPROCESS", "IMAGE_MAX_EDGE", "IMAGE_GRAYSCALE", "IMAGE_JPEG_QUALITY",
+    "SESSION_BACKEND", "RESULT_CACHE_ENABLED", "SPELL_CHECK_CACHE_ENABLED", "BRAND_INDEX_ENABLED",
+    "DRUG_LEXICON_PATH", "GEMINI_HTTP2", "GEMINI_MAX_CONNECTIONS",
+]
+
+def synthetic_prescription(index: int, width: int = 1600, height: int = 1200) -> bytes:
+    """
+    Draws a photo-sized stand-in for a prescription, different for every index.
+
+    Args:
+        index: Seed, so each image hashes differently
+        width: Image width in pixels
+        height: Image height in pixels
+
+    Returns:
+        bytes: JPEG image
+    """
+    from PIL import Image, ImageDraw
+
+    rng = random.Random(index)
+    image = Image.new("RGB", (width, height), (rng.randint(225, 255),) * 3)
+    draw = ImageDraw.Draw(image)
+    draw.text((40, 40), f"Rx #{index}", fill="black")
+    for line in range(60, height - 40, 48):
+        x = 40
+        while x < width - 200:
+            length = rng.randint(30, 180)
+            draw.line((x, line + rng.randint(-4, 4), x + length, line + rng.randint(-4, 4)), fill=(20, 20, 60), width=3)
+            x += length + rng.randint(10, 40)
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+def load_images(directory: str) -> list[bytes]:
+    """
+    Reads the prescriptions to benchmark with.
+
+    Args:
+        directory: Directory of images and PDFs, searched recursively
+
+    Returns:
+        list[bytes]: File contents in a stable order
+    """
+    from .batch import find_prescriptions
+
+    return [path.read_bytes() for path in find_prescriptions(directory)]
+
+def latency_summary(latencies: list[float]) -> dict:
+    """
+    Summarizes request latencies.
+
+    Args:
+        latencies: Seconds per successful request
+
+    Returns:
+        dict: Mean, p50, p95, p99 and max in seconds, or None values if there were none
+    """
+    if not latencies:
+        return {"mean": None, "p50": None, "p95": None, "p99": None, "max": None}
+    quantiles = statistics.quantiles(latencies, n=100, method="inclusive") if len(latencies) > 1 else latencies * 99
+    return {
+        "mean": statistics.fmean(latencies),
+        "p50": statistics.median(latencies),
+        "p95": quantiles[94],
+        "p99": quantiles[98],
+        "max": max(latencies),
+    }
+
+def current_rss() -> int | None:
+    """Returns the process's resident memory in bytes, where /proc can tell."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * resource.getpagesize()
+    except (OSError, IndexError, ValueError):
+        return None
+
+def peak_rss() -> int:
+    """Returns the process's peak resident memory in bytes."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+def git_commit() -> dict:
+    """
+    Identifies the code being benchmarked.
+
+    Returns:
+        dict: Commit hash and whether the working tree had changes, or None values outside a git checkout
+    """
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+        status = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True,
+                                text=True, check=True).stdout
+        return {"commit": commit, "dirty": bool(status.strip())}
+    except (OSError, subprocess.CalledProcessError):
+        return {"commit": None, "dirty": None}
+
+class StubServerThread:
+    """
+    Runs the Gemini stand-in on a free local port in a background thread.
+
+    The stand-in shares the benchmark's process and CPU; for CPU-bound
+    measurements run it separately with python -m src.stub_server and pass
+    --gemini-url instead.
+
+    Attributes:
+        url: Base URL to point GEMINI_BASE_URL at
+        certfile: Certificate the stand-in serves HTTPS with, or None for plain HTTP
+    """
+    def __init__(self, app, certfile: str = None, keyfile: str = None):
+        import uvicorn
+
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+        self.certfile = certfile
+        self.url = f"{'https' if certfile else 'http'}://127.0.0.1:{port}/"
+        ssl_options = {"ssl_certfile": certfile, "ssl_keyfile": keyfile} if certfile else {}
+        self._server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", **ssl_options))
+        self._thread = threading.Thread(target=self._server.run, name="gemini-stub", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        while not self._server.started:
+            if not self._thread.is_alive():
+                raise RuntimeError("Gemini stand-in failed to start")
+            time.sleep(0.01)
+        logger.info(f"Gemini stand-in listening on {self.url}")
+
+    def stop(self):
+        self._server.should_exit = True
+        self._thread.join(timeout=5)
+
+def run_metadata() -> dict:
+    """
+    Describes the run, so results from different code or settings aren't compared by accident.
+
+    Returns:
+        dict: Commit, time, Python version, platform and the recorded settings that are set
+    """
+    return {
+        **git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "settings": {name: os.environ.get(name) for name in RECORDED_SETTINGS if name in os.environ},
+    }
+
+async def run_scenario(name: str, call, images: list[bytes], concurrency: int, requests: int,
+                       trace_memory: bool) -> dict:
+    """
+    Runs requests, at most concurrency at once, and measures latency, throughput and memory.
+
+    Args:
+        name: Scenario name, e.g. "library" or "app"
+        call: Async function processing one image
+        images: Images to cycle through
+        concurrency: Requests in flight at once
+        requests: Requests to make
+        trace_memory: Also measure Python allocations with tracemalloc, which slows every request down
+
+    Returns:
+        dict: Scenario results
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, errors = [], []
+
+    async def one(index: int):
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await call(images[index % len(images)])
+            except Exception as e:
+                errors.append(repr(e))
+                return
+            latencies.append(time.perf_counter() - start)
+
+    rss_before = current_rss()
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    await asyncio.gather(*(one(index) for index in range(requests)))
+    elapsed = time.perf_counter() - start
+    traced_peak = None
+    if trace_memory:
+        traced_peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    result = {
+        "name": name,
+        "concurrency": concurrency,
+        "requests": requests,
+        "errors": len(errors),
+        "elapsed": elapsed,
+        "throughput_per_min": len(latencies) * 60 / elapsed if elapsed else None,
+        "latency": latency_summary(latencies),
+        "memory": {
+            "rss_before": rss_before,
+            "rss_after": current_rss(),
+            "peak_rss": peak_rss(),
+            "traced_peak": traced_peak,
+        },
+        "error_samples": sorted(set(errors))[:5],
+    }
+    logger.info(
+        f"{name} x{concurrency}: {len(latencies)}/{requests} ok, p50={result['latency']['p50'] or 0:.3f}s "
+        f"p95={result['latency']['p95'] or 0:.3f}s, {result['throughput_per_min'] or 0:.1f} images/min"
+    )
+    return result
+
+def library_call():
+    """Returns a call that processes an image with the library pipeline."""
+    from .ocr import process_prescription_with_spell_check_async
+
+    async def call(image: bytes):
+        await process_prescription_with_spell_check_async(image, force=True)
+    return call
+
+def app_call(client, poll_interval: float = 0.05):
+    """
+    Returns a call that processes an image through the web app, the way the browser does.
+
+    Uploads the image, polls the job until it finishes and fetches the
+    medications, so the measured latency is what a user waits for.
+
+    Args:
+        client: httpx.AsyncClient for the app
+        poll_interval: Seconds between job status polls
+
+    Returns:
+        Async function processing one image
+    """
+    async def call(image: bytes):
+        response = await client.post("/upload", files={"file": ("prescription.jpg", image, "image/jpeg")})
+        response.raise_for_status()
+        upload = response.json()
+        while True:
+            response = await client.get(f"/api/jobs/{upload['job_id']}")
+            response.raise_for_status()
+            status = response.json()
+            if status["status"] == "failed":
+                raise RuntimeError(f"Job failed: {status.get('error')}")
+            if status["status"] == "done":
+                break
+            await asyncio.sleep(poll_interval)
+        response = await client.get(f"/api/result/{upload['session_id']}")
+        response.raise_for_status()
+    return call
+
+async def benchmark(images: list[bytes], targets: list[str], concurrencies: list[int], requests: int,
+                    warmup: int, trace_memory: bool, app_url: str = None) -> list[dict]:
+    """
+    Benchmarks the library functions and the web app at each concurrency.
+
+    Args:
+        images: Images to cycle through
+        targets: "library" and/or "app"
+        concurrencies: Concurrency levels to measure
+        requests: Requests per concurrency level
+        warmup: Unmeasured requests made first, to open connections and load models
+        trace_memory: Also measure Python allocations with tracemalloc
+        app_url: Benchmark an already running app at this URL instead of one in this process
+
+    Returns:
+        list[dict]: One result per target and concurrency level
+    """
+    import httpx
+
+    results = []
+    for target in targets:
+        if target == "library":
+            from .ocr import use_gemini_executor
+
+            # Sized like the app and batch CLI, so the library isn't measured against a smaller thread pool
+            executor = use_gemini_executor()
+            try:
+                call = library_call()
+                for image in images[:warmup]:
+                    await call(image)
+                for concurrency in concurrencies:
+                    results.append(await run_scenario("library", call, images, concurrency, requests, trace_memory))
+            finally:
+                executor.shutdown(wait=False, cancel_futures=True)
+            continue
+
+        if app_url:
+            async with httpx.AsyncClient(base_url=app_url, timeout=300) as client:
+                call = app_call(client)
+                for image in images[:warmup]:
+                    await call(image)
+                for concurrency in concurrencies:
+                    result = await run_scenario("app", call, images, concurrency, requests, False)
+                    # Memory was measured in this process, not the app's
+                    result["memory"] = None
+                    results.append(result)
+            continue
+
+        from . import app_alt
+
+        transport = httpx.ASGITransport(app=app_alt.app)
+        async with app_alt.lifespan(app_alt.app):
+            async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=300) as client:
+                call = app_call(client)
+                for image in images[:warmup]:
+                    await call(image)
+                for concurrency in concurrencies:
+                    results.append(await run_scenario("app", call, images, concurrency, requests, trace_memory))
+    return results
+
+def run(args) -> dict:
+    """
+    Runs the benchmark described by the command line arguments.
+
+    Args:
+        args: Parsed arguments of the run command
+
+    Returns:
+        dict: Results with the commit, settings and stand-in statistics
+    """
+    for name, value in BENCHMARK_ENV.items():
+        os.environ.setdefault(name, value)
+
+    stub = None
+    if args.gemini_url:
+        os.environ["GEMINI_BASE_URL"] = args.gemini_url
+    else:
+        from .stub_server import Cassette, FaultModel, create_app, parse_latency
+
+        stub_app = create_app(
+            Cassette(args.cassette),
+            latency=parse_latency(args.latency),
+            faults=FaultModel(args.error_rate, [int(code) for code in args.error_codes.split(",")]),
+            medications=args.medications,
+        )
+        stub = StubServerThread(stub_app)
+        stub.start()
+        os.environ["GEMINI_BASE_URL"] = stub.url
+
+    if args.images:
+        images = load_images(args.images)
+        if not images:
+            raise SystemExit(f"No images found under {args.images}")
+    else:
+        images = [synthetic_prescription(index) for index in range(args.synthetic_images)]
+
+    # The pipeline reads its settings on import, so only import it once the environment is set
+    try:
+        results = asyncio.run(benchmark(images, args.targets, args.concurrency, args.requests, args.warmup,
+                                        args.trace_memory, args.app_url))
+        stub_stats = None
+        if stub:
+            import httpx
+
+            stub_stats = httpx.get(stub.url + "stub/stats").json()
+    finally:
+        if stub:
+            stub.stop()
+
+    return {
+        **run_metadata(),
+        "stub": {
+            "url": os.environ["GEMINI_BASE_URL"],
+            "latency": args.latency or ["recorded"],
+            "error_rate": args.error_rate,
+            "cassette": args.cassette,
+            "stats": stub_stats,
+        },
+        "images": len(images),
+        "results": results,
+    }
+
+def session_benchmark(backends: list[str], sessions: int, image_bytes: int, reads: int) -> list[dict]:
+    """
+    Stores sessions the way uploads do and measures what each session backend holds.
+
+    Every session carries the dummy prescription's results and an
+    incompressible image, so the byte budget (SESSION_MAX_BYTES) is reached
+    like it would be by real uploads. The sessions are deleted afterwards.
+
+    Args:
+        backends: Session backends to measure, by SESSION_BACKEND name
+        sessions: Sessions to store in each
+        image_bytes: Size of each session's image
+        reads: Sessions read back at random afterwards
+
+    Returns:
+        list[dict]: Per backend, put and get latencies, the backend's own counters, growth of this
+                    process's resident memory and, for SQLite, the database's size on disk
+    """
+    from .dummydata import generate_dummy_data
+    from .results import encode_result
+    from .sessions import create_session_backend
+
+    final_data, spell_check_data = generate_dummy_data()
+    fields = {
+        "final_data": final_data,
+        "spell_check_data": spell_check_data,
+        "result": encode_result(final_data, spell_check_data),
+        "edited_data": None,
+        "whatsapp_message": "",
+        "page_count": 1,
+    }
+    rng = random.Random(0)
+    results = []
+    for name in backends:
+        try:
+            backend = create_session_backend(name)
+            backend.stats()
+        except Exception as e:
+            logger.warning(f"Skipping the {name} session backend: {e!r}")
+            results.append({"backend": name, "error": repr(e)})
+            continue
+
+        gc.collect()
+        rss_before = current_rss()
+        put_times, get_times = [], []
+        start = time.perf_counter()
+        for index in range(sessions):
+            image = rng.randbytes(image_bytes)
+            started = time.perf_counter()
+            backend.put(f"benchmark-{index}", {**fields, "page_hashes": [hashlib.sha256(image).hexdigest()]}, image)
+            put_times.append(time.perf_counter() - started)
+        for index in rng.sample(range(sessions), min(reads, sessions)):
+            started = time.perf_counter()
+            backend.get(f"benchmark-{index}")
+            get_times.append(time.perf_counter() - started)
+        elapsed = time.perf_counter() - start
+        rss_after = current_rss()
+        stats = backend.stats()
+        path = getattr(backend, "path", None)
+        disk_bytes = sum(os.path.getsize(path + suffix) for suffix in ("", "-wal") if os.path.exists(path + suffix)) if path else None
+
+        result = {
+            "backend": name,
+            "sessions": sessions,
+            "image_bytes": image_bytes,
+            "elapsed": elapsed,
+            "put": latency_summary(put_times),
+            "get": latency_summary(get_times),
+            "stats": stats,
+            "rss_growth": rss_after - rss_before if rss_after is not None and rss_before is not None else None,
+            "disk_bytes": disk_bytes,
+        }
+        logger.info(
+            f"{name}: {stats['entries']}/{sessions} sessions kept in {stats['bytes'] or 0:,} bytes, "
+            f"{stats.get('evictions', 0)} evicted, put p95={result['put']['p95'] * 1000:.2f}ms, "
+            f"get p95={(result['get']['p95'] or 0) * 1000:.2f}ms, RSS {(result['rss_growth'] or 0):+,} bytes"
+        )
+        results.append(result)
+        for index in range(sessions):
+            backend.delete(f"benchmark-{index}")
+        del backend
+    return results
+
+def run_sessions(args) -> dict:
+    """
+    Runs the session backend benchmark described by the command line arguments.
+
+    Args:
+        args: Parsed arguments of the sessions command
+
+    Returns:
+        dict: Results with the commit and settings
+    """
+    directory = tempfile.mkdtemp(prefix="session-benchmark-")
+    # The session module reads its settings on import, so only import it once the environment is set
+    os.environ.setdefault("SESSION_DB_PATH", os.path.join(directory, "sessions.sqlite3"))
+    if args.max_bytes is not None:
+        os.environ["SESSION_MAX_BYTES"] = str(args.max_bytes)
+    try:
+        results = session_benchmark(args.backends, args.sessions, args.image_bytes, args.reads)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return {**run_metadata(), "max_bytes": os.environ.get("SESSION_MAX_BYTES"), "results": results}
+
+async def time_calls(name: str, call, requests: int, concurrency: int) -> dict:
+    """
+    Makes requests calls, at most concurrency at once, and summarizes their latency.
+
+    Args:
+        name: Scenario name
+        call: Async function making one call
+        requests: Calls to make
+        concurrency: Calls in flight at once
+
+    Returns:
+        dict: Latency summary, errors and calls per second
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, errors = [], []
+
+    async def one():
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                await call()
+            except Exception as e:
+                errors.append(repr(e))
+                return
+            latencies.append(time.perf_counter() - started)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    elapsed = time.perf_counter() - start
+    result = {
+        "name": name,
+        "concurrency": concurrency,
+        "requests": requests,
+        "errors": len(errors),
+        "per_second": len(latencies) / elapsed if elapsed else None,
+        "latency": latency_summary(latencies),
+        "error_samples": sorted(set(errors))[:5],
+    }
+    logger.info(
+        f"{name} x{concurrency}: {len(latencies)}/{requests} ok, p50={(result['latency']['p50'] or 0) * 1000:.1f}ms "
+        f"p95={(result['latency']['p95'] or 0) * 1000:.1f}ms, {result['per_second'] or 0:.1f}/s"
+    )
+    return result
+
+async def connection_benchmark(url: str, certfile: str, requests: int, concurrencies: list[int]) -> list[dict]:
+    """
+    Compares cold and pooled connections to a stand-in served over TLS.
+
+    Scenarios:
+        tls_handshake: Opening a TCP connection and completing the TLS handshake, nothing else
+        httpx_cold: A spell check request on a new connection every time
+        httpx_pooled: The same request on one keep-alive connection pool
+        gemini_fresh_client: A new genai.Client per call, as before clients were pooled
+        gemini_pooled_client: The client GeminiClientPool keeps per key
+
+    The gemini scenarios measure what the installed google-genai release does
+    with connections; releases without HTTP client options open one per call
+    whichever client is used.
+
+    Args:
+        url: HTTPS base URL of the stand-in
+        certfile: Certificate to trust for it
+        requests: Calls per scenario and concurrency level
+        concurrencies: Concurrency levels to measure
+
+    Returns:
+        list[dict]: One result per scenario and concurrency level
+    """
+    import ssl
+    import urllib.parse
+    import httpx
+    from google import genai
+    from .clients import GeminiClientPool
+    from .prompts import spell_system_prompt
+
+    context = ssl.create_default_context(cafile=certfile)
+    address = urllib.parse.urlsplit(url)
+    model = "gemini-2.0-flash"
+    endpoint = f"{url}v1beta/models/{model}:generateContent"
+    body = {"contents": [{"role": "user", "parts": [{"text": "Paracetomol"}]}],
+            "systemInstruction": {"parts": [{"text": spell_system_prompt}]}}
+    headers = {"x-goog-api-key": os.environ.get("API_KEY", "benchmark")}
+    pool = GeminiClientPool(base_url=url)
+
+    async def tls_handshake():
+        _, writer = await asyncio.open_connection(address.hostname, address.port, ssl=context)
+        writer.close()
+        await writer.wait_closed()
+
+    async def httpx_cold():
+        async with httpx.AsyncClient(verify=context) as client:
+            (await client.post(endpoint, json=body, headers=headers)).raise_for_status()
+
+    async def gemini_call(client: genai.Client):
+        await client.aio.models.generate_content(model=model, contents="Paracetomol",
+                                                 config={"system_instruction": spell_system_prompt})
+
+    results = []
+    async with httpx.AsyncClient(verify=context, limits=httpx.Limits(max_connections=max(concurrencies))) as pooled:
+        async def httpx_pooled():
+            (await pooled.post(endpoint, json=body, headers=headers)).raise_for_status()
+
+        scenarios = {
+            "tls_handshake": tls_handshake,
+            "httpx_cold": httpx_cold,
+            "httpx_pooled": httpx_pooled,
+            "gemini_fresh_client": lambda: gemini_call(genai.Client(api_key=headers["x-goog-api-key"],
+                                                                    http_options={"base_url": url})),
+            "gemini_pooled_client": lambda: gemini_call(pool.get(headers["x-goog-api-key"])),
+        }
+        for name, call in scenarios.items():
+            # Unmeasured, so pools and clients are open before timing starts
+            await call()
+            for concurrency in concurrencies:
+                results.append(await time_calls(name, call, requests, concurrency))
+    await pool.aclose()
+    return results
+
+def run_connections(args) -> dict:
+    """
+    Runs the connection setup benchmark described by the command line arguments.
+
+    Args:
+        args: Parsed arguments of the connections command
+
+    Returns:
+        dict: Results with the commit and settings
+    """
+    from .stub_server import Cassette, create_app, parse_latency, self_signed_certificate
+
+    directory = tempfile.mkdtemp(prefix="connection-benchmark-")
+    certfile, keyfile = self_signed_certificate(directory)
+    # Lets the SDK's HTTP clients (httpx and requests) trust the stand-in
+    os.environ["SSL_CERT_FILE"] = os.environ["REQUESTS_CA_BUNDLE"] = certfile
+    stub = StubServerThread(create_app(Cassette(), latency=parse_latency(args.latency)), certfile, keyfile)
+    stub.start()
+    try:
+        results = asyncio.run(connection_benchmark(stub.url, certfile, args.requests, args.concurrency))
+    finally:
+        stub.stop()
+        shutil.rmtree(directory, ignore_errors=True)
+    return {**run_metadata(), "latency": args.latency or ["recorded"], "results": results}
+
+def time_lookups(function, arguments: list) -> dict:
+    """Calls a function once per argument and summarizes how long each call took."""
+    latencies = []
+    for argument in arguments:
+        started = time.perf_counter()
+        function(argument)
+        latencies.append(time.perf_counter() - started)
+    return latency_summary(latencies)
+
+async def brand_benchmark(url: str, generics: int, lookups: int, requests: int) -> dict:
+    """
+    Compares brand names from the brand index with the grounded brand name call.
+
+    The index is filled with generics entries, then looked up with known and
+    unknown generics. The brand name call goes to the stand-in. Spell checks
+    of a generic with brands and of one without are then counted in Gemini
+    calls, the first time and once the index knows them.
+
+    Args:
+        url: Base URL of the stand-in
+        generics: Generics to put in the index
+        lookups: Lookups of each kind to time
+        requests: Brand name calls to time
+
+    Returns:
+        dict: Lookup latencies, brand name call latency and calls per spell check
+    """
+    import httpx
+    from .brands import brand_index
+    from .ocr import SPELL_CHECK_MODEL, gemini_client, spell_check_medicine_name_async
+    from .prompts import spell_list_brand_name_prompt
+    from .schema import SpellCheck
+
+    brand_index.put_many([([f"Generic {i}"], [f"Brand {i}A", f"Brand {i}B"]) for i in range(generics)], "benchmark")
+    known = [[f"Generic {random.randrange(generics)}"] for _ in range(lookups)]
+    unknown = [[f"Unknown {i}"] for i in range(lookups)]
+    spell_checks = [
+        SpellCheck(input_name=name[0], corrected_name=name[0], generic_name=name, brand_names=[],
+                   is_correct=True, is_generic=True, notes="")
+        for name in known
+    ]
+    lookup_results = {
+        "get_known": time_lookups(brand_index.get, known),
+        "get_unknown": time_lookups(brand_index.get, unknown),
+        "fill": time_lookups(brand_index.fill, spell_checks),
+    }
+    for name, summary in lookup_results.items():
+        logger.info(f"brand index {name}: p50={(summary['p50'] or 0) * 1e6:.0f}us p95={(summary['p95'] or 0) * 1e6:.0f}us")
+
+    async def brand_call():
+        await gemini_client.aio.models.generate_content(
+            model=SPELL_CHECK_MODEL,
+            contents=[spell_list_brand_name_prompt, "Input name: Paracetomol\nCorrected name: Paracetamol"],
+        )
+    brand_lookup = await time_calls("brand_lookup", brand_call, requests, 1)
+
+    def stub_calls() -> int:
+        return sum(httpx.get(url + "stub/stats").json()["models"].values())
+
+    spell_checks_by_state = []
+    # Paracetomol has brands on the stand-in, Vitamin D3 has none
+    for name in ["Paracetomol", "Vitamin D3"]:
+        for state in ["unknown", "indexed"]:
+            before = stub_calls()
+            started = time.perf_counter()
+            response = await spell_check_medicine_name_async(name, gemini_client)
+            spell_checks_by_state.append({
+                "name": name,
+                "generic": state,
+                "gemini_calls": stub_calls() - before,
+                "seconds": time.perf_counter() - started,
+                "brand_names": [brand for drug in response.drugs for brand in drug.brand_names],
+            })
+            logger.info(f"spell check of {name}, {state} generic: {spell_checks_by_state[-1]['gemini_calls']} Gemini calls")
+    return {"lookups": lookup_results, "brand_lookup": brand_lookup, "spell_checks": spell_checks_by_state}
+
+def run_brands(args) -> dict:
+    """
+    Runs the brand index benchmark described by the command line arguments.
+
+    Args:
+        args: Parsed arguments of the brands command
+
+    Returns:
+        dict: Results with the commit and settings
+    """
+    from .stub_server import Cassette, create_app, parse_latency
+
+    for name, value in BENCHMARK_ENV.items():
+        os.environ.setdefault(name, value)
+    directory = tempfile.mkdtemp(prefix="brand-benchmark-")
+    # The pipeline reads its settings on import, so only import it once the environment is set
+    os.environ["BRAND_INDEX_ENABLED"] = "true"
+    os.environ["BRAND_INDEX_PATH"] = os.path.join(directory, "brands.sqlite3")
+    stub = StubServerThread(create_app(Cassette(), latency=parse_latency(args.latency)))
+    stub.start()
+    os.environ["GEMINI_BASE_URL"] = stub.url
+    try:
+        results = asyncio.run(brand_benchmark(stub.url, args.generics, args.lookups, args.requests))
+    finally:
+        stub.stop()
+        shutil.rmtree(directory, ignore_errors=True)
+    return {**run_metadata(), "latency": args.latency or ["recorded"], "generics": args.generics, **results}
+
+async def preprocess_sweep(images: list[bytes], max_edges: list[int], qualities: list[int], grayscale: bool,
+                           requests: int) -> list[dict]:
+    """
+    Preprocesses the images with each longest edge and JPEG quality and sends them to the stand-in.
+
+    Each setting is measured by the bytes it leaves to upload, how long
+    preprocessing takes and the latency of the OCR model's first call with
+    the result, which with the stand-in's latency set to none is mostly the
+    cost of encoding and uploading the image. The unprocessed images are
+    measured first, as the baseline.
+
+    Args:
+        images: Prescription images
+        max_edges: Longest edges in pixels to try
+        qualities: JPEG qualities to try
+        grayscale: Whether images are converted to grayscale
+        requests: OCR calls to time per setting
+
+    Returns:
+        list[dict]: One result per setting, the baseline first
+    """
+    from google.genai import types
+    from google.genai.types import GenerateContentConfig
+    from .ocr import OCR_MODEL, gemini_client
+    from .preprocessing import preprocess_image, sniff_mime_type
+    from .prompts import ocr_system_prompt
+
+    settings = [None] + [(max_edge, quality) for max_edge in max_edges for quality in qualities]
+    results = []
+    for setting in settings:
+        started = time.perf_counter()
+        if setting is None:
+            payloads = [(image, sniff_mime_type(image)) for image in images]
+        else:
+            payloads = [preprocess_image(image, setting[0], grayscale, setting[1]) for image in images]
+        preprocess_seconds = (time.perf_counter() - started) / len(images)
+        parts = itertools.cycle([types.Part.from_bytes(data=data, mime_type=mime_type) for data, mime_type in payloads])
+
+        async def ocr_call():
+            await gemini_client.aio.models.generate_content(
+                model=OCR_MODEL,
+                contents=["this", next(parts)],
+                config=GenerateContentConfig(system_instruction=ocr_system_prompt, response_modalities=["TEXT"]),
+            )
+        name = "original" if setting is None else f"edge={setting[0]} quality={setting[1]}"
+        timed = await time_calls(name, ocr_call, requests, 1)
+        sizes = [len(data) for data, _ in payloads]
+        results.append({
+            "name": name,
+            "max_edge": setting and setting[0],
+            "quality": setting and setting[1],
+            "grayscale": grayscale if setting else None,
+            "bytes_mean": statistics.fmean(sizes),
+            "bytes_max": max(sizes),
+            "preprocess_seconds": preprocess_seconds,
+            "ocr_latency": timed["latency"],
+            "errors": timed["errors"],
+        })
+        logger.info(f"{name}: {statistics.fmean(sizes) / 1024:,.0f} KB per image, preprocessed in {preprocess_seconds * 1000:.0f}ms")
+    return results
+
+def run_preprocess(args) -> dict:
+    """
+    Runs the preprocessing sweep described by the command line arguments.
+
+    Args:
+        args: Parsed arguments of the preprocess command
+
+    Returns:
+        dict: Results with the commit and settings
+    """
+    from .stub_server import Cassette, create_app, parse_latency
+
+    for name, value in BENCHMARK_ENV.items():
+        os.environ.setdefault(name, value)
+    if args.images:
+        images = load_images(args.images)
+        if not images:
+            raise SystemExit(f"No images found under {args.images}")
+    else:
+        images = [synthetic_prescription(index) for index in range(args.synthetic_images)]
+    stub = StubServerThread(create_app(Cassette(), latency=parse_latency(args.latency)))
+    stub.start()
+    # The pipeline reads its settings on import, so only import it once the environment is set
+    os.environ["GEMINI_BASE_URL"] = stub.url
+    try:
+        results = asyncio.run(preprocess_sweep(images, args.max_edge, args.quality, args.grayscale == "true", args.requests))
+    finally:
+        stub.stop()
+    return {**run_metadata(), "latency": args.latency or ["recorded"], "images": len(images), "results": results}
+
+async def spell_check_benchmark(url: str, names: list[str], modes: list[str], requests: int,
+                                concurrency: int) -> list[dict]:
+    """
+    Spell checks the same names in each spell check mode against the stand-in.
+
+    Args:
+        url: Base URL of the stand-in
+        names: Medicine names checked together, like one prescription's
+        modes: Spell check modes to compare
+        requests: Times the names are checked per mode
+        concurrency: Checks in flight at once
+
+    Returns:
+        list[dict]: Latency and Gemini calls per check for each mode
+    """
+    import httpx
+    from .ocr import gemini_client, spell_check_medicine_names_async
+
+    def stub_calls() -> int:
+        return sum(httpx.get(url + "stub/stats").json()["models"].values())
+
+    results = []
+    for mode in modes:
+        async def call():
+            await spell_check_medicine_names_async(names, gemini_client, mode=mode)
+        before = stub_calls()
+        result = await time_calls(mode, call, requests, concurrency)
+        result["gemini_calls_per_check"] = (stub_calls() - before) / requests
+        logger.info(f"{mode}: {result['gemini_calls_per_check']:.1f} Gemini calls per check of {len(names)} names")
+        results.append(result)
+    return results
+
+def run_spell_check(args) -> dict:
+    """
+    Runs the spell check mode benchmark described by the command line arguments.
+
+    Args:
+        args: Parsed arguments of the spell-check command
+
+    Returns:
+        dict: Results with the commit and settings
+    """
+    from .stub_server import Cassette, create_app, parse_latency
+
+    for name, value in BENCHMARK_ENV.items():
+        os.environ.setdefault(name, value)
+    stub = StubServerThread(create_app(Cassette(), latency=parse_latency(args.latency)))
+    stub.start()
+    # The pipeline reads its settings on import, so only import it once the environment is set
+    os.environ["GEMINI_BASE_URL"] = stub.url
+    try:
+        results = asyncio.run(spell_check_benchmark(stub.url, args.names, args.modes, args.requests, args.concurrency))
+    finally:
+        stub.stop()
+    return {**run_metadata(), "latency": args.latency or ["recorded"], "names": args.names, "results": results}
+
+def compare(before: dict, after: dict) -> list[dict]:
+    """
+    Lines up two benchmark results scenario by scenario.
+
+    Args:
+        before: Results of the baseline run
+        after: Results of the run to compare
+
+    Returns:
+        list[dict]: Per scenario and concurrency, each metric before and after with the relative change
+    """
+    baseline = {(result["name"], result["concurrency"]): result for result in before["results"]}
+    metrics = {
+        "p50": lambda result: result["latency"]["p50"],
+        "p95": lambda result: result["latency"]["p95"],
+        "throughput_per_min": lambda result: result["throughput_per_min"],
+        "peak_rss": lambda result: (result["memory"] or {}).get("peak_rss"),
+    }
+    rows = []
+    for result in after["results"]:
+        old = baseline.get((result["name"], result["concurrency"]))
+        if old is None:
+            continue
+        row = {"name": result["name"], "concurrency": result["concurrency"]}
+        for metric, read in metrics.items():
+            old_value, new_value = read(old), read(result)
+            change = (new_value - old_value) / old_value if old_value and new_value is not None else None
+            row[metric] = {"before": old_value, "after": new_value, "change": change}
+        rows.append(row)
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark prescription processing against a Gemini stand-in")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="Measure latency, throughput and memory")
+    run_parser.add_argument("-o", "--output", default="benchmark.json", help="Where to write the results")
+    run_parser.add_argument("--targets", nargs="+", default=["library", "app"], choices=["library", "app"],
+                            help="Benchmark the library functions, the web app or both")
+    run_parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16], help="Concurrency levels")
+    run_parser.add_argument("--requests", type=int, default=16, help="Prescriptions per concurrency level")
+    run_parser.add_argument("--warmup", type=int, default=1, help="Unmeasured prescriptions processed first")
+    run_parser.add_argument("--images", help="Directory of prescriptions to use instead of synthetic images")
+    run_parser.add_argument("--synthetic-images", type=int, default=8, help="Synthetic images to cycle through")
+    run_parser.add_argument("--trace-memory", action="store_true", help="Measure Python allocations (slows requests)")
+    run_parser.add_argument("--app-url", help="Benchmark a running app at this URL instead of one in this process")
+    run_parser.add_argument("--gemini-url", help="Use a stand-in already running at this URL")
+    run_parser.add_argument("--cassette", help="Recordings for the built-in stand-in to replay")
+    run_parser.add_argument("--latency", action="append", default=[], help="Stand-in latency spec, see src.stub_server")
+    run_parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of Gemini calls that fail")
+    run_parser.add_argument("--error-codes", default="429,503", help="Comma separated status codes to inject")
+    run_parser.add_argument("--medications", type=int, default=3, help="Medicines on every synthetic prescription")
+    run_parser.add_argument("--log-level", default="WARNING",
+                            help="Level of the pipeline's own logging, which slows it down when verbose")
+
+    sessions_parser = subparsers.add_parser("sessions", help="Measure memory, eviction and latency of the session backends")
+    sessions_parser.add_argument("-o", "--output", default="sessions.json", help="Where to write the results")
+    sessions_parser.add_argument("--backends", nargs="+", default=["memory", "sqlite"], choices=["memory", "sqlite", "redis"],
+                                 help="Session backends to measure, in order; run one per process for exact RSS growth")
+    sessions_parser.add_argument("--sessions", type=int, default=10000, help="Sessions stored in each backend")
+    sessions_parser.add_argument("--image-bytes", type=int, default=100 * 1024, help="Image size of each session")
+    sessions_parser.add_argument("--reads", type=int, default=1000, help="Sessions read back at random")
+    sessions_parser.add_argument("--max-bytes", type=int, help="Session byte budget (defaults to SESSION_MAX_BYTES)")
+
+    connections_parser = subparsers.add_parser("connections", help="Compare cold and pooled HTTPS connections to the stand-in")
+    connections_parser.add_argument("-o", "--output", default="connections.json", help="Where to write the results")
+    connections_parser.add_argument("--requests", type=int, default=50, help="Calls per scenario and concurrency level")
+    connections_parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8], help="Concurrency levels")
+    connections_parser.add_argument("--latency", action="append", default=["none"],
+                                    help="Stand-in latency spec, see src.stub_server; none isolates connection setup")
+
+    brands_parser = subparsers.add_parser("brands", help="Compare brand index lookups with the grounded brand name call")
+    brands_parser.add_argument("-o", "--output", default="brands.json", help="Where to write the results")
+    brands_parser.add_argument("--generics", type=int, default=10000, help="Generics to put in the index")
+    brands_parser.add_argument("--lookups", type=int, default=10000, help="Index lookups of each kind to time")
+    brands_parser.add_argument("--requests", type=int, default=20, help="Brand name calls to time")
+    brands_parser.add_argument("--latency", action="append", default=[], help="Stand-in latency spec, see src.stub_server")
+
+    preprocess_parser = subparsers.add_parser("preprocess", help="Sweep the image preprocessing settings")
+    preprocess_parser.add_argument("-o", "--output", default="preprocess.json", help="Where to write the results")
+    preprocess_parser.add_argument("--images", help="Directory of prescription images (synthetic ones otherwise)")
+    preprocess_parser.add_argument("--synthetic-images", type=int, default=4, help="Synthetic images to generate")
+    preprocess_parser.add_argument("--max-edge", type=int, nargs="+", default=[1024, 1536, 2048, 3072],
+                                   help="Longest edges in pixels to try")
+    preprocess_parser.add_argument("--quality", type=int, nargs="+", default=[60, 75, 85, 95], help="JPEG qualities to try")
+    preprocess_parser.add_argument("--grayscale", choices=["true", "false"], default="true", help="Convert to grayscale")
+    preprocess_parser.add_argument("--requests", type=int, default=10, help="OCR calls to time per setting")
+    preprocess_parser.add_argument("--latency", action="append", default=["none"],
+                                   help="Stand-in latency spec, see src.stub_server; none isolates the upload")
+
+    spell_parser = subparsers.add_parser("spell-check", help="Compare the batched and per_drug spell check modes")
+    spell_parser.add_argument("-o", "--output", default="spell_check.json", help="Where to write the results")
+    spell_parser.add_argument("--names", nargs="+", default=["Paracetomol", "Amoxcillin", "Pantoprazol", "Cetrizine"],
+                              help="Medicine names checked together")
+    spell_parser.add_argument("--modes", nargs="+", default=["per_drug", "batched"], choices=["per_drug", "batched"],
+                              help="Spell check modes to compare")
+    spell_parser.add_argument("--requests", type=int, default=20, help="Checks per mode")
+    spell_parser.add_argument("--concurrency", type=int, default=1, help="Checks in flight at once")
+    spell_parser.add_argument("--latency", action="append", default=[], help="Stand-in latency spec, see src.stub_server")
+
+    compare_parser = subparsers.add_parser("compare", help="Compare two result files")
+    compare_parser.add_argument("before", help="Results of the baseline run")
+    compare_parser.add_argument("after", help="Results of the run to compare")
+    compare_parser.add_argument("--json", action="store_true", help="Print the comparison as JSON")
+
+    args = parser.parse_args()
+    commands = {
+        "run": run,
+        "sessions": run_sessions,
+        "connections": run_connections,
+        "brands": run_brands,
+        "preprocess": run_preprocess,
+        "spell-check": run_spell_check,
+    }
+    if args.command in commands:
+        logger.remove()
+        logger.add(sys.stderr, filter={"": getattr(args, "log_level", "WARNING"), __name__: "INFO"})
+        results = commands[args.command](args)
+        Path(args.output).write_text(json.dumps(results, indent=2))
+        logger.info(f"Wrote results to {args.output}")
+        return
+
+    rows = compare(json.loads(Path(args.before).read_text()), json.loads(Path(args.after).read_text()))
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return
+    for row in rows:
+        cells = []
+        for metric in ("p50", "p95", "throughput_per_min", "peak_rss"):
+            change = row[metric]["change"]
+            cells.append(f"{metric}={'n/a' if change is None else f'{change:+.1%}'}")
+        print(f"{row['name']:<8} x{row['concurrency']:<4} " + " ".join(cells))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,333 @@
+import argparse
+import asyncio
+import csv
+import json
+import os
+import sqlite3
+import threading
+import time
+from loguru import logger
+from .cache import CACHE_DIR, normalize_drug_name
+from .schema import SpellCheck
+
+# Local brand index settings
+BRAND_INDEX_ENABLED = os.getenv("BRAND_INDEX_ENABLED", "true").lower() == "true"
+BRAND_INDEX_PATH = os.getenv("BRAND_INDEX_PATH", os.path.join(CACHE_DIR, "brands.sqlite3"))
+# Seconds a generic Gemini found no brands for counts as known, since an empty answer may be a bad one
+BRAND_INDEX_EMPTY_TTL = float(os.getenv("BRAND_INDEX_EMPTY_TTL", str(7 * 24 * 3600)))
+
+def brand_key(generic_names: list[str]) -> str:
+    """
+    Builds the index key for a generic or a combination of generics.
+
+    Args:
+        generic_names: Generic components, e.g. ["Amoxicillin", "Clavulanic Acid"]; a single
+                       entry may also hold a "+" separated combination
+
+    Returns:
+        str: Normalized, sorted components joined by " + ", or "" if there are none
+    """
+    components = {
+        normalize_drug_name(part)
+        for name in generic_names
+        for part in name.split("+")
+    }
+    components.discard("")
+    components.discard("n a")
+    return " + ".join(sorted(components))
+
+class BrandIndex:
+    """
+    Generic-to-brand name index backed by SQLite, so lookups need no load step.
+
+    Entries come from CSV imports and from brand lists Gemini returned during
+    spell checks, and are kept until they are refreshed or replaced. A generic
+    Gemini found no brands for is kept with an empty list, so it isn't asked
+    about again on every spell check, but only for empty_ttl seconds, after
+    which it is unknown again and the next answer with brands replaces it.
+
+    Attributes:
+        path: Path to the SQLite database file
+        empty_ttl: Seconds an entry without brand names is trusted
+        version: Changes whenever imported or refreshed brand names may replace ones already served
+        hits: Lookups answered from the index since start-up
+        misses: Lookups for generics the index doesn't know since start-up
+    """
+    def __init__(self, path: str, empty_ttl: float = BRAND_INDEX_EMPTY_TTL):
+        self.path = path
+        self.empty_ttl = empty_ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS brands ("
+            "key TEXT PRIMARY KEY, generic_names TEXT NOT NULL, brand_names TEXT NOT NULL, "
+            "source TEXT NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        logger.info(f"Brand index opened at {path}")
+
+    @property
+    def version(self) -> int:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE name = 'version'").fetchone()
+        return row[0] if row else 0
+
+    def bump_version(self):
+        """Marks brand names already served as possibly outdated, e.g. so cached results built with them are not reused."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO meta (name, value) VALUES ('version', 1) "
+                "ON CONFLICT (name) DO UPDATE SET value = value + 1"
+            )
+
+    def get(self, generic_names: list[str]) -> list[str] | None:
+        """
+        Looks up the brand names for a generic or combination.
+
+        Args:
+            generic_names: Generic components of the drug
+
+        Returns:
+            list[str] | None: Brand names (empty for a generic known to have none), or None if the generic is unknown
+        """
+        key = brand_key(generic_names)
+        if not key:
+            return None
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT brand_names FROM brands WHERE key = ? AND (brand_names != '[]' OR updated_at >= ?)",
+                (key, time.time() - self.empty_ttl),
+            ).fetchone()
+            if row:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return json.loads(row[0]) if row else None
+
+    def put_many(self, entries: list[tuple[list[str], list[str]]], source: str):
+        """
+        Stores brand names for several generics, replacing what was there.
+
+        Args:
+            entries: (generic_names, brand_names) pairs; an empty brand_names records a generic without brands
+            source: Where the brand names came from, e.g. "csv" or "gemini"
+        """
+        now = time.time()
+        rows = []
+        for generic_names, brand_names in entries:
+            key = brand_key(generic_names)
+            if key:
+                rows.append((key, json.dumps(generic_names), json.dumps(sorted(set(brand_names))), source, now))
+        if not rows:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO brands (key, generic_names, brand_names, source, updated_at) VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+
+    def learn(self, spell_checks: list[SpellCheck]):
+        """
+        Stores the brand names Gemini returned for generics the index doesn't know yet.
+
+        Brand names also replace an entry that only recorded the generic as
+        having none.
+
+        Args:
+            spell_checks: Spell check results from Gemini
+        """
+        keys = {brand_key(spell_check.generic_name) for spell_check in spell_checks}
+        keys.discard("")
+        if not keys:
+            return
+        placeholders = ", ".join("?" for _ in keys)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT key, brand_names = '[]' FROM brands WHERE key IN ({placeholders}) "
+                "AND (brand_names != '[]' OR updated_at >= ?)",
+                [*keys, time.time() - self.empty_ttl],
+            ).fetchall()
+        known = {key: bool(empty) for key, empty in rows}
+        self.put_many([
+            (spell_check.generic_name, spell_check.brand_names)
+            for spell_check in spell_checks
+            if brand_key(spell_check.generic_name) not in known
+            or (known[brand_key(spell_check.generic_name)] and spell_check.brand_names)
+        ], "gemini")
+
+    def touch(self, generic_names: list[str]):
+        """
+        Marks a generic's entry as refreshed without changing its brand names.
+
+        Args:
+            generic_names: Generic components of the drug
+        """
+        with self._lock:
+            self._conn.execute("UPDATE brands SET updated_at = ? WHERE key = ?", (time.time(), brand_key(generic_names)))
+
+    def fill(self, spell_check: SpellCheck) -> SpellCheck | None:
+        """
+        Replaces a spell check's brand names with the indexed ones.
+
+        Args:
+            spell_check: Spell check result with generic_name set
+
+        Returns:
+            SpellCheck | None: The updated result, or None if its generic is unknown
+        """
+        brand_names = self.get(spell_check.generic_name)
+        if brand_names is None:
+            return None
+        return spell_check.model_copy(update={"brand_names": brand_names})
+
+    def fill_many(self, spell_checks: list[SpellCheck]) -> list[SpellCheck | None]:
+        """
+        Replaces the brand names of several spell checks with the indexed ones.
+
+        Args:
+            spell_checks: Spell check results with generic_name set
+
+        Returns:
+            list[SpellCheck | None]: Each updated result, or None where its generic is unknown
+        """
+        return [self.fill(spell_check) for spell_check in spell_checks]
+
+    def stale(self, older_than: float, source: str = "gemini") -> list[list[str]]:
+        """
+        Lists generics whose brand names haven't been refreshed recently.
+
+        Args:
+            older_than: Age in seconds after which an entry is stale
+            source: Only consider entries from this source
+
+        Returns:
+            list[list[str]]: Generic components of each stale entry, oldest first
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT generic_names FROM brands WHERE source = ? AND updated_at < ? ORDER BY updated_at",
+                (source, time.time() - older_than),
+            ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def stats(self) -> dict:
+        """
+        Returns hit/miss counters and the number of generics per source.
+
+        Returns:
+            dict: Hits, misses, hit rate and entry counts
+        """
+        with self._lock:
+            sources = dict(self._conn.execute("SELECT source, COUNT(*) FROM brands GROUP BY source").fetchall())
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": sum(sources.values()),
+            "sources": sources,
+        }
+
+def import_csv(index: BrandIndex, path: str) -> int:
+    """
+    Loads generic and brand name pairs from a CSV file into the index.
+
+    Uses the same generic_name and brand_name columns as the drug lexicon CSV.
+
+    Args:
+        index: Brand index to update
+        path: Path to the CSV file
+
+    Returns:
+        int: Number of generics imported
+    """
+    brands: dict[str, list[str]] = {}
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        for row in csv.DictReader(f):
+            generic = (row.get("generic_name") or "").strip()
+            brand = (row.get("brand_name") or "").strip()
+            if generic and brand:
+                brands.setdefault(generic, []).append(brand)
+    index.put_many([([generic], brand_names) for generic, brand_names in brands.items()], "csv")
+    index.bump_version()
+    logger.info(f"Imported brand names for {len(brands)} generics from {path}")
+    return len(brands)
+
+async def refresh(index: BrandIndex, older_than: float, limit: int = None) -> int:
+    """
+    Asks Gemini again for the brand names of stale generics it answered before.
+
+    Args:
+        index: Brand index to update
+        older_than: Age in seconds after which an entry is refreshed
+        limit: Maximum number of generics to refresh (None for all)
+
+    Returns:
+        int: Number of generics refreshed
+    """
+    # Imported here because ocr uses this module's index
+    from .ocr import SPELL_CHECK_CONCURRENCY, gemini_client, spell_check_medicine_name_async
+
+    stale = index.stale(older_than)[:limit]
+    semaphore = asyncio.Semaphore(SPELL_CHECK_CONCURRENCY)
+
+    async def refresh_one(generic_names: list[str]) -> bool:
+        async with semaphore:
+            try:
+                response = await spell_check_medicine_name_async(" + ".join(generic_names), gemini_client, use_brand_index=False)
+            except Exception as e:
+                logger.warning(f"Could not refresh brand names for {generic_names}: {e}")
+                return False
+        brand_names = [brand for drug in response.drugs for brand in drug.brand_names]
+        # An empty answer doesn't replace brand names found before, but the entry has been checked again
+        if brand_names:
+            index.put_many([(generic_names, brand_names)], "gemini")
+        else:
+            index.touch(generic_names)
+        return bool(brand_names)
+
+    refreshed = sum(await asyncio.gather(*(refresh_one(generic_names) for generic_names in stale)))
+    if refreshed:
+        index.bump_version()
+    logger.info(f"Refreshed brand names for {refreshed} of {len(stale)} stale generics")
+    return refreshed
+
+brand_index = BrandIndex(BRAND_INDEX_PATH) if BRAND_INDEX_ENABLED else None
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the local generic-to-brand name index")
+    parser.add_argument("--path", default=BRAND_INDEX_PATH, help="Brand index database file")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = subparsers.add_parser("import", help="Load generic and brand name pairs from a CSV file")
+    import_parser.add_argument("csv", help="CSV file with generic_name and brand_name columns")
+
+    refresh_parser = subparsers.add_parser("refresh", help="Ask Gemini again for brand names it returned a while ago")
+    refresh_parser.add_argument("--older-than-days", type=float, default=30, help="Refresh entries older than this")
+    refresh_parser.add_argument("--limit", type=int, default=None, help="Refresh at most this many generics")
+
+    lookup_parser = subparsers.add_parser("lookup", help="Print the brand names for a generic")
+    lookup_parser.add_argument("generic", help="Generic name, with \"+\" between combination components")
+
+    subparsers.add_parser("stats", help="Print the number of indexed generics")
+
+    args = parser.parse_args()
+    index = brand_index if brand_index and args.path == BRAND_INDEX_PATH else BrandIndex(args.path)
+    if args.command == "import":
+        import_csv(index, args.csv)
+    elif args.command == "refresh":
+        asyncio.run(refresh(index, args.older_than_days * 24 * 3600, args.limit))
+    elif args.command == "lookup":
+        print(json.dumps(index.get([args.generic])))
+    else:
+        print(json.dumps(index.stats(), indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from loguru import logger
+from .schema import SpellCheck, MedicationResponse, SpellCheckResponse
+
+# Where on-disk caches live unless overridden
+CACHE_DIR = os.getenv("CACHE_DIR", ".cache")
+
+# Spell check cache settings
+SPELL_CHECK_CACHE_ENABLED = os.getenv("SPELL_CHECK_CACHE_ENABLED", "true").lower() == "true"
+SPELL_CHECK_CACHE_TTL = float(os.getenv("SPELL_CHECK_CACHE_TTL", str(7 * 24 * 3600)))
+SPELL_CHECK_CACHE_MAX_ENTRIES = int(os.getenv("SPELL_CHECK_CACHE_MAX_ENTRIES", "10000"))
+
+# Prescription result cache settings
+RESULT_CACHE_ENABLED = os.getenv("RESULT_CACHE_ENABLED", "true").lower() == "true"
+RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", str(30 * 24 * 3600)))
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "5000"))
+RESULT_CACHE_MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+def normalize_drug_name(name: str) -> str:
+    """
+    Folds case, whitespace and punctuation so spelling variants of a name share a cache key.
+
+    Args:
+        name: Medicine name as written on the prescription
+
+    Returns:
+        str: Normalized name, e.g. "Amoxicillin + Clavulanate" -> "amoxicillin clavulanate"
+    """
+    name = re.sub(r"[^\w\s]", " ", name.casefold())
+    return " ".join(name.split())
+
+class SQLiteCache:
+    """
+    Persistent string cache with TTL expiry and LRU eviction, backed by SQLite.
+
+    Safe to share between threads, and between processes through SQLite's own locking.
+
+    Attributes:
+        path: Path to the SQLite database file
+        table: Table holding this cache's entries
+        ttl: Seconds an entry stays valid after it was written
+        max_entries: Number of entries kept before the least recently used are evicted
+        max_bytes: Total size of values kept before the least recently used are evicted (None for no limit)
+        hits: Lookups answered from the cache since start-up
+        misses: Lookups not found in the cache since start-up
+    """
+    def __init__(self, path: str, table: str, ttl: float, max_entries: int, max_bytes: int = None):
+        self.path = path
+        self.table = table
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+            "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_accessed_at ON {table} (accessed_at)")
+        logger.info(f"Cache '{table}' opened at {path}")
+
+    def get_many(self, keys: list[str]) -> dict[str, str]:
+        """
+        Looks up several keys at once, refreshing their LRU position.
+
+        Args:
+            keys: Keys to look up
+
+        Returns:
+            dict[str, str]: Values for the keys that were found and not expired
+        """
+        if not keys:
+            return {}
+        now = time.time()
+        placeholders = ", ".join("?" for _ in keys)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT key, value FROM {self.table} WHERE key IN ({placeholders}) AND created_at >= ?",
+                [*keys, now - self.ttl],
+            ).fetchall()
+            found = dict(rows)
+            if found:
+                self._conn.executemany(
+                    f"UPDATE {self.table} SET accessed_at = ? WHERE key = ?",
+                    [(now, key) for key in found],
+                )
+            self.hits += len(found)
+            self.misses += len(set(keys)) - len(found)
+        return found
+
+    def get(self, key: str) -> str | None:
+        """
+        Looks up a single key.
+
+        Args:
+            key: Key to look up
+
+        Returns:
+            str | None: The cached value, or None on a miss
+        """
+        return self.get_many([key]).get(key)
+
+    def set_many(self, items: dict[str, str]):
+        """
+        Stores several values, then evicts expired and least recently used entries.
+
+        Args:
+            items: Values to store by key
+        """
+        if not items:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                [(key, value, len(value), now, now) for key, value in items.items()],
+            )
+            self._evict(now)
+
+    def set(self, key: str, value: str):
+        """
+        Stores a single value.
+
+        Args:
+            key: Key to store under
+            value: Value to store
+        """
+        self.set_many({key: value})
+
+    def _evict(self, now: float):
+        self._conn.execute(f"DELETE FROM {self.table} WHERE created_at < ?", (now - self.ttl,))
+        self._conn.execute(
+            f"DELETE FROM {self.table} WHERE key IN ("
+            f"SELECT key FROM {self.table} ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+        if self.max_bytes is not None:
+            self._conn.execute(
+                f"DELETE FROM {self.table} WHERE key IN ("
+                f"SELECT key FROM (SELECT key, SUM(size) OVER (ORDER BY accessed_at DESC, key) AS total FROM {self.table}) "
+                "WHERE total > ?)",
+                (self.max_bytes,),
+            )
+
+    def clear(self):
+        """Removes every entry from the cache."""
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self.table}")
+
+    def stats(self) -> dict:
+        """
+        Returns hit/miss counters and the cache's current size.
+
+        Returns:
+            dict: Hits, misses, hit rate, entry count and bytes stored
+        """
+        with self._lock:
+            entries, size = self._conn.execute(f"SELECT COUNT(*), COALESCE(SUM(size), 0) FROM {self.table}").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": entries,
+            "bytes": size,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "ttl": self.ttl,
+        }
+
+class SpellCheckCache(SQLiteCache):
+    """
+    Cache of SpellCheck results keyed by the normalized input name.
+    """
+    def __init__(self, path: str, ttl: float = SPELL_CHECK_CACHE_TTL, max_entries: int = SPELL_CHECK_CACHE_MAX_ENTRIES):
+        super().__init__(path, "spell_checks", ttl, max_entries)
+
+    def get_spell_checks(self, names: list[str]) -> dict[str, SpellCheck]:
+        """
+        Looks up cached spell checks for medicine names.
+
+        Args:
+            names: Medicine names as written on the prescription
+
+        Returns:
+            dict[str, SpellCheck]: Cached results by name, with input_name set to the name as given
+        """
+        keys = {name: normalize_drug_name(name) for name in names}
+        found = self.get_many(list(set(keys.values())))
+        return {
+            name: SpellCheck.model_validate_json(found[key]).model_copy(update={"input_name": name})
+            for name, key in keys.items()
+            if key in found
+        }
+
+    def put_spell_checks(self, spell_checks: dict[str, SpellCheck]):
+        """
+        Stores spell check results.
+
+        Args:
+            spell_checks: Results by the medicine name they were requested for
+        """
+        self.set_many({normalize_drug_name(name): spell_check.model_dump_json() for name, spell_check in spell_checks.items()})
+
+class ResultCache(SQLiteCache):
+    """
+    Cache of full prescription results keyed by image content, models and prompt version.
+    """
+    def __init__(self, path: str, ttl: float = RESULT_CACHE_TTL, max_entries: int = RESULT_CACHE_MAX_ENTRIES,
+                 max_bytes: int = RESULT_CACHE_MAX_BYTES):
+        super().__init__(path, "results", ttl, max_entries, max_bytes)
+
+    def get_result(self, key: str) -> tuple[MedicationResponse, SpellCheckResponse] | None:
+        """
+        Looks up the cached result for a prescription image.
+
+        Args:
+            key: Result cache key for the image
+
+        Returns:
+            tuple | None: (MedicationResponse, SpellCheckResponse), or None on a miss
+        """
+        value = self.get(key)
+        if value is None:
+            return None
+        data = json.loads(value)
+        return (
+            MedicationResponse.model_validate(data["medications"]),
+            SpellCheckResponse.model_validate(data["spell_check"]),
+        )
+
+    def put_result(self, key: str, medication_data: MedicationResponse, spell_check_data: SpellCheckResponse):
+        """
+        Stores the result for a prescription image.
+
+        Args:
+            key: Result cache key for the image
+            medication_data: Spell-corrected medication data
+            spell_check_data: Spell check results
+        """
+        self.set(key, json.dumps({
+            "medications": medication_data.model_dump(),
+            "spell_check": spell_check_data.model_dump(),
+        }))
+
+spell_check_cache = SpellCheckCache(os.path.join(CACHE_DIR, "spell_checks.sqlite3")) if SPELL_CHECK_CACHE_ENABLED else None
+result_cache = ResultCache(os.path.join(CACHE_DIR, "results.sqlite3")) if RESULT_CACHE_ENABLED else None
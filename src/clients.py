@@ -0,0 +1,494 @@
+import asyncio
+import importlib.util
+import os
+import threading
+import time
+import weakref
+from types import SimpleNamespace
+from google import genai
+from google.genai import types
+from loguru import logger
+from .exceptions import GeminiError
+from .keys import KeyScheduler, is_rate_limited, key_scheduler
+from .metrics import record_gemini_call
+from .policies import CallPolicy, call_policies, is_retryable
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+# Gemini HTTP connection pool settings
+GEMINI_MAX_CONNECTIONS = int(os.getenv("GEMINI_MAX_CONNECTIONS", "64"))
+GEMINI_KEEPALIVE_CONNECTIONS = int(os.getenv("GEMINI_KEEPALIVE_CONNECTIONS", "32"))
+GEMINI_KEEPALIVE_EXPIRY = float(os.getenv("GEMINI_KEEPALIVE_EXPIRY", "60"))
+GEMINI_HTTP2 = os.getenv("GEMINI_HTTP2", "true").lower() == "true"
+# Gemini API endpoint, e.g. a local stand-in for benchmarks (empty for the real API)
+GEMINI_BASE_URL = os.getenv("GEMINI_BASE_URL", "")
+
+class GeminiClientPool:
+    """
+    Keeps one long-lived Gemini client per API key instead of building one per call.
+
+    Newer google-genai releases accept HTTP client settings, and the pool uses
+    them to share keep-alive connections (HTTP/2 when the h2 package is
+    installed). Async connections belong to the event loop that opened them,
+    so in that case clients are kept per event loop. Older releases open a
+    connection per request whatever the pool does, and only the client
+    construction is saved.
+
+    Attributes:
+        pooling: How HTTP connections are shared: "shared" (one httpx pool for all keys),
+                 "per_client" (a tuned pool per client) or "none"
+        base_url: Gemini API endpoint the clients call, or "" for the real API
+    """
+    def __init__(self, max_connections: int = GEMINI_MAX_CONNECTIONS,
+                 keepalive_connections: int = GEMINI_KEEPALIVE_CONNECTIONS,
+                 keepalive_expiry: float = GEMINI_KEEPALIVE_EXPIRY, http2: bool = GEMINI_HTTP2,
+                 base_url: str = GEMINI_BASE_URL):
+        self.base_url = base_url
+        fields = types.HttpOptions.model_fields
+        if httpx is not None and "httpx_client" in fields and "httpx_async_client" in fields:
+            self.pooling = "shared"
+        elif httpx is not None and "client_args" in fields and "async_client_args" in fields:
+            self.pooling = "per_client"
+        else:
+            self.pooling = "none"
+
+        self._client_args = {}
+        if self.pooling != "none":
+            self._client_args = {
+                "limits": httpx.Limits(
+                    max_connections=max_connections,
+                    max_keepalive_connections=keepalive_connections,
+                    keepalive_expiry=keepalive_expiry,
+                ),
+                "http2": http2 and importlib.util.find_spec("h2") is not None,
+            }
+        self._lock = threading.Lock()
+        self._clients: dict[str, genai.Client] = {}
+        self._loop_clients = weakref.WeakKeyDictionary()
+        self._http_client = None
+        self._async_http_clients = weakref.WeakKeyDictionary()
+        logger.info(f"Gemini client pool started with {self.pooling} connection pooling")
+
+    def get(self, api_key: str) -> genai.Client:
+        """
+        Returns the pooled client for an API key, creating it on first use.
+
+        Safe to call from any thread or task. The client's sync methods can be
+        used anywhere; its async methods belong to the event loop it was
+        requested from.
+
+        Args:
+            api_key: The API key the client should use
+
+        Returns:
+            genai.Client: The client for the key
+        """
+        try:
+            loop = asyncio.get_running_loop() if self.pooling != "none" else None
+        except RuntimeError:
+            loop = None
+        with self._lock:
+            clients = self._clients if loop is None else self._loop_clients.setdefault(loop, {})
+            client = clients.get(api_key)
+            if client is None:
+                client = clients[api_key] = genai.Client(api_key=api_key, http_options=self._http_options(loop))
+        return client
+
+    def _http_options(self, loop) -> types.HttpOptions | None:
+        options = {"base_url": self.base_url} if self.base_url else {}
+        if self.pooling == "shared":
+            if self._http_client is None:
+                self._http_client = httpx.Client(**self._client_args)
+            async_client = None
+            if loop is not None:
+                async_client = self._async_http_clients.get(loop)
+                if async_client is None:
+                    async_client = self._async_http_clients[loop] = httpx.AsyncClient(**self._client_args)
+            return types.HttpOptions(httpx_client=self._http_client, httpx_async_client=async_client, **options)
+        if self.pooling == "per_client":
+            return types.HttpOptions(client_args=self._client_args, async_client_args=self._client_args, **options)
+        return types.HttpOptions(**options) if options else None
+
+    async def aclose(self):
+        """Closes the shared HTTP connections and forgets every client."""
+        with self._lock:
+            http_client, self._http_client = self._http_client, None
+            async_clients = list(self._async_http_clients.values())
+            self._async_http_clients.clear()
+            self._clients.clear()
+            self._loop_clients.clear()
+        if http_client is not None:
+            http_client.close()
+        for async_client in async_clients:
+            try:
+                await async_client.aclose()
+            except RuntimeError:
+                # Opened on an event loop that has since been closed
+                pass
+
+    def stats(self) -> dict:
+        """
+        Returns how many clients the pool holds.
+
+        Returns:
+            dict: Pooling mode and client counts
+        """
+        with self._lock:
+            loop_clients = sum(len(clients) for clients in self._loop_clients.values())
+        return {
+            "pooling": self.pooling,
+            "http2": self._client_args.get("http2", False),
+            "clients": len(self._clients) + loop_clients,
+            "event_loops": len(self._loop_clients),
+        }
+
+def usage_tokens(response) -> int | None:
+    """
+    Reads the total token count from a Gemini response.
+
+    Args:
+        response: Response returned by generate_content
+
+    Returns:
+        int | None: Tokens used by the call, or None if the response doesn't say
+    """
+    usage = getattr(response, "usage_metadata", None)
+    return getattr(usage, "total_token_count", None)
+
+def call_outcome(error: BaseException = None) -> str:
+    """
+    Classifies how a Gemini call ended, for metrics.
+
+    Args:
+        error: Exception the call raised, if any
+
+    Returns:
+        str: "ok", "cancelled", "timeout", "rate_limited" or "error"
+    """
+    if error is None:
+        return "ok"
+    if isinstance(error, asyncio.CancelledError):
+        return "cancelled"
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError)):
+        return "timeout"
+    return "rate_limited" if is_rate_limited(error) else "error"
+
+class ThreadedStream:
+    """
+    Async iterator over a sync response stream, reading each chunk in a worker thread.
+
+    Older google-genai releases implement async streaming on top of their
+    blocking HTTP client, so waiting for a chunk would hold up the whole
+    event loop. Reading the sync stream in a thread keeps other requests
+    moving, the same way those releases run their other async calls.
+    """
+    def __init__(self, iterator):
+        self._iterator = iterator
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        chunk = await asyncio.to_thread(next, self._iterator, None)
+        if chunk is None:
+            raise StopAsyncIteration
+        return chunk
+
+class ScheduledModels:
+    """
+    The models surface of a ScheduledClient, for sync calls.
+
+    Sync calls are retried with backoff, but can't be timed out or hedged.
+    """
+    def __init__(self, pool: GeminiClientPool, scheduler: KeyScheduler, policy: CallPolicy):
+        self._pool = pool
+        self._scheduler = scheduler
+        self._policy = policy
+
+    def generate_content(self, **kwargs):
+        """Calls generate_content with a key chosen by the scheduler, retrying retryable errors."""
+        policy = self._policy
+        deadline = time.monotonic() + policy.deadline
+        for attempt in range(1, policy.attempts + 1):
+            key = self._scheduler.acquire(timeout=deadline - time.monotonic())
+            start = time.monotonic()
+            try:
+                response = self._pool.get(key).models.generate_content(**kwargs)
+            except Exception as e:
+                self._scheduler.release(key, error=e)
+                record_gemini_call(kwargs.get("model"), self._scheduler.name_of(key), policy.stage, call_outcome(e))
+                delay = policy.backoff_delay(attempt)
+                if attempt == policy.attempts or not is_retryable(e) or time.monotonic() + delay >= deadline:
+                    policy.failures += 1
+                    raise
+                policy.retries += 1
+                logger.warning(f"Gemini {policy.stage} call failed ({e}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+            self._scheduler.release(key, tokens=usage_tokens(response))
+            policy.latencies.append(time.monotonic() - start)
+            record_gemini_call(kwargs.get("model"), self._scheduler.name_of(key), policy.stage, "ok",
+                               time.monotonic() - start, response)
+            return response
+
+class ScheduledStream:
+    """
+    A response stream holding a scheduler key, which it releases exactly once when the stream ends.
+
+    The key goes back when the last chunk has been read, when reading fails,
+    on aclose() or leaving an async with block, or when the stream is garbage
+    collected. A caller that is cancelled, or drops the stream before reading
+    all of it, doesn't leave the key counted as in flight.
+    """
+    def __init__(self, scheduler: KeyScheduler, key: str, stream, first, policy: CallPolicy, model: str,
+                 latency: float):
+        self._scheduler = scheduler
+        self._key = key
+        self._stream = stream
+        self._first = first
+        self._policy = policy
+        self._model = model
+        self._latency = latency
+        self._started = False
+        self._last = None
+        self._released = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self._released:
+            raise StopAsyncIteration
+        try:
+            if self._started:
+                chunk = await asyncio.wait_for(anext(self._stream, None), self._policy.timeout)
+            else:
+                self._started, chunk = True, self._first
+        except asyncio.TimeoutError as e:
+            self._policy.failures += 1
+            self._release(e)
+            raise GeminiError(f"{self._policy.stage} stream stalled") from e
+        except BaseException as e:
+            self._release(e)
+            raise
+        if chunk is None:
+            self._release()
+            raise StopAsyncIteration
+        self._last = chunk
+        return chunk
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    async def aclose(self):
+        """Stops reading the stream early, releasing its key"""
+        if self._released:
+            return
+        self._release(asyncio.CancelledError())
+        close = getattr(self._stream, "aclose", None)
+        if close is not None:
+            await close()
+
+    def __del__(self):
+        if not self._released:
+            self._release(asyncio.CancelledError())
+
+    def _release(self, error: BaseException = None):
+        if self._released:
+            return
+        self._released = True
+        tokens = usage_tokens(self._last) if self._last is not None and error is None else None
+        # A stream the caller gave up on says nothing about the key, so it isn't counted as an error
+        self._scheduler.release(self._key, tokens=tokens,
+                                error=None if isinstance(error, asyncio.CancelledError) else error)
+        record_gemini_call(self._model, self._scheduler.name_of(self._key), self._policy.stage,
+                           call_outcome(error), self._latency, self._last if error is None else None)
+
+class AsyncScheduledModels:
+    """
+    The models surface of a ScheduledClient, for async calls.
+
+    Every attempt, including the wait for a key, is bounded by the policy's
+    timeout and all attempts by its deadline. Retryable errors are retried
+    with jittered exponential backoff. With hedging on, an attempt still
+    running after the stage's p95 latency gets a duplicate on a different
+    key that is free at the time, and whichever answers first wins.
+    """
+    def __init__(self, pool: GeminiClientPool, scheduler: KeyScheduler, policy: CallPolicy):
+        self._pool = pool
+        self._scheduler = scheduler
+        self._policy = policy
+
+    async def _send(self, key: str, kwargs: dict, timeout: float):
+        start = time.monotonic()
+        key_name = self._scheduler.name_of(key)
+        try:
+            response = await asyncio.wait_for(self._pool.get(key).aio.models.generate_content(**kwargs), timeout)
+        except asyncio.CancelledError as e:
+            self._scheduler.release(key)
+            record_gemini_call(kwargs.get("model"), key_name, self._policy.stage, call_outcome(e))
+            raise
+        except Exception as e:
+            self._scheduler.release(key, error=e)
+            record_gemini_call(kwargs.get("model"), key_name, self._policy.stage, call_outcome(e))
+            raise
+        latency = time.monotonic() - start
+        self._scheduler.release(key, tokens=usage_tokens(response))
+        self._policy.latencies.append(latency)
+        record_gemini_call(kwargs.get("model"), key_name, self._policy.stage, "ok", latency, response)
+        return response
+
+    async def _attempt(self, kwargs: dict, timeout: float):
+        policy = self._policy
+        ends = time.monotonic() + timeout
+        key = await self._scheduler.acquire_async(timeout=timeout)
+        primary = asyncio.ensure_future(self._send(key, kwargs, ends - time.monotonic()))
+        if not policy.hedge or len(self._scheduler.keys) < 2:
+            return await primary
+
+        pending, error = {primary}, None
+        try:
+            done, _ = await asyncio.wait(pending, timeout=min(policy.current_hedge_delay(), ends - time.monotonic()))
+            if done:
+                return primary.result()
+            # Waiting for a key would hold up the primary's answer, so only a key that is free now is used
+            hedge_key = self._scheduler.try_acquire(exclude={key})
+            if hedge_key is None:
+                logger.debug(f"Gemini {policy.stage} call is slow, but no other key is free to hedge it on")
+                return await primary
+            policy.hedges += 1
+            logger.info(f"Gemini {policy.stage} call is slow, hedging it on another key")
+            hedge = asyncio.ensure_future(self._send(hedge_key, kwargs, ends - time.monotonic()))
+            pending.add(hedge)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            policy.hedge_wins += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def generate_content(self, **kwargs):
+        """Calls generate_content under the stage's policy, with keys chosen by the scheduler."""
+        policy = self._policy
+        deadline = time.monotonic() + policy.deadline
+        for attempt in range(1, policy.attempts + 1):
+            remaining = deadline - time.monotonic()
+            try:
+                return await self._attempt(kwargs, min(policy.timeout, remaining))
+            except Exception as e:
+                delay = policy.backoff_delay(attempt)
+                if attempt == policy.attempts or not is_retryable(e) or time.monotonic() + delay >= deadline:
+                    policy.failures += 1
+                    if isinstance(e, asyncio.TimeoutError):
+                        raise GeminiError(f"{policy.stage} call timed out") from e
+                    raise
+                policy.retries += 1
+                logger.warning(f"Gemini {policy.stage} call failed ({e!r}), retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    async def _open_stream(self, kwargs: dict, timeout: float):
+        ends = time.monotonic() + timeout
+        key = await self._scheduler.acquire_async(timeout=timeout)
+        start = time.monotonic()
+        timeout = ends - start
+        try:
+            client = self._pool.get(key)
+            if self._pool.pooling == "shared":
+                # Releases that take an async httpx client stream without blocking
+                stream = await asyncio.wait_for(client.aio.models.generate_content_stream(**kwargs), timeout)
+            else:
+                stream = ThreadedStream(client.models.generate_content_stream(**kwargs))
+            first = await asyncio.wait_for(anext(stream, None), timeout)
+        except asyncio.CancelledError as e:
+            self._scheduler.release(key)
+            record_gemini_call(kwargs.get("model"), self._scheduler.name_of(key), self._policy.stage, call_outcome(e))
+            raise
+        except Exception as e:
+            self._scheduler.release(key, error=e)
+            record_gemini_call(kwargs.get("model"), self._scheduler.name_of(key), self._policy.stage, call_outcome(e))
+            raise
+        latency = time.monotonic() - start
+        self._policy.latencies.append(latency)
+        return key, stream, first, latency
+
+    async def generate_content_stream(self, **kwargs):
+        """
+        Calls generate_content_stream under the stage's policy, with a key chosen by the scheduler.
+
+        Opening the stream and waiting for its first chunk is retried like
+        generate_content, and the first-chunk latency feeds the stage's
+        statistics. Once chunks are flowing the call can't be retried or
+        hedged, so each later chunk only has to arrive within the timeout.
+
+        Returns:
+            ScheduledStream: The chunks, which release the key when read to the end, closed or dropped
+        """
+        policy = self._policy
+        deadline = time.monotonic() + policy.deadline
+        for attempt in range(1, policy.attempts + 1):
+            remaining = deadline - time.monotonic()
+            try:
+                key, stream, first, latency = await self._open_stream(kwargs, min(policy.timeout, remaining))
+                break
+            except Exception as e:
+                delay = policy.backoff_delay(attempt)
+                if attempt == policy.attempts or not is_retryable(e) or time.monotonic() + delay >= deadline:
+                    policy.failures += 1
+                    if isinstance(e, asyncio.TimeoutError):
+                        raise GeminiError(f"{policy.stage} call timed out") from e
+                    raise
+                policy.retries += 1
+                logger.warning(f"Gemini {policy.stage} call failed ({e!r}), retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+        return ScheduledStream(self._scheduler, key, stream, first, policy, kwargs.get("model"), latency)
+
+class ScheduledClient:
+    """
+    Stands in for genai.Client, choosing the API key for every call separately.
+
+    Supports the client.models.generate_content,
+    client.aio.models.generate_content and
+    client.aio.models.generate_content_stream calls the pipeline makes, so a
+    prescription's calls spread over all keys and a rate limited key stops
+    being used straight away. Calls follow the policy of the client's stage;
+    use for_stage to get the client for another stage.
+
+    Attributes:
+        policy: Timeouts, retries and hedging applied to calls
+        models: Sync generate_content
+        aio: Async generate_content and generate_content_stream, as aio.models
+    """
+    def __init__(self, pool: GeminiClientPool, scheduler: KeyScheduler, policy: CallPolicy):
+        self._pool = pool
+        self._scheduler = scheduler
+        self.policy = policy
+        self.models = ScheduledModels(pool, scheduler, policy)
+        self.aio = SimpleNamespace(models=AsyncScheduledModels(pool, scheduler, policy))
+
+    def for_stage(self, stage: str) -> "ScheduledClient":
+        """
+        Returns a client whose calls follow another stage's policy.
+
+        Args:
+            stage: One of the stages in call_policies
+
+        Returns:
+            ScheduledClient: Client sharing this one's pool and scheduler
+        """
+        return ScheduledClient(self._pool, self._scheduler, call_policies[stage])
+
+gemini_clients = GeminiClientPool()
+gemini_client = ScheduledClient(gemini_clients, key_scheduler, call_policies["spell_check"])
@@ -0,0 +1,156 @@
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from collections import Counter
+from pathlib import Path
+from loguru import logger
+from .cache import normalize_drug_name
+from .ocr import OCR_MODES, extract_text_from_image_async
+from .schema import MedicationResponse
+
+async def record(ground_truth_path: str, output_path: str, modes: list[str]):
+    """
+    Runs every OCR mode on the labelled images and saves the responses with their latency.
+
+    Args:
+        ground_truth_path: JSONL file of {"image", "expected"} records
+        output_path: JSONL file to write recordings to
+        modes: OCR modes to record
+    """
+    base = Path(ground_truth_path).parent
+    with open(ground_truth_path) as ground_truth, open(output_path, "w") as output:
+        for line in ground_truth:
+            if not line.strip():
+                continue
+            sample = json.loads(line)
+            image_bytes = (base / sample["image"]).read_bytes()
+            results = {}
+            for mode in modes:
+                start = time.perf_counter()
+                try:
+                    response = await extract_text_from_image_async(image_bytes, mode=mode)
+                    results[mode] = {"latency": time.perf_counter() - start, "response": response.model_dump(), "error": None}
+                except Exception as e:
+                    results[mode] = {"latency": time.perf_counter() - start, "response": None, "error": str(e)}
+                logger.info(f"Recorded {sample['image']} in {mode} mode: {results[mode]['latency']:.2f}s")
+            output.write(json.dumps({**sample, "results": results}) + "\n")
+
+def score(expected: MedicationResponse, actual: MedicationResponse) -> dict:
+    """
+    Compares extracted medications against the labelled ones.
+
+    Medications are matched by normalized name; dosage and quantity are only
+    scored for matched medications.
+
+    Args:
+        expected: Labelled medications
+        actual: Medications extracted by the model
+
+    Returns:
+        dict: Matched, expected and extracted counts, plus correct dosages and quantities
+    """
+    expected_by_name = {normalize_drug_name(med.medication_name): med for med in expected.medications}
+    actual_by_name = {normalize_drug_name(med.medication_name): med for med in actual.medications}
+    matched = expected_by_name.keys() & actual_by_name.keys()
+    return {
+        "matched": len(matched),
+        "expected": len(expected.medications),
+        "extracted": len(actual.medications),
+        "dosage_correct": sum(
+            normalize_drug_name(expected_by_name[name].dosage) == normalize_drug_name(actual_by_name[name].dosage)
+            for name in matched
+        ),
+        "quantity_correct": sum(expected_by_name[name].quantity == actual_by_name[name].quantity for name in matched),
+    }
+
+def summarize(recordings: list[dict], mode: str) -> dict:
+    """
+    Aggregates accuracy and latency for one OCR mode.
+
+    Args:
+        recordings: Records written by record()
+        mode: OCR mode to summarize
+
+    Returns:
+        dict: Sample and error counts, latency percentiles and accuracy ratios
+    """
+    latencies, totals, errors = [], Counter(), 0
+    for recording in recordings:
+        result = recording["results"].get(mode)
+        if result is None:
+            continue
+        latencies.append(result["latency"])
+        if result["error"] or result["response"] is None:
+            errors += 1
+            totals["expected"] += len(recording["expected"]["medications"])
+            continue
+        totals.update(score(
+            MedicationResponse.model_validate(recording["expected"]),
+            MedicationResponse.model_validate(result["response"]),
+        ))
+
+    precision = totals["matched"] / totals["extracted"] if totals["extracted"] else 0.0
+    recall = totals["matched"] / totals["expected"] if totals["expected"] else 0.0
+    return {
+        "mode": mode,
+        "samples": len(latencies),
+        "errors": errors,
+        "latency_mean": statistics.fmean(latencies) if latencies else None,
+        "latency_p50": statistics.median(latencies) if latencies else None,
+        "latency_p95": statistics.quantiles(latencies, n=20)[-1] if len(latencies) > 1 else (latencies or [None])[0],
+        "name_precision": precision,
+        "name_recall": recall,
+        "name_f1": 2 * precision * recall / (precision + recall) if precision + recall else 0.0,
+        "dosage_accuracy": totals["dosage_correct"] / totals["matched"] if totals["matched"] else 0.0,
+        "quantity_accuracy": totals["quantity_correct"] / totals["matched"] if totals["matched"] else 0.0,
+    }
+
+def compare(recordings_path: str) -> list[dict]:
+    """
+    Summarizes every OCR mode found in a recordings file.
+
+    Args:
+        recordings_path: JSONL file written by record()
+
+    Returns:
+        list[dict]: One summary per mode
+    """
+    with open(recordings_path) as f:
+        recordings = [json.loads(line) for line in f if line.strip()]
+    modes = sorted({mode for recording in recordings for mode in recording["results"]})
+    return [summarize(recordings, mode) for mode in modes]
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare OCR modes on recorded prescriptions")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    record_parser = subparsers.add_parser("record", help="Run each OCR mode on labelled images and save the responses")
+    record_parser.add_argument("ground_truth", help="JSONL file of {\"image\", \"expected\"} records")
+    record_parser.add_argument("-o", "--output", default="recordings.jsonl", help="Where to write the recordings")
+    record_parser.add_argument("--modes", nargs="+", default=list(OCR_MODES), choices=OCR_MODES, help="OCR modes to record")
+
+    compare_parser = subparsers.add_parser("compare", help="Score recorded responses offline")
+    compare_parser.add_argument("recordings", help="JSONL file written by the record command")
+    compare_parser.add_argument("--json", action="store_true", help="Print the summaries as JSON")
+
+    args = parser.parse_args()
+    if args.command == "record":
+        asyncio.run(record(args.ground_truth, args.output, args.modes))
+        return
+
+    summaries = compare(args.recordings)
+    if args.json:
+        print(json.dumps(summaries, indent=2))
+        return
+    for summary in summaries:
+        print(
+            f"{summary['mode']:<12} samples={summary['samples']} errors={summary['errors']} "
+            f"p50={summary['latency_p50']:.2f}s p95={summary['latency_p95']:.2f}s "
+            f"name_f1={summary['name_f1']:.3f} dosage={summary['dosage_accuracy']:.3f} "
+            f"quantity={summary['quantity_accuracy']:.3f}"
+        )
+
+if __name__ == "__main__":
+    main()
@@ -11,4 +11,31 @@ class GeminiError(Exception):
 
     def __str__(self):
         return f"GeminiError: {self.message}"
-    
\ No newline at end of file
+
+class JobQueueFull(Exception):
+    """
+    Raised when the background job queue has no room for another job.
+
+    Attributes:
+        message: The error message
+    """
+    def __init__(self, message="The job queue is full, try again later"):
+        super().__init__(message)
+        self.message = message
+
+    def __str__(self):
+        return f"JobQueueFull: {self.message}"
+
+class UploadTooLarge(Exception):
+    """
+    Raised when an uploaded file is bigger than the upload size limit.
+
+    Attributes:
+        message: The error message
+    """
+    def __init__(self, message="The uploaded file is too large"):
+        super().__init__(message)
+        self.message = message
+
+    def __str__(self):
+        return f"UploadTooLarge: {self.message}"
@@ -0,0 +1,187 @@
+import hashlib
+import os
+import re
+import tempfile
+import time
+from loguru import logger
+from .cache import CACHE_DIR
+from .preprocessing import preprocess_image, sniff_mime_type
+
+# Prescription image serving settings
+IMAGE_RENDITION_DIR = os.getenv("IMAGE_RENDITION_DIR", os.path.join(CACHE_DIR, "renditions"))
+IMAGE_THUMB_EDGE = int(os.getenv("IMAGE_THUMB_EDGE", "320"))
+IMAGE_SCREEN_EDGE = int(os.getenv("IMAGE_SCREEN_EDGE", "1600"))
+IMAGE_CACHE_MAX_AGE = int(os.getenv("IMAGE_CACHE_MAX_AGE", str(24 * 3600)))
+
+# Longest edge of each rendition served besides the original
+RENDITION_EDGES = {
+    "thumb": IMAGE_THUMB_EDGE,
+    "screen": IMAGE_SCREEN_EDGE,
+}
+IMAGE_SIZES = ("original", *RENDITION_EDGES)
+
+# Prescriptions are private, and a session's page never changes once uploaded
+IMAGE_CACHE_CONTROL = f"private, max-age={IMAGE_CACHE_MAX_AGE}, immutable"
+
+def image_etag(sha256: str, size: str = "original") -> str:
+    """
+    Builds the strong ETag of an image or one of its renditions.
+
+    Args:
+        sha256: Hash of the original image
+        size: One of IMAGE_SIZES
+
+    Returns:
+        str: The quoted ETag, which changes with the rendition's edge setting
+    """
+    if size == "original":
+        return f'"{sha256}"'
+    return f'"{sha256}-{size}{RENDITION_EDGES[size]}"'
+
+def etag_matches(if_none_match: str | None, etag: str, *equivalent: str) -> bool:
+    """
+    Checks an If-None-Match header against an ETag.
+
+    Args:
+        if_none_match: Header value, if sent
+        etag: The current quoted ETag
+        *equivalent: Other quoted ETags of the same content, e.g. of its gzipped body
+
+    Returns:
+        bool: True if the client's copy is current and a 304 can be sent
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # Weak comparison, as RFC 9110 requires for If-None-Match
+    tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return etag in tags or any(tag in tags for tag in equivalent)
+
+def parse_range(range_header: str | None, length: int) -> tuple[int, int] | None:
+    """
+    Parses a single byte range request.
+
+    Args:
+        range_header: Range header value, if sent
+        length: Size of the full content
+
+    Returns:
+        tuple[int, int] | None: Inclusive (first, last) byte positions, or None to send the whole content
+
+    Raises:
+        ValueError: The range lies beyond the end of the content
+    """
+    match = re.fullmatch(r"\s*bytes\s*=\s*(\d*)\s*-\s*(\d*)\s*", range_header or "")
+    # Multiple ranges and other units are answered with the whole content, which RFC 9110 allows
+    if not match or match.group(1) == match.group(2) == "":
+        return None
+    first, last = match.groups()
+    if first == "":
+        suffix = int(last)
+        if suffix == 0:
+            raise ValueError("Empty suffix range")
+        return max(length - suffix, 0), length - 1
+    first = int(first)
+    last = min(int(last), length - 1) if last else length - 1
+    if first >= length or first > last:
+        raise ValueError(f"Range starts beyond {length} bytes")
+    return first, last
+
+class RenditionStore:
+    """
+    Downscaled copies of prescription pages, kept on disk by content hash.
+
+    Renditions are made once per uploaded page and shared by every session
+    holding the same image, and are served straight from disk.
+
+    Attributes:
+        path: Directory holding the renditions
+    """
+    def __init__(self, path: str = IMAGE_RENDITION_DIR):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def file_path(self, sha256: str, size: str) -> str:
+        return os.path.join(self.path, sha256[:2], f"{sha256}-{RENDITION_EDGES[size]}")
+
+    def get(self, sha256: str, size: str) -> str | None:
+        """
+        Finds a rendition on disk.
+
+        Args:
+            sha256: Hash of the original image
+            size: "thumb" or "screen"
+
+        Returns:
+            str | None: Path to the rendition, or None if it hasn't been made
+        """
+        path = self.file_path(sha256, size)
+        return path if os.path.exists(path) else None
+
+    def render(self, image: bytes, sha256: str = None) -> str:
+        """
+        Makes every rendition of an image that isn't on disk yet.
+
+        Args:
+            image: Original image bytes
+            sha256: Hash of the image, if already known
+
+        Returns:
+            str: The image's hash
+        """
+        sha256 = sha256 or hashlib.sha256(image).hexdigest()
+        for size, edge in RENDITION_EDGES.items():
+            path = self.file_path(sha256, size)
+            if os.path.exists(path):
+                continue
+            data, _ = preprocess_image(image, max_edge=edge, grayscale=False)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write under a temporary name so a concurrent reader never sees half a file
+            with tempfile.NamedTemporaryFile(dir=os.path.dirname(path), delete=False) as f:
+                f.write(data)
+            os.replace(f.name, path)
+        return sha256
+
+    def render_pages(self, pages: list[bytes], hashes: list[str] = None) -> list[str]:
+        """
+        Makes the renditions of every page of a prescription.
+
+        Args:
+            pages: Page images in order
+            hashes: Hash of each page, if already known
+
+        Returns:
+            list[str]: Hash of each page, in order
+        """
+        return [self.render(page, sha256) for page, sha256 in zip(pages, hashes or [None] * len(pages))]
+
+    def mime_type(self, path: str) -> str:
+        """Sniffs a rendition's MIME type; an image that couldn't be shrunk is kept in its own format."""
+        with open(path, "rb") as f:
+            return sniff_mime_type(f.read(16))
+
+    def prune(self, older_than: float) -> int:
+        """
+        Deletes renditions made longer ago than older_than seconds; they are made again when requested.
+
+        Args:
+            older_than: Age in seconds
+
+        Returns:
+            int: Number of files deleted
+        """
+        cutoff = time.time() - older_than
+        removed = 0
+        for root, _, files in os.walk(self.path):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    if os.path.getmtime(path) < cutoff:
+                        os.unlink(path)
+                        removed += 1
+                except FileNotFoundError:
+                    continue
+        if removed:
+            logger.info(f"Pruned {removed} image renditions")
+        return removed
@@ -0,0 +1,215 @@
+import asyncio
+import time
+from loguru import logger
+from .exceptions import JobQueueFull
+
+# Stages a prescription job moves through, in order
+JOB_STATUSES = ["queued", "extracting", "spell_checking", "structuring", "done", "failed"]
+
+class Job:
+    """
+    A unit of background work tracked by the job queue.
+
+    Attributes:
+        job_id: Unique job identifier (the session ID the result is stored under)
+        status: Current stage, one of JOB_STATUSES
+        error: Error message if the job failed
+        created_at: Time the job was submitted
+        updated_at: Time of the last status change
+        on_update: Optional callback called with the job after every status change
+        events: Pipeline events recorded so far, as {"event", "data"} dicts
+    """
+    def __init__(self, job_id: str, on_update=None):
+        self.job_id = job_id
+        self.status = "queued"
+        self.error = None
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+        self.on_update = on_update
+        self.events = []
+        self._event_added = asyncio.Event()
+
+    def set_status(self, status: str):
+        """
+        Moves the job to a new stage.
+
+        Args:
+            status: The new stage, one of JOB_STATUSES
+        """
+        if status == self.status:
+            return
+        self.status = status
+        self.updated_at = time.time()
+        logger.info(f"Job {self.job_id} is now {status}")
+        self.add_event("status", self.to_dict())
+        if self.on_update:
+            self.on_update(self)
+
+    def add_event(self, event: str, data):
+        """
+        Records a pipeline event and wakes up everyone streaming the job's events.
+
+        Args:
+            event: Event name, e.g. "status" or "medications"
+            data: JSON-serializable event payload
+        """
+        self.events.append({"event": event, "data": data})
+        self._event_added.set()
+        self._event_added = asyncio.Event()
+
+    async def stream_events(self, keepalive: float = 15):
+        """
+        Yields every event recorded so far, then new ones as they happen, until the job finishes.
+
+        Args:
+            keepalive: Seconds without events after which None is yielded, so idle
+                       connections can be kept open
+
+        Yields:
+            dict | None: The next event, or None if nothing happened for keepalive seconds
+        """
+        index = 0
+        while True:
+            while index < len(self.events):
+                yield self.events[index]
+                index += 1
+            if self.finished:
+                return
+            try:
+                await asyncio.wait_for(self._event_added.wait(), keepalive)
+            except asyncio.TimeoutError:
+                yield None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("done", "failed")
+
+    def to_dict(self) -> dict:
+        """
+        Returns the job status as a JSON-serializable dict.
+
+        Returns:
+            dict: Job ID, status, error and timestamps
+        """
+        return {
+            "job_id": self.job_id,
+            "status": self.status,
+            "error": self.error,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+        }
+
+class JobQueue:
+    """
+    Bounded queue of jobs drained by a fixed pool of asyncio workers.
+
+    Attributes:
+        handler: Coroutine function called as handler(job, payload) for each job
+        concurrency: Number of worker tasks, i.e. jobs processed at once
+        max_queue_size: Number of jobs allowed to wait before submit() rejects
+        retention: Seconds a finished job's status is kept for polling
+        on_update: Optional callback called with a job when it is queued and after every status change
+    """
+    def __init__(self, handler, concurrency: int = 4, max_queue_size: int = 100, retention: float = 3600,
+                 on_update=None):
+        self.handler = handler
+        self.concurrency = concurrency
+        self.max_queue_size = max_queue_size
+        self.retention = retention
+        self.on_update = on_update
+        self.jobs: dict[str, Job] = {}
+        self._queue = None
+        self._workers = []
+
+    async def start(self):
+        """Starts the worker tasks on the running event loop."""
+        self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self._workers = [asyncio.create_task(self._worker(i)) for i in range(self.concurrency)]
+        logger.info(f"Job queue started with {self.concurrency} workers and room for {self.max_queue_size} jobs")
+
+    async def stop(self):
+        """Cancels the worker tasks and waits for them to exit."""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        logger.info("Job queue stopped")
+
+    def submit(self, job_id: str, payload) -> Job:
+        """
+        Enqueues a job without waiting for it to run.
+
+        Args:
+            job_id: Unique job identifier
+            payload: Data passed to the handler
+
+        Returns:
+            Job: The queued job
+
+        Raises:
+            JobQueueFull: If max_queue_size jobs are already waiting
+        """
+        self._prune()
+        job = Job(job_id, on_update=self.on_update)
+        try:
+            self._queue.put_nowait((job, payload))
+        except asyncio.QueueFull:
+            logger.warning(f"Job queue full, rejecting job {job_id}")
+            raise JobQueueFull()
+        self.jobs[job_id] = job
+        if self.on_update:
+            self.on_update(job)
+        return job
+
+    def get(self, job_id: str) -> Job | None:
+        """
+        Looks up a job by ID.
+
+        Args:
+            job_id: Unique job identifier
+
+        Returns:
+            Job | None: The job, or None if unknown or already pruned
+        """
+        return self.jobs.get(job_id)
+
+    def stats(self) -> dict:
+        """
+        Returns queue depth and job counts by status.
+
+        Returns:
+            dict: Queue size, limits and a count per status
+        """
+        counts = {status: 0 for status in JOB_STATUSES}
+        for job in self.jobs.values():
+            counts[job.status] += 1
+        return {
+            "queued": self._queue.qsize() if self._queue else 0,
+            "max_queue_size": self.max_queue_size,
+            "concurrency": self.concurrency,
+            "jobs": counts,
+        }
+
+    def _prune(self):
+        """Drops finished jobs older than the retention window."""
+        cutoff = time.time() - self.retention
+        expired = [job_id for job_id, job in self.jobs.items() if job.finished and job.updated_at < cutoff]
+        for job_id in expired:
+            del self.jobs[job_id]
+
+    async def _worker(self, index: int):
+        while True:
+            job, payload = await self._queue.get()
+            try:
+                await self.handler(job, payload)
+                job.set_status("done")
+            except asyncio.CancelledError:
+                job.error = "Job cancelled"
+                job.set_status("failed")
+                raise
+            except Exception as e:
+                logger.error(f"Job {job.job_id} failed in worker {index}: {e}")
+                job.error = str(e)
+                job.set_status("failed")
+            finally:
+                self._queue.task_done()
@@ -0,0 +1,314 @@
+import asyncio
+import os
+import threading
+import time
+from loguru import logger
+from .exceptions import GeminiError
+
+# API key scheduling settings; a limit of 0 means the key has none
+GEMINI_KEY_RPM = int(os.getenv("GEMINI_KEY_RPM", "0"))
+GEMINI_KEY_TPM = int(os.getenv("GEMINI_KEY_TPM", "0"))
+GEMINI_KEY_COOLDOWN = float(os.getenv("GEMINI_KEY_COOLDOWN", "30"))
+GEMINI_KEY_MAX_COOLDOWN = float(os.getenv("GEMINI_KEY_MAX_COOLDOWN", "300"))
+GEMINI_KEY_WAIT_TIMEOUT = float(os.getenv("GEMINI_KEY_WAIT_TIMEOUT", "60"))
+GEMINI_ESTIMATED_TOKENS = int(os.getenv("GEMINI_ESTIMATED_TOKENS", "2000"))
+
+# Environment variables API keys are read from
+API_KEY_NAMES = ["API_KEY", "API_KEY1", "API_KEY2", "API_KEY3", "API_KEY4"]
+
+def load_api_keys(names: list[str] = API_KEY_NAMES) -> dict[str, str]:
+    """
+    Reads the configured API keys, skipping unset and duplicate ones.
+
+    Args:
+        names: Environment variables to read keys from
+
+    Returns:
+        dict[str, str]: Keys by the name of the variable they came from
+    """
+    keys = {}
+    for name in names:
+        key = (os.getenv(name) or "").strip()
+        if key and key not in keys.values():
+            keys[name] = key
+    return keys
+
+def is_rate_limited(error: Exception) -> bool:
+    """
+    Tells whether a Gemini error means the key hit its rate limit or quota.
+
+    Args:
+        error: Exception raised by a Gemini call
+
+    Returns:
+        bool: True for 429 / RESOURCE_EXHAUSTED errors
+    """
+    return getattr(error, "code", None) == 429 or getattr(error, "status", None) == "RESOURCE_EXHAUSTED"
+
+class TokenBucket:
+    """
+    Per-minute rate limit that refills continuously.
+
+    Attributes:
+        rate: Units allowed per minute (0 for no limit)
+        tokens: Units currently available; may go negative when usage is corrected upwards
+    """
+    def __init__(self, rate: int):
+        self.rate = rate
+        self.tokens = float(rate)
+        self._updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.rate, self.tokens + (now - self._updated) * self.rate / 60)
+        self._updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """
+        Returns the seconds until amount units are available.
+
+        Args:
+            amount: Units needed; capped at the bucket size so large requests still get through
+            now: Current time.monotonic()
+
+        Returns:
+            float: 0 if the units are available now
+        """
+        if not self.rate:
+            return 0.0
+        self._refill(now)
+        missing = min(amount, self.rate) - self.tokens
+        return max(0.0, missing * 60 / self.rate)
+
+    def available(self, now: float) -> float | None:
+        """
+        Returns the units available now.
+
+        Args:
+            now: Current time.monotonic()
+
+        Returns:
+            float | None: Available units, or None if the bucket has no limit
+        """
+        if not self.rate:
+            return None
+        self._refill(now)
+        return self.tokens
+
+    def take(self, amount: float, now: float):
+        """
+        Uses up units; a negative amount gives them back.
+
+        Args:
+            amount: Units to take
+            now: Current time.monotonic()
+        """
+        if self.rate:
+            self._refill(now)
+            self.tokens -= amount
+
+class KeyState:
+    """
+    Usage and health of a single API key.
+
+    Attributes:
+        name: Environment variable the key came from, used instead of the key in logs and stats
+        key: The API key
+        requests: Token bucket for requests per minute
+        tokens: Token bucket for tokens per minute
+        in_flight: Calls currently using the key
+        cooldown_until: time.monotonic() before which the key isn't handed out
+        rate_limited_streak: Rate limit errors in a row, to back off further on each
+    """
+    def __init__(self, name: str, key: str, rpm: int, tpm: int):
+        self.name = name
+        self.key = key
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.in_flight = 0
+        self.cooldown_until = 0.0
+        self.rate_limited_streak = 0
+        self.last_used = 0.0
+        self.total_requests = 0
+        self.total_tokens = 0
+        self.total_rate_limited = 0
+        self.total_errors = 0
+
+    def wait_time(self, tokens: float, now: float) -> float:
+        return max(self.cooldown_until - now, self.requests.wait_time(1, now), self.tokens.wait_time(tokens, now))
+
+class KeyScheduler:
+    """
+    Hands out API keys by load, rate limits and health instead of plain round-robin.
+
+    Each call acquires a key and releases it with the tokens it used or the
+    error it raised. Keys that are rate limited cool down, with the cooldown
+    doubling for consecutive rate limits. Of the keys with room in their
+    request and token buckets, the one with the fewest calls in flight is
+    chosen. When none has room, acquire waits for the first one that will.
+    Safe to use from threads and event loops at once.
+
+    Attributes:
+        keys: State of each key by the name of its environment variable
+        estimated_tokens: Running estimate of tokens per call, reserved when a key is acquired
+    """
+    def __init__(self, keys: dict[str, str], rpm: int = GEMINI_KEY_RPM, tpm: int = GEMINI_KEY_TPM,
+                 cooldown: float = GEMINI_KEY_COOLDOWN, max_cooldown: float = GEMINI_KEY_MAX_COOLDOWN,
+                 wait_timeout: float = GEMINI_KEY_WAIT_TIMEOUT, estimated_tokens: int = GEMINI_ESTIMATED_TOKENS):
+        self.keys = {name: KeyState(name, key, rpm, tpm) for name, key in keys.items()}
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.wait_timeout = wait_timeout
+        self.estimated_tokens = float(estimated_tokens)
+        self._by_key = {state.key: state for state in self.keys.values()}
+        self._lock = threading.Lock()
+        if not self.keys:
+            logger.warning("No Gemini API keys are configured")
+        logger.info(f"Key scheduler initialized with {len(self.keys)} keys: {list(self.keys)}")
+
+    def _try_acquire(self, exclude: set[str] = ()) -> tuple[str | None, float]:
+        if not self.keys:
+            raise GeminiError("No Gemini API keys are configured")
+        now = time.monotonic()
+        with self._lock:
+            candidates = [state for state in self.keys.values() if state.key not in exclude] or list(self.keys.values())
+            waits = {state.name: state.wait_time(self.estimated_tokens, now) for state in candidates}
+            ready = [state for state in candidates if waits[state.name] == 0]
+            if not ready:
+                return None, min(waits.values())
+            state = min(ready, key=lambda state: (state.in_flight, state.last_used))
+            state.requests.take(1, now)
+            state.tokens.take(self.estimated_tokens, now)
+            state.in_flight += 1
+            state.last_used = now
+            state.total_requests += 1
+            return state.key, 0.0
+
+    def try_acquire(self, exclude: set[str] = ()) -> str | None:
+        """
+        Reserves a key with room for another call, without waiting for one.
+
+        Args:
+            exclude: Keys to avoid if any other key is configured, e.g. the one a call is already running on
+
+        Returns:
+            str | None: The API key to use, or None if every key would have to be waited for
+        """
+        key, _ = self._try_acquire(exclude)
+        return key
+
+    def acquire(self, exclude: set[str] = (), timeout: float = None) -> str:
+        """
+        Waits for a key with room for another call and reserves it.
+
+        Args:
+            exclude: Keys to avoid if any other key is configured, e.g. one a call already failed on
+            timeout: Longest wait in seconds, capped at wait_timeout
+
+        Returns:
+            str: The API key to use; pass it to release once the call is done
+
+        Raises:
+            GeminiError: No key has room within the wait
+        """
+        deadline = time.monotonic() + (self.wait_timeout if timeout is None else min(timeout, self.wait_timeout))
+        while True:
+            key, wait = self._try_acquire(exclude)
+            if key:
+                return key
+            if time.monotonic() + wait > deadline:
+                raise GeminiError("No Gemini API key has capacity, try again later")
+            time.sleep(wait)
+
+    async def acquire_async(self, exclude: set[str] = (), timeout: float = None) -> str:
+        """
+        Waits for a key with room for another call without blocking the event loop.
+
+        Args:
+            exclude: Keys to avoid if any other key is configured, e.g. one a call already failed on
+            timeout: Longest wait in seconds, capped at wait_timeout
+
+        Returns:
+            str: The API key to use; pass it to release once the call is done
+
+        Raises:
+            GeminiError: No key has room within the wait
+        """
+        deadline = time.monotonic() + (self.wait_timeout if timeout is None else min(timeout, self.wait_timeout))
+        while True:
+            key, wait = self._try_acquire(exclude)
+            if key:
+                return key
+            if time.monotonic() + wait > deadline:
+                raise GeminiError("No Gemini API key has capacity, try again later")
+            await asyncio.sleep(wait)
+
+    def release(self, key: str, tokens: int = None, error: Exception = None):
+        """
+        Records the outcome of a call made with an acquired key.
+
+        Args:
+            key: The key returned by acquire
+            tokens: Tokens the call used, if known; corrects the reserved estimate
+            error: Exception the call raised, if any; rate limit errors start a cooldown
+        """
+        now = time.monotonic()
+        with self._lock:
+            state = self._by_key.get(key)
+            if state is None:
+                return
+            state.in_flight -= 1
+            if tokens is not None:
+                state.tokens.take(tokens - self.estimated_tokens, now)
+                state.total_tokens += tokens
+                self.estimated_tokens = 0.9 * self.estimated_tokens + 0.1 * tokens
+            if error is None:
+                state.rate_limited_streak = 0
+                return
+            state.total_errors += 1
+            if is_rate_limited(error):
+                state.total_rate_limited += 1
+                state.rate_limited_streak += 1
+                cooldown = min(self.cooldown * 2 ** (state.rate_limited_streak - 1), self.max_cooldown)
+                state.cooldown_until = now + cooldown
+                logger.warning(f"{state.name} was rate limited, cooling down for {cooldown:.0f}s")
+
+    def name_of(self, key: str) -> str:
+        """
+        Returns the name of the environment variable a key came from, to use in its place in logs and metrics.
+
+        Args:
+            key: An API key handed out by acquire
+
+        Returns:
+            str: The variable's name, or "unknown" for a key the scheduler doesn't manage
+        """
+        state = self._by_key.get(key)
+        return state.name if state else "unknown"
+
+    def stats(self) -> dict:
+        """
+        Returns usage and health for each key, without the keys themselves.
+
+        Returns:
+            dict: Per-key counters, in-flight calls, bucket levels and remaining cooldown
+        """
+        now = time.monotonic()
+        with self._lock:
+            return {
+                "estimated_tokens": round(self.estimated_tokens),
+                "keys": {
+                    state.name: {
+                        "in_flight": state.in_flight,
+                        "requests": state.total_requests,
+                        "tokens": state.total_tokens,
+                        "errors": state.total_errors,
+                        "rate_limited": state.total_rate_limited,
+                        "cooldown_remaining": max(0.0, state.cooldown_until - now),
+                        "requests_available": state.requests.available(now),
+                        "tokens_available": state.tokens.available(now),
+                    }
+                    for state in self.keys.values()
+                },
+            }
+
+key_scheduler = KeyScheduler(load_api_keys())
@@ -0,0 +1,346 @@
+import csv
+import hashlib
+import marshal
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from loguru import logger
+from .cache import CACHE_DIR, normalize_drug_name
+from .schema import SpellCheck
+
+# Local drug lexicon settings
+DRUG_LEXICON_PATH = os.getenv("DRUG_LEXICON_PATH", "")
+DRUG_LEXICON_MAX_DISTANCE = int(os.getenv("DRUG_LEXICON_MAX_DISTANCE", "1"))
+DRUG_LEXICON_MIN_LENGTH = int(os.getenv("DRUG_LEXICON_MIN_LENGTH", "5"))
+
+@dataclass
+class LexiconEntry:
+    """
+    A known drug name and what it maps to.
+
+    Attributes:
+        name: The name as spelled in the lexicon
+        is_generic: Whether the name is a generic name
+        generic_names: Generic components the name stands for
+        brand_names: Brand names the drug is marketed under
+    """
+    name: str
+    is_generic: bool
+    generic_names: list[str] = field(default_factory=list)
+    brand_names: list[str] = field(default_factory=list)
+
+def deletes(term: str, max_distance: int) -> set[str]:
+    """
+    Generates every string reachable from a term by deleting up to max_distance characters.
+
+    Args:
+        term: Normalized name
+        max_distance: Maximum number of deleted characters
+
+    Returns:
+        set[str]: The deletes, including the term itself
+    """
+    results, frontier = {term}, {term}
+    for _ in range(max_distance):
+        frontier = {word[:i] + word[i + 1:] for word in frontier for i in range(len(word))}
+        results |= frontier
+    return results
+
+def edit_distance(a: str, b: str, max_distance: int) -> int:
+    """
+    Damerau-Levenshtein (optimal string alignment) distance, abandoned early past max_distance.
+
+    Args:
+        a: First string
+        b: Second string
+        max_distance: Distance beyond which the exact value doesn't matter
+
+    Returns:
+        int: The distance, or max_distance + 1 if it is larger than max_distance
+    """
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    # Shared prefixes and suffixes don't change the distance, and trimming them keeps the table tiny
+    start = 0
+    while start < len(a) and start < len(b) and a[start] == b[start]:
+        start += 1
+    end = 0
+    while end < len(a) - start and end < len(b) - start and a[-1 - end] == b[-1 - end]:
+        end += 1
+    a, b = a[start:len(a) - end], b[start:len(b) - end]
+    if not a or not b:
+        return min(len(a) + len(b), max_distance + 1)
+    previous2, previous = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > max_distance:
+            return max_distance + 1
+        previous2, previous = previous, current
+    return min(previous[-1], max_distance + 1)
+
+def parse_lexicon_csv(text: str) -> dict[str, tuple]:
+    """
+    Reads generic and brand name pairs into lexicon entries.
+
+    Args:
+        text: CSV text with generic_name and brand_name columns
+
+    Returns:
+        dict[str, tuple]: (name, is_generic, generic_names, brand_names) tuples by normalized name
+    """
+    generics: dict[str, set[str]] = {}
+    brands: dict[str, set[str]] = {}
+    for row in csv.DictReader(text.splitlines()):
+        generic = (row.get("generic_name") or "").strip()
+        brand = (row.get("brand_name") or "").strip()
+        if not generic:
+            continue
+        generics.setdefault(generic, set())
+        if brand:
+            generics[generic].add(brand)
+            brands.setdefault(brand, set()).add(generic)
+
+    entries = {}
+    for brand, brand_generics in brands.items():
+        components = tuple(sorted({part.strip() for generic in brand_generics for part in generic.split("+")}))
+        siblings = tuple(sorted({name for generic in brand_generics for name in generics[generic]}))
+        entries[normalize_drug_name(brand)] = (brand, False, components, siblings)
+    # Generics are added last so a name that is both keeps its generic entry
+    for generic, generic_brands in generics.items():
+        components = tuple(part.strip() for part in generic.split("+"))
+        entries[normalize_drug_name(generic)] = (generic, True, components, tuple(sorted(generic_brands)))
+    entries.pop("", None)
+    return entries
+
+def build_delete_index(terms, max_distance: int) -> dict[str, str | tuple]:
+    """
+    Indexes names under every delete within max_distance.
+
+    Most deletes belong to a single name, so those are stored as a bare string
+    rather than a tuple to keep the index small.
+
+    Args:
+        terms: Normalized names
+        max_distance: Maximum number of deleted characters
+
+    Returns:
+        dict[str, str | tuple]: The name, or tuple of names, sharing each delete
+    """
+    index = {}
+    get = index.get
+    for term in terms:
+        for key in deletes(term, max_distance):
+            names = get(key)
+            if names is None:
+                index[key] = term
+            elif isinstance(names, str):
+                index[key] = (names, term)
+            else:
+                index[key] = names + (term,)
+    return index
+
+class DrugLexicon:
+    """
+    Known generic and brand names with a symmetric delete index for fuzzy lookups.
+
+    Every name is indexed under all strings reachable by deleting up to
+    max_distance characters, so a lookup only has to generate the deletes of
+    the query and verify the few names that share one. Building the index is
+    the slow part, so it is saved next to the caches and reused until the
+    source CSV changes.
+
+    Attributes:
+        entries: (name, is_generic, generic_names, brand_names) tuples by normalized name
+        max_distance: Largest edit distance a lookup will match
+        min_length: Shortest name that may be corrected rather than only matched exactly
+        version: Hash of the lexicon's source, so cached results are invalidated when it changes
+    """
+    def __init__(self, entries: dict[str, tuple], index: dict[str, str | tuple], version: str,
+                 max_distance: int = DRUG_LEXICON_MAX_DISTANCE, min_length: int = DRUG_LEXICON_MIN_LENGTH):
+        self.entries = entries
+        self.max_distance = max_distance
+        self.min_length = min_length
+        self.version = version
+        self._index = index
+
+    @classmethod
+    def from_csv(cls, path: str, max_distance: int = DRUG_LEXICON_MAX_DISTANCE,
+                 min_length: int = DRUG_LEXICON_MIN_LENGTH, index_dir: str = CACHE_DIR) -> "DrugLexicon":
+        """
+        Loads a lexicon from a CSV file with generic_name and brand_name columns.
+
+        Each row pairs a generic with one of its brands; the brand may be left
+        empty. Combination generics are written with "+" between components,
+        e.g. "Amoxicillin + Clavulanic Acid".
+
+        Args:
+            path: Path to the CSV file
+            max_distance: Largest edit distance a lookup will match
+            min_length: Shortest name that may be corrected rather than only matched exactly
+            index_dir: Directory the built index is saved to and reused from (None to always rebuild)
+
+        Returns:
+            DrugLexicon: The loaded lexicon
+        """
+        start = time.perf_counter()
+        with open(path, "rb") as f:
+            data = f.read()
+        version = hashlib.sha256(data).hexdigest()[:12]
+        index_path = os.path.join(index_dir, f"drug_lexicon-{version}-{max_distance}-{marshal.version}.marshal") if index_dir else None
+
+        entries = index = None
+        if index_path and os.path.exists(index_path):
+            try:
+                with open(index_path, "rb") as f:
+                    entries, index = marshal.loads(f.read())
+            except (OSError, EOFError, ValueError, TypeError) as e:
+                logger.warning(f"Could not read the saved drug lexicon index, rebuilding it: {e}")
+        if entries is None:
+            entries = parse_lexicon_csv(data.decode("utf-8-sig"))
+            index = build_delete_index(entries, max_distance)
+            if index_path:
+                try:
+                    os.makedirs(index_dir, exist_ok=True)
+                    with open(index_path + ".tmp", "wb") as f:
+                        f.write(marshal.dumps((entries, index)))
+                    os.replace(index_path + ".tmp", index_path)
+                except OSError as e:
+                    logger.warning(f"Could not save the drug lexicon index: {e}")
+
+        logger.info(f"Loaded {len(entries)} drug names from {path} in {time.perf_counter() - start:.2f}s")
+        return cls(entries, index, version, max_distance, min_length)
+
+    def entry(self, term: str) -> LexiconEntry:
+        """
+        Returns the lexicon entry for a normalized name.
+
+        Args:
+            term: Normalized name, as found in entries
+
+        Returns:
+            LexiconEntry: The entry
+        """
+        name, is_generic, generic_names, brand_names = self.entries[term]
+        return LexiconEntry(name, is_generic, list(generic_names), list(brand_names))
+
+    def lookup(self, name: str) -> tuple[list[LexiconEntry], int]:
+        """
+        Finds the lexicon entries closest to a name.
+
+        Args:
+            name: Medicine name as written on the prescription
+
+        Returns:
+            tuple: (list[LexiconEntry], int) with every entry at the smallest distance found and
+                   that distance; the list is empty if nothing is within max_distance
+        """
+        term = normalize_drug_name(name)
+        if term in self.entries:
+            return [self.entry(term)], 0
+        if len(term) < self.min_length:
+            return [], self.max_distance + 1
+
+        best, matches, seen = self.max_distance + 1, [], set()
+        for key in deletes(term, self.max_distance):
+            candidates = self._index.get(key, ())
+            for candidate in (candidates,) if isinstance(candidates, str) else candidates:
+                if candidate in seen:
+                    continue
+                seen.add(candidate)
+                distance = edit_distance(term, candidate, self.max_distance)
+                if distance < best:
+                    best, matches = distance, [candidate]
+                elif distance == best and distance <= self.max_distance:
+                    matches.append(candidate)
+        return [self.entry(match) for match in matches], best
+
+    def spell_check(self, name: str) -> SpellCheck | None:
+        """
+        Spell checks a name locally when the lexicon gives a single unambiguous match.
+
+        Args:
+            name: Medicine name as written on the prescription
+
+        Returns:
+            SpellCheck | None: The result, or None if the name is unknown or ambiguous
+        """
+        matches, distance = self.lookup(name)
+        if len(matches) != 1:
+            return None
+        entry = matches[0]
+        return SpellCheck(
+            input_name=name,
+            corrected_name=name if distance == 0 else entry.name,
+            generic_name=entry.generic_names,
+            brand_names=entry.brand_names,
+            is_correct=distance == 0,
+            is_generic=entry.is_generic,
+            notes="Matched in the local drug lexicon." if distance == 0 else f"Corrected to '{entry.name}' using the local drug lexicon.",
+        )
+
+    def spell_check_names(self, names: list[str]) -> tuple[dict[str, SpellCheck], list[str]]:
+        """
+        Splits medicine names into those answered locally and those that still need Gemini.
+
+        Args:
+            names: Medicine names as written on the prescription
+
+        Returns:
+            tuple: (dict[str, SpellCheck], list[str]) with local results by name and the
+                   unknown or ambiguous names, in their original order
+        """
+        matched, remaining = {}, []
+        for name in dict.fromkeys(names):
+            spell_check = self.spell_check(name)
+            if spell_check is None:
+                remaining.append(name)
+            else:
+                matched[name] = spell_check
+        logger.info(f"Drug lexicon answered {len(matched)} of {len(matched) + len(remaining)} medicines")
+        return matched, remaining
+
+def load_drug_lexicon(path: str = DRUG_LEXICON_PATH) -> DrugLexicon | None:
+    """
+    Loads the configured drug lexicon, if any.
+
+    Args:
+        path: Path to the lexicon CSV; empty to disable local matching
+
+    Returns:
+        DrugLexicon | None: The lexicon, or None if none is configured or it couldn't be read
+    """
+    if not path:
+        return None
+    try:
+        return DrugLexicon.from_csv(path)
+    except OSError as e:
+        logger.warning(f"Could not load the drug lexicon from {path}, spell checking everything with Gemini: {e}")
+        return None
+
+_drug_lexicon = None
+_drug_lexicon_loaded = False
+_drug_lexicon_lock = threading.Lock()
+
+def get_drug_lexicon() -> DrugLexicon | None:
+    """
+    Returns the configured drug lexicon, loading it on first use.
+
+    A lexicon of 100k names takes about a second to load even from its saved
+    index, so it isn't loaded at import; the app loads it at startup instead.
+
+    Returns:
+        DrugLexicon | None: The lexicon, or None if none is configured or it couldn't be read
+    """
+    global _drug_lexicon, _drug_lexicon_loaded
+    if not _drug_lexicon_loaded:
+        with _drug_lexicon_lock:
+            if not _drug_lexicon_loaded:
+                _drug_lexicon = load_drug_lexicon()
+                _drug_lexicon_loaded = True
+    return _drug_lexicon
@@ -0,0 +1,259 @@
+import bisect
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+# Histogram buckets in seconds, from local work to slow grounded Gemini calls
+LATENCY_BUCKETS = (0.005, 0.025, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+
+def format_value(value: float) -> str:
+    """
+    Formats a sample value for the Prometheus text format.
+
+    Args:
+        value: Sample value
+
+    Returns:
+        str: The value, without a fraction for whole numbers
+    """
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+def format_labels(labels: dict) -> str:
+    """
+    Formats a sample's labels for the Prometheus text format.
+
+    Args:
+        labels: Label values by name
+
+    Returns:
+        str: The labels in braces, or "" if there are none
+    """
+    if not labels:
+        return ""
+    escaped = {
+        name: str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        for name, value in labels.items()
+    }
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped.items()) + "}"
+
+class Metric:
+    """
+    A named metric with one value per combination of label values.
+
+    Attributes:
+        name: Metric name as exported
+        help: Description shown by Prometheus
+        labels: Names of the labels every sample must be given
+    """
+    type = "untyped"
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        if set(labels) != set(self.labels):
+            raise ValueError(f"{self.name} takes the labels {self.labels}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def samples(self):
+        """
+        Returns the metric's current samples.
+
+        Returns:
+            list[tuple]: (name suffix, labels, value) per sample
+        """
+        with self._lock:
+            return [("", dict(zip(self.labels, key)), value) for key, value in self._values.items()]
+
+class Counter(Metric):
+    """A value that only goes up, such as a number of calls."""
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+class Gauge(Metric):
+    """A value that goes up and down, such as requests in flight."""
+    type = "gauge"
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def clear(self):
+        """Forgets every sample, e.g. before setting them again from a fresh snapshot."""
+        with self._lock:
+            self._values.clear()
+
+class Histogram(Metric):
+    """
+    Counts observations, such as durations, into cumulative buckets.
+
+    Attributes:
+        buckets: Upper bounds of the buckets, in increasing order
+    """
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = (), buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets) + (math.inf,)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        """Observes how long the block takes, whether or not it raises."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            values = list(self._values.items())
+        for key, (counts, total) in values:
+            labels = dict(zip(self.labels, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                samples.append(("_bucket", {**labels, "le": format_value(bound)}, cumulative))
+            samples.append(("_sum", labels, total))
+            samples.append(("_count", labels, cumulative))
+        return samples
+
+class MetricsRegistry:
+    """
+    The metrics of a process, rendered in the Prometheus text format.
+
+    Values live in the process that recorded them, so with several uvicorn
+    workers each scrape sees the worker that answered it; scrape the workers
+    separately or run one worker per container.
+    """
+    def __init__(self):
+        self._metrics: list[Metric] = []
+        self._collectors = []
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector):
+        """
+        Adds a function called before every render, to update gauges that mirror other state.
+
+        Args:
+            collector: Function taking no arguments
+        """
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        """
+        Returns every metric in the Prometheus text exposition format.
+
+        Returns:
+            str: The exposition, ending with a newline
+        """
+        for collector in self._collectors:
+            collector()
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for suffix, labels, value in metric.samples():
+                lines.append(f"{metric.name}{suffix}{format_labels(labels)} {format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+registry = MetricsRegistry()
+
+stage_duration = registry.register(Histogram(
+    "pharma_stage_duration_seconds", "Time spent in each stage of prescription processing", ("stage",)
+))
+gemini_calls = registry.register(Counter(
+    "pharma_gemini_calls_total", "Gemini calls by model, API key, pipeline stage and outcome",
+    ("model", "key", "stage", "outcome"),
+))
+gemini_call_duration = registry.register(Histogram(
+    "pharma_gemini_call_duration_seconds", "Duration of Gemini calls, to the first chunk for streams",
+    ("model", "stage"),
+))
+gemini_tokens = registry.register(Counter(
+    "pharma_gemini_tokens_total", "Tokens reported in Gemini usage metadata", ("model", "key", "kind")
+))
+gemini_in_flight = registry.register(Gauge(
+    "pharma_gemini_requests_in_flight", "Gemini calls currently using each API key", ("key",)
+))
+http_in_flight = registry.register(Gauge(
+    "pharma_http_requests_in_flight", "HTTP requests currently being handled"
+))
+http_request_duration = registry.register(Histogram(
+    "pharma_http_request_duration_seconds", "Duration of HTTP requests", ("method", "route", "status")
+))
+sessions = registry.register(Gauge(
+    "pharma_sessions", "Sessions held by the session backend"
+))
+session_bytes = registry.register(Gauge(
+    "pharma_session_bytes", "Bytes held by the session backend, where it can tell"
+))
+jobs = registry.register(Gauge(
+    "pharma_jobs", "Background jobs known to this worker by status", ("status",)
+))
+
+def time_stage(stage: str):
+    """
+    Times a pipeline stage into pharma_stage_duration_seconds.
+
+    Args:
+        stage: Stage name, e.g. "ocr_first_pass"
+
+    Returns:
+        A context manager timing its block
+    """
+    return stage_duration.time(stage=stage)
+
+def record_gemini_call(model: str, key: str, stage: str, outcome: str, duration: float = None, response=None):
+    """
+    Counts a finished Gemini call and the tokens it used.
+
+    Args:
+        model: Model the call was made to
+        key: Name of the API key used, never the key itself
+        stage: Pipeline stage the call belongs to
+        outcome: "ok", "rate_limited", "timeout", "error" or "cancelled"
+        duration: Seconds the call took, if it finished
+        response: The response or last stream chunk, to read usage_metadata from
+    """
+    gemini_calls.inc(model=model, key=key, stage=stage, outcome=outcome)
+    if duration is not None:
+        gemini_call_duration.observe(duration, model=model, stage=stage)
+    usage = getattr(response, "usage_metadata", None)
+    for kind, field in (("prompt", "prompt_token_count"), ("output", "candidates_token_count"), ("total", "total_token_count")):
+        count = getattr(usage, field, None)
+        if count:
+            gemini_tokens.inc(count, model=model, key=key, kind=kind)
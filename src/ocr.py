@@ -1,102 +1,198 @@
+import asyncio
+import functools
+import hashlib
 import PIL.Image
 from google import genai
 from google.genai import types
 from google.genai.types import Tool, GenerateContentConfig, GoogleSearch
 import json
+import time
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 import os
+
+# Load settings from the .env file before the modules below read them
+load_dotenv()
+
 from .prompts import *
-from .schema import MedicationResponse, SpellCheckResponse
+from .schema import MedicationResponse, SpellCheck, SpellCheckResponse
 from .exceptions import *
+from .cache import spell_check_cache, result_cache, normalize_drug_name
+from .preprocessing import IMAGE_PREPROCESS, PREPROCESS_VERSION, preprocess_image, sniff_mime_type
+from .parsing import parse_medication_response, parse_spell_check_entries
+from .lexicon import get_drug_lexicon
+from .pages import split_pages
+from .brands import brand_index
+from .clients import gemini_client
+from .metrics import stage_duration, time_stage
 from loguru import logger
 
-class APIKeyRotator:
-    """
-    Rotates through a list of API keys to distribute API usage.
-
-    Attributes:
-        keys: List of API keys to rotate through
-        index: Current index in the rotation
+# The SDK runs each async request on the event loop's default executor, so this
+# bounds how many Gemini calls a single process keeps in flight.
+GEMINI_MAX_WORKERS = int(os.getenv("GEMINI_MAX_WORKERS", "64"))
+# Number of medicine names spell checked at once for a single prescription
+SPELL_CHECK_CONCURRENCY = int(os.getenv("SPELL_CHECK_CONCURRENCY", "5"))
+
+# "per_drug" runs spell check, brand lookup and structuring for each name;
+# "batched" sends every name in one grounded call and only retries failed names per drug
+SPELL_CHECK_MODES = ("per_drug", "batched")
+SPELL_CHECK_MODE = os.getenv("SPELL_CHECK_MODE", "per_drug")
+
+# Models used by each stage of the pipeline
+OCR_MODEL = "gemini-2.0-pro-exp-02-05"
+SPELL_CHECK_MODEL = "gemini-2.0-flash"
+# Only used when the first pass OCR text can't be parsed locally
+STRUCTURING_MODEL = os.getenv("STRUCTURING_MODEL", "gemini-2.0-flash")
+
+# How often two-pass OCR text was structured locally vs. by the fallback model call
+structuring_stats = {"local": 0, "fallback": 0}
+
+# "two_pass" extracts free text with search grounding and then structures it in a
+# second call; "single_pass" asks for MedicationResponse JSON directly in one call
+OCR_MODES = ("two_pass", "single_pass")
+OCR_MODE = os.getenv("OCR_MODE", "two_pass")
+
+# Changes whenever a prompt is edited, so cached results from older prompts are not reused
+PROMPT_VERSION = hashlib.sha256("\0".join([
+    ocr_system_prompt,
+    ocr_structured_output_prompt,
+    ocr_single_pass_prompt,
+    spell_system_prompt,
+    spell_list_brand_name_prompt,
+    spell_structured_output_prompt,
+    spell_batched_prompt,
+]).encode()).hexdigest()[:12]
+
+def use_gemini_executor(max_workers: int = GEMINI_MAX_WORKERS) -> ThreadPoolExecutor:
     """
-    def __init__(self, keys: list[str]):
-        self.keys = keys
-        self.index = 0
-        logger.info(f"APIKeyRotator initialized with {len(keys)} keys")
+    Gives the running event loop a default executor sized for Gemini calls.
 
-    def get_next_key(self) -> str:
-        """
-        Returns the next API key in the rotation.
+    The default one has only a few threads per CPU, which would cap how many
+    Gemini calls are in flight however much concurrency the caller asks for.
 
-        Returns:
-            str: The next API key
-        """
-        key = self.keys[self.index]
-        self.index = (self.index + 1) % len(self.keys)
-        logger.info(f"API key rotated to index {self.index}")
-        return key
+    Args:
+        max_workers: Threads, and so Gemini calls, the loop can have in flight
 
-# Load API keys from .env file
-load_dotenv()
-api_keys = [os.getenv("API_KEY"), os.getenv("API_KEY1"), os.getenv("API_KEY2"), os.getenv("API_KEY3"), os.getenv("API_KEY4")]
-api_key_rotator = APIKeyRotator(api_keys)
+    Returns:
+        ThreadPoolExecutor: The executor, for the caller to shut down when done
+    """
+    executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="gemini")
+    asyncio.get_running_loop().set_default_executor(executor)
+    logger.info(f"Gemini executor started with {max_workers} workers")
+    return executor
 
-def extract_text_from_image(image) -> MedicationResponse:
+def read_image(image) -> tuple[bytes, str]:
     """
-    Sends image to Google Gemini API and retrieves structured medication data.
+    Reads the bytes and MIME type of an uploaded image.
 
     Args:
         image: The prescription image file (can be bytes or file-like object)
 
     Returns:
-        MedicationResponse: A structured response containing medication information
+        tuple: (bytes, str) containing the image bytes and its MIME type
     """
-    logger.info("Extracting text from image")
-    client = genai.Client(api_key=api_key_rotator.get_next_key())
-
-    # Handle both bytes and file-like objects
     if isinstance(image, bytes):
-        image_bytes = image
-        mime_type = "image/jpeg"  # Default to JPEG if unknown
-    else:
-        image_bytes = image.read()
-        mime_type = getattr(image, 'content_type', None) or getattr(image, 'type', 'image/jpeg')
+        return image, sniff_mime_type(image)
+    image_bytes = image.read()
+    mime_type = getattr(image, 'content_type', None) or getattr(image, 'type', 'image/jpeg')
+    return image_bytes, mime_type
 
-    # Create Gemini-compatible format
-    b64_image = types.Part.from_bytes(
-        data=image_bytes,
-        mime_type=mime_type
+def result_cache_key(image_bytes: bytes | list[bytes], page_hashes: list[str] = None) -> str:
+    """
+    Builds the result cache key for an image.
+
+    Args:
+        image_bytes: The prescription image bytes, or the images of each page
+        page_hashes: SHA-256 hex digest of each page, if already known, so the pages aren't hashed again
+
+    Returns:
+        str: SHA-256 of the image combined with the models, OCR mode, prompt
+             version, preprocessing settings, drug lexicon and brand index that produce the result
+    """
+    if page_hashes is None:
+        pages = image_bytes if isinstance(image_bytes, list) else [image_bytes]
+        page_hashes = [hashlib.sha256(page).hexdigest() for page in pages]
+    if len(page_hashes) == 1:
+        image_hash = page_hashes[0]
+    else:
+        # Hash each page separately so page boundaries are part of the key
+        image_hash = hashlib.sha256(b"".join(bytes.fromhex(page_hash) for page_hash in page_hashes)).hexdigest()
+    drug_lexicon = get_drug_lexicon()
+    lexicon_version = drug_lexicon.version if drug_lexicon else "none"
+    brand_index_version = brand_index.version if brand_index else "none"
+    return (
+        f"{image_hash}:{OCR_MODEL}:{OCR_MODE}:{STRUCTURING_MODEL}:{SPELL_CHECK_MODEL}:{SPELL_CHECK_MODE}:"
+        f"{PROMPT_VERSION}:{PREPROCESS_VERSION}:{lexicon_version}:{brand_index_version}"
     )
 
+async def extract_two_pass_async(client, image_part, on_event=None) -> MedicationResponse:
+    """
+    Extracts medication data with a grounded free-text call, then structures the text.
+
+    The text is parsed locally when it already holds the medications as JSON or
+    labelled lines; a STRUCTURING_MODEL call is only made when that fails.
+    When someone listens for events, the first pass is streamed and its text
+    reported as it arrives.
+
+    Args:
+        client: The scheduled Gemini client for the OCR stage
+        image_part: The prescription image as a Gemini content part
+        on_event: Optional callback called as on_event("ocr_text", text) with each piece of streamed text
+
+    Returns:
+        MedicationResponse: A structured response containing medication information
+    """
     google_search_tool = Tool(
         google_search = GoogleSearch()
     )
 
     # First pass: Extract text from image
-    response = client.models.generate_content(
-        model="gemini-2.0-pro-exp-02-05",
-        contents=["this", b64_image],
+    request = dict(
+        model=OCR_MODEL,
+        contents=["this", image_part],
         config=GenerateContentConfig(
             system_instruction=ocr_system_prompt,
             tools=[google_search_tool],
             response_modalities=["TEXT"],
         ),
     )
-    logger.info(f"Text extraction response received: {response.text}")
+    with time_stage("ocr_first_pass"):
+        if on_event:
+            chunks = []
+            async for chunk in await client.aio.models.generate_content_stream(**request):
+                if getattr(chunk, "text", None):
+                    chunks.append(chunk.text)
+                    on_event("ocr_text", chunk.text)
+            text = "".join(chunks)
+        else:
+            response = await client.aio.models.generate_content(**request)
+            text = getattr(response, "text", None)
+    logger.info(f"Text extraction response received: {text}")
 
     # Prevent NoneType errors
-    if not response or not hasattr(response, "text"):
+    if not text:
         logger.warning("No text detected in image")
         return MedicationResponse(medications=[])
 
-    # Second pass: Structure the extracted text
-    response2 = client.models.generate_content(
-        model="gemini-2.0-pro-exp-02-05",
-        contents=[ocr_structured_output_prompt, response.text],
-        config={
-            'response_mime_type': 'application/json',
-            'response_schema': MedicationResponse,
-        },
-    )
+    # Second pass: Structure the extracted text, locally if possible
+    with time_stage("ocr_local_parsing"):
+        local_response = parse_medication_response(text)
+    if local_response is not None:
+        structuring_stats["local"] += 1
+        logger.info(f"Structured OCR text locally: {local_response}")
+        return local_response
+
+    structuring_stats["fallback"] += 1
+    logger.info(f"Falling back to {STRUCTURING_MODEL} for structuring ({structuring_stats})")
+    with time_stage("ocr_structuring"):
+        response2 = await client.for_stage("structuring").aio.models.generate_content(
+            model=STRUCTURING_MODEL,
+            contents=[ocr_structured_output_prompt, text],
+            config={
+                'response_mime_type': 'application/json',
+                'response_schema': MedicationResponse,
+            },
+        )
 
     # Try to parse the structured response
     try:
@@ -110,6 +206,111 @@ def extract_text_from_image(image) -> MedicationResponse:
         logger.error(f"Error parsing structured response: {e}")
         return MedicationResponse(medications=[])
 
+async def extract_single_pass_async(client, image_part) -> MedicationResponse:
+    """
+    Extracts medication data with one call that returns MedicationResponse JSON directly.
+
+    Structured output can't be combined with the search tool, so grounding is
+    left to the spell check stage in this mode.
+
+    Args:
+        client: The Google Gemini client
+        image_part: The prescription image as a Gemini content part
+
+    Returns:
+        MedicationResponse: A structured response containing medication information
+    """
+    with time_stage("ocr_single_pass"):
+        response = await client.aio.models.generate_content(
+            model=OCR_MODEL,
+            contents=[ocr_single_pass_prompt, image_part],
+            config=GenerateContentConfig(
+                system_instruction=ocr_system_prompt,
+                response_mime_type="application/json",
+                response_schema=MedicationResponse,
+            ),
+        )
+
+    if getattr(response, "parsed", None):
+        logger.info(f"Parsed single pass response successfully: {response.parsed}")
+        return response.parsed
+    logger.warning("Failed to parse single pass response")
+    return MedicationResponse(medications=[])
+
+async def extract_text_from_image_async(image, mime_type: str = None, mode: str = None, on_event=None) -> MedicationResponse:
+    """
+    Sends image to Google Gemini API and retrieves structured medication data
+    without blocking the event loop.
+
+    Args:
+        image: The prescription image file (can be bytes or file-like object)
+        mime_type: MIME type of the image, overriding the one read from the file
+        mode: OCR mode, one of OCR_MODES (defaults to OCR_MODE)
+        on_event: Optional callback called with ("ocr_text", text) as two-pass OCR text streams in
+
+    Returns:
+        MedicationResponse: A structured response containing medication information
+    """
+    mode = mode or OCR_MODE
+    if mode not in OCR_MODES:
+        raise ValueError(f"Unknown OCR mode: {mode}")
+    logger.info(f"Extracting text from image ({mode})")
+    client = gemini_client.for_stage("ocr")
+
+    # Handle both bytes and file-like objects
+    image_bytes, image_mime_type = read_image(image)
+    mime_type = mime_type or image_mime_type
+
+    # Shrink the photo off the event loop before uploading it
+    if IMAGE_PREPROCESS:
+        with time_stage("preprocess"):
+            image_bytes, mime_type = await asyncio.to_thread(preprocess_image, image_bytes)
+
+    # Create Gemini-compatible format
+    b64_image = types.Part.from_bytes(
+        data=image_bytes,
+        mime_type=mime_type
+    )
+
+    if mode == "single_pass":
+        return await extract_single_pass_async(client, b64_image)
+    return await extract_two_pass_async(client, b64_image, on_event=on_event)
+
+def extract_text_from_image(image, mode: str = None) -> MedicationResponse:
+    """
+    Synchronous wrapper around extract_text_from_image_async.
+
+    Args:
+        image: The prescription image file (can be bytes or file-like object)
+        mode: OCR mode, one of OCR_MODES (defaults to OCR_MODE)
+
+    Returns:
+        MedicationResponse: A structured response containing medication information
+    """
+    return asyncio.run(extract_text_from_image_async(image, mode=mode))
+
+def merge_medications(responses: list[MedicationResponse]) -> MedicationResponse:
+    """
+    Combines the medications read from several pages of one prescription.
+
+    A medication repeated with the same dosage, e.g. because two photos
+    overlap, is only kept the first time it appears.
+
+    Args:
+        responses: Medication data of each page, in page order
+
+    Returns:
+        MedicationResponse: The medications of all pages without duplicates
+    """
+    medications, seen = [], set()
+    for response in responses:
+        for medication in response.medications:
+            key = (normalize_drug_name(medication.medication_name), " ".join(medication.dosage.lower().split()))
+            if key not in seen:
+                seen.add(key)
+                medications.append(medication)
+    return MedicationResponse(medications=medications)
+
 def get_medicine_names(data: MedicationResponse) -> list[str]:
     """
     Extracts all medication names from a MedicationResponse object.
@@ -123,33 +324,41 @@ def get_medicine_names(data: MedicationResponse) -> list[str]:
     names = [i.medication_name for i in data.medications]
     return names
 
-def spell_check_medicine_names(names: list[str], client) -> SpellCheckResponse:
+async def spell_check_medicine_name_async(name: str, client, on_stage=None, use_brand_index: bool = True) -> SpellCheckResponse:
     """
-    Spell checks medicine names using Google Gemini.
+    Spell checks a single medicine name and looks up its brand names using Google Gemini.
+
+    With the brand index enabled, the spell check is structured first and brand
+    names for known generics come from the index. Only unknown generics go
+    through the grounded brand name call, and their brand names (or that they
+    have none) are added to the index. The first check of an unknown generic
+    therefore costs one structuring call more than without the index (four
+    calls instead of three), and every later check of it one call less (two).
 
     Args:
-        names: List of medicine names to spell check
+        name: Medicine name to spell check
         client: The Google Gemini client
+        on_stage: Optional callback called with the name of each pipeline stage as it starts
+        use_brand_index: Whether brand names may come from the local brand index
 
     Returns:
-        SpellCheckResponse: A structured response containing spell check information
+        SpellCheckResponse: A structured response containing spell check information for the name
     """
-    logger.info(f"Starting spell check for medicines: {names}")
     google_search_tool = Tool(
         google_search = GoogleSearch()
     )
-    for name in names:
-        logger.info(f"Spell checking medicine: {name}")
-        
-        spell_check_response = client.models.generate_content(
-            model="gemini-2.0-flash",
+    logger.info(f"Spell checking medicine: {name}")
+
+    with time_stage("spell_check"):
+        spell_check_response = await client.aio.models.generate_content(
+            model=SPELL_CHECK_MODEL,
             contents=[name],
-        config=GenerateContentConfig(
-            system_instruction=spell_system_prompt,
-            tools=[google_search_tool],
-            response_modalities=["TEXT"],
-        ),
-    )
+            config=GenerateContentConfig(
+                system_instruction=spell_system_prompt,
+                tools=[google_search_tool],
+                response_modalities=["TEXT"],
+            ),
+        )
 
     # Get the initial response text
     if not spell_check_response or not hasattr(spell_check_response, "text"):
@@ -157,40 +366,210 @@ def spell_check_medicine_names(names: list[str], client) -> SpellCheckResponse:
         raise GeminiError("spell check failed")
     logger.info(f"Spell check response: {spell_check_response.text}")
 
+    if use_brand_index and brand_index:
+        if on_stage:
+            on_stage("structuring")
+        with time_stage("spell_structuring"):
+            structured_response = await client.aio.models.generate_content(
+                model=SPELL_CHECK_MODEL,
+                contents=[spell_structured_output_prompt, spell_check_response.text],
+                config={
+                    'response_mime_type': 'application/json',
+                    'response_schema': SpellCheckResponse,
+                },
+            )
+        parsed = getattr(structured_response, "parsed", None)
+        if parsed:
+            with time_stage("brand_index"):
+                # The index waits on SQLite, so it is used off the event loop
+                filled = await asyncio.to_thread(brand_index.fill_many, parsed.drugs)
+            if all(filled):
+                logger.info(f"Brand names for {name} found in the brand index")
+                return SpellCheckResponse(drugs=filled)
+        logger.info(f"Generic for {name} not in the brand index, asking Gemini for brand names")
+
     logger.info("Spell check completed, requesting brand name information")
-    brand_name_response = client.models.generate_content(
-        model="gemini-2.0-flash",
-        contents=[spell_list_brand_name_prompt, spell_check_response.text],
-        config=GenerateContentConfig(
-            tools=[google_search_tool],
-            response_modalities=["TEXT"],
-        ),
-    )
+    with time_stage("brand_lookup"):
+        brand_name_response = await client.aio.models.generate_content(
+            model=SPELL_CHECK_MODEL,
+            contents=[spell_list_brand_name_prompt, spell_check_response.text],
+            config=GenerateContentConfig(
+                tools=[google_search_tool],
+                response_modalities=["TEXT"],
+            ),
+        )
     if not brand_name_response or not hasattr(brand_name_response, "text"):
         logger.error("Brand name retrieval failed - no response text received")
         raise GeminiError("brand name retrieval failed")
     logger.info(f"Brand name response: {brand_name_response.text}")
 
     logger.info("Brand name information received, generating structured response")
+    if on_stage:
+        on_stage("structuring")
     # Structure the response
-    structured_response = client.models.generate_content(
-        model="gemini-2.0-flash",
-        contents=[spell_structured_output_prompt, spell_check_response.text, brand_name_response.text],
-        config={
-            'response_mime_type': 'application/json',
-            'response_schema': SpellCheckResponse,
-        },
-    )
-    logger.info(f"Structured response: {structured_response.parsed}")
+    with time_stage("spell_structuring"):
+        structured_response = await client.aio.models.generate_content(
+            model=SPELL_CHECK_MODEL,
+            contents=[spell_structured_output_prompt, spell_check_response.text, brand_name_response.text],
+            config={
+                'response_mime_type': 'application/json',
+                'response_schema': SpellCheckResponse,
+            },
+        )
 
     # Try to parse the structured response
-    if hasattr(structured_response, "parsed"):
+    if getattr(structured_response, "parsed", None):
         logger.info(f"Successfully generated structured spell check response: {structured_response.parsed}")
+        if use_brand_index and brand_index:
+            await asyncio.to_thread(brand_index.learn, structured_response.parsed.drugs)
         return structured_response.parsed
     else:
         logger.error("Failed to generate structured output")
         raise GeminiError("structured output generation failed")
 
+async def spell_check_batch_async(names: list[str], client, on_stage=None) -> dict[str, SpellCheck]:
+    """
+    Spell checks and looks up brand names for all medicine names in a single grounded call.
+
+    Args:
+        names: Medicine names to spell check
+        client: The Google Gemini client
+        on_stage: Optional callback called with the name of each pipeline stage as it starts
+
+    Returns:
+        dict[str, SpellCheck]: Valid results by the input name they answer; names whose
+                               entry was missing or malformed are left out
+    """
+    google_search_tool = Tool(
+        google_search = GoogleSearch()
+    )
+    logger.info(f"Spell checking medicines in one batch: {names}")
+    with time_stage("spell_check_batch"):
+        response = await client.aio.models.generate_content(
+            model=SPELL_CHECK_MODEL,
+            contents=[spell_batched_prompt, spell_structured_output_prompt, json.dumps(names)],
+            config=GenerateContentConfig(
+                system_instruction=spell_system_prompt,
+                tools=[google_search_tool],
+                response_modalities=["TEXT"],
+            ),
+        )
+    if on_stage:
+        on_stage("structuring")
+
+    requested = {normalize_drug_name(name): name for name in names}
+    results = {}
+    for entry in parse_spell_check_entries(getattr(response, "text", None)):
+        name = requested.get(normalize_drug_name(entry.input_name))
+        if name and name not in results:
+            results[name] = entry.model_copy(update={"input_name": name})
+    if brand_index:
+        # Prefer curated brand names, and remember the ones Gemini found for new generics
+        # The index waits on SQLite, so it is used off the event loop
+        await asyncio.to_thread(brand_index.learn, list(results.values()))
+        filled = await asyncio.to_thread(brand_index.fill_many, list(results.values()))
+        results = {name: indexed or entry for (name, entry), indexed in zip(results.items(), filled)}
+    logger.info(f"Batched spell check answered {len(results)} of {len(names)} medicines")
+    return results
+
+async def spell_check_medicine_names_async(names: list[str], client, on_stage=None, on_event=None,
+                                           mode: str = None) -> SpellCheckResponse:
+    """
+    Spell checks medicine names concurrently using Google Gemini without blocking the event loop.
+
+    Names found in the spell check cache skip Gemini entirely. In batched mode
+    the rest are checked in one call first. Whatever is still unanswered is
+    checked per name, at most SPELL_CHECK_CONCURRENCY at once, and all results
+    are merged into a single response.
+
+    Args:
+        names: List of medicine names to spell check
+        client: The Google Gemini client
+        on_stage: Optional callback called with "structuring" once every name still
+                  being checked has reached that stage, or once all are answered if none needed Gemini
+        on_event: Optional callback called as on_event("spell_check", SpellCheckResponse) with
+                  each name's result as soon as it is known
+        mode: Spell check mode, one of SPELL_CHECK_MODES (defaults to SPELL_CHECK_MODE)
+
+    Returns:
+        SpellCheckResponse: A structured response containing spell check information
+    """
+    mode = mode or SPELL_CHECK_MODE
+    if mode not in SPELL_CHECK_MODES:
+        raise ValueError(f"Unknown spell check mode: {mode}")
+    # Check each distinct name once, keeping the prescription order
+    unique_names = list(dict.fromkeys(names))
+    # The cache waits on SQLite, so it is read and written off the event loop
+    cached = await asyncio.to_thread(spell_check_cache.get_spell_checks, unique_names) if spell_check_cache else {}
+    missing_names = [name for name in unique_names if name not in cached]
+    logger.info(f"Starting spell check for medicines: {missing_names} ({len(cached)} answered from cache)")
+    if on_event:
+        for spell_check in cached.values():
+            on_event("spell_check", SpellCheckResponse(drugs=[spell_check]))
+    semaphore = asyncio.Semaphore(SPELL_CHECK_CONCURRENCY)
+    # Names whose checks haven't reached structuring yet; the stage only advances once none are left
+    unstructured = set()
+    structuring = False
+
+    def start_structuring():
+        # Reported once, whether Gemini, the batch call or the cache answered the names
+        nonlocal structuring
+        if not structuring and on_stage:
+            on_stage("structuring")
+        structuring = True
+
+    def reached_stage(name: str, stage: str = "structuring"):
+        if stage == "structuring" and name in unstructured:
+            unstructured.discard(name)
+            if not unstructured:
+                start_structuring()
+
+    async def check(name: str) -> SpellCheckResponse:
+        async with semaphore:
+            response = await spell_check_medicine_name_async(name, client, on_stage=functools.partial(reached_stage, name))
+        # Also counts checks that finished without reporting the stage
+        reached_stage(name)
+        if on_event:
+            on_event("spell_check", response)
+        return response
+
+    responses = {}
+    if mode == "batched" and missing_names:
+        batch = await spell_check_batch_async(missing_names, client)
+        responses = {name: SpellCheckResponse(drugs=[drug]) for name, drug in batch.items()}
+        if on_event:
+            for response in responses.values():
+                on_event("spell_check", response)
+    retry_names = [name for name in missing_names if name not in responses]
+    unstructured.update(retry_names)
+    responses.update(zip(retry_names, await asyncio.gather(*(check(name) for name in retry_names))))
+    start_structuring()
+    if spell_check_cache:
+        # Only cache unambiguous answers so a hit always maps to exactly one drug
+        await asyncio.to_thread(spell_check_cache.put_spell_checks, {
+            name: response.drugs[0] for name, response in responses.items() if len(response.drugs) == 1
+        })
+
+    drugs = []
+    for name in unique_names:
+        drugs.extend([cached[name]] if name in cached else responses[name].drugs)
+    spell_check_response = SpellCheckResponse(drugs=drugs)
+    logger.info(f"Spell check completed for {len(unique_names)} medicines: {spell_check_response}")
+    return spell_check_response
+
+def spell_check_medicine_names(names: list[str], client) -> SpellCheckResponse:
+    """
+    Synchronous wrapper around spell_check_medicine_names_async.
+
+    Args:
+        names: List of medicine names to spell check
+        client: The Google Gemini client
+
+    Returns:
+        SpellCheckResponse: A structured response containing spell check information
+    """
+    return asyncio.run(spell_check_medicine_names_async(names, client))
+
 def fix_spellings(medication_response: MedicationResponse, spell_check_response: SpellCheckResponse) -> MedicationResponse:
     """
     Updates medication names with corrected spellings.
@@ -210,26 +589,119 @@ def fix_spellings(medication_response: MedicationResponse, spell_check_response:
     logger.info(f"Medication response after spell check: {medication_response}")
     return medication_response
 
-def process_prescription_with_spell_check(image):
+async def process_prescription_with_spell_check_async(image, on_stage=None, force: bool = False, on_event=None,
+                                                      page_hashes: list[str] = None, pages_split: bool = False):
     """
-    Process a prescription image and spell check all extracted medicine names.
+    Process a prescription image and spell check all extracted medicine names
+    without blocking the event loop.
+
+    A prescription may span several photos or a PDF. Every page is OCR'd
+    concurrently, the medications are merged without duplicates and the
+    combined names are spell checked once.
+
+    Results are cached by the images' content, so a re-uploaded photo is
+    answered without any Gemini calls unless force is set. Names the local
+    drug lexicon matches unambiguously are spell checked without Gemini.
 
     Args:
-        image: The prescription image file
+        image: The prescription image file, or a list of images and PDFs in page order
+        on_stage: Optional callback called with "extracting", "spell_checking" and
+                  "structuring" as each pipeline stage starts
+        force: Skip the result cache lookup and process the image again
+        on_event: Optional callback called as on_event(event, data) with partial results:
+                  ("ocr_text", str) as OCR text streams in, ("medications", MedicationResponse)
+                  once OCR is done and ("spell_check", SpellCheckResponse) for each name
+        page_hashes: SHA-256 hex digest of each page image, if already known, e.g. from receiving the upload
+        pages_split: The images are pages already split out by split_pages, so there are no PDFs to split
 
     Returns:
         tuple: (MedicationResponse, SpellCheckResponse) containing the
                fixed medication data and spell check results
     """
-    # First extract medication data from the image
-    medication_data = extract_text_from_image(image)
+    if SPELL_CHECK_MODE not in SPELL_CHECK_MODES:
+        raise ValueError(f"Unknown spell check mode: {SPELL_CHECK_MODE}")
+    start = time.perf_counter()
+    files = [read_image(item) for item in (image if isinstance(image, list) else [image])]
+    if len(files) == 1 and files[0][1] != "application/pdf":
+        pages, mime_type = [files[0][0]], files[0][1]
+    elif pages_split:
+        pages, mime_type = [data for data, _ in files], None
+    else:
+        # Pages are plain bytes from here on, so their MIME types are sniffed
+        pages, mime_type = await asyncio.to_thread(split_pages, [data for data, _ in files]), None
+    if page_hashes is not None and len(page_hashes) != len(pages):
+        page_hashes = None
+    # Hashing the pages and reading the brand index version stay off the event loop
+    cache_key = await asyncio.to_thread(result_cache_key, pages, page_hashes) if result_cache else None
+    if cache_key and not force:
+        # The cache waits on SQLite, so it is read and written off the event loop
+        cached = await asyncio.to_thread(result_cache.get_result, cache_key)
+        if cached:
+            logger.info("Prescription answered from the result cache")
+            if on_event:
+                on_event("medications", cached[0])
+                on_event("spell_check", cached[1])
+            stage_duration.observe(time.perf_counter() - start, stage="prescription")
+            return cached
+
+    # First extract medication data from every page at once
+    if on_stage:
+        on_stage("extracting")
+    with time_stage("ocr"):
+        page_data = await asyncio.gather(*(
+            extract_text_from_image_async(page, mime_type=mime_type, on_event=on_event) for page in pages
+        ))
+    medication_data = page_data[0] if len(page_data) == 1 else merge_medications(page_data)
+    if len(pages) > 1:
+        logger.info(f"Merged {sum(len(data.medications) for data in page_data)} medications from {len(pages)} pages "
+                    f"into {len(medication_data.medications)}")
+    if on_event:
+        on_event("medications", medication_data)
 
     # Get all medicine names
     medicine_names = get_medicine_names(medication_data)
-    client = genai.Client(api_key=api_key_rotator.get_next_key())
-    # Spell check all medicine names
-    spell_check_results = spell_check_medicine_names(medicine_names, client)
+    # Spell check all medicine names, locally where the lexicon is sure
+    if on_stage:
+        on_stage("spell_checking")
+    # Normally loaded at startup already, but loading can take a second so keep it off the event loop
+    drug_lexicon = await asyncio.to_thread(get_drug_lexicon)
+    if drug_lexicon:
+        with time_stage("lexicon"):
+            local_results, remaining_names = drug_lexicon.spell_check_names(medicine_names)
+    else:
+        local_results, remaining_names = {}, medicine_names
+    spell_check_results = SpellCheckResponse(drugs=list(local_results.values()))
+    if on_event and local_results:
+        on_event("spell_check", spell_check_results)
+    if remaining_names:
+        client = gemini_client.for_stage("spell_check")
+        with time_stage("spell_checking"):
+            remote_results = await spell_check_medicine_names_async(
+                remaining_names, client, on_stage=on_stage, on_event=on_event
+            )
+        spell_check_results.drugs.extend(remote_results.drugs)
+    elif on_stage:
+        # The lexicon answered every name, so the checks go straight to structuring
+        on_stage("structuring")
 
     fixed_medication_data = fix_spellings(medication_data, spell_check_results)
 
+    if cache_key:
+        await asyncio.to_thread(result_cache.put_result, cache_key, fixed_medication_data, spell_check_results)
+
+    stage_duration.observe(time.perf_counter() - start, stage="prescription")
     return fixed_medication_data, spell_check_results
+
+def process_prescription_with_spell_check(image, force: bool = False):
+    """
+    Process a prescription image and spell check all extracted medicine names.
+
+    Args:
+        image: The prescription image file, or a list of images and PDFs in page order
+        force: Skip the result cache lookup and process the image again
+
+    Returns:
+        tuple: (MedicationResponse, SpellCheckResponse) containing the
+               fixed medication data and spell check results
+    """
+    return asyncio.run(process_prescription_with_spell_check_async(image, force=force))
@@ -0,0 +1,124 @@
+import io
+import os
+import struct
+from loguru import logger
+from .preprocessing import sniff_mime_type
+
+# Multi-page upload settings
+MAX_PAGES = int(os.getenv("MAX_PAGES", "10"))
+PDF_RENDER_DPI = int(os.getenv("PDF_RENDER_DPI", "200"))
+
+# Marks a stored blob holding several pages rather than a single image
+PAGES_MAGIC = b"PAGES1\n"
+
+def rasterize_pdf(data: bytes, dpi: int = PDF_RENDER_DPI, max_pages: int = MAX_PAGES) -> list[bytes]:
+    """
+    Renders each page of a PDF to a JPEG image.
+
+    Uses the optional pypdfium2 package. Without it the PDF is returned as a
+    single page, which Gemini can still read, but its pages can't be OCR'd
+    concurrently.
+
+    Args:
+        data: PDF bytes
+        dpi: Resolution to render at; 200 keeps handwriting legible
+        max_pages: Pages beyond this are ignored
+
+    Returns:
+        list[bytes]: One JPEG per page, or the PDF itself if it can't be rendered
+    """
+    try:
+        import pypdfium2
+    except ImportError:
+        logger.warning("Install pypdfium2 to OCR PDF pages concurrently; sending the PDF as a single page")
+        return [data]
+
+    try:
+        pdf = pypdfium2.PdfDocument(data)
+    except pypdfium2.PdfiumError as e:
+        logger.warning(f"Could not open the PDF, sending it unchanged: {e}")
+        return [data]
+    try:
+        pages = []
+        for index in range(min(len(pdf), max_pages)):
+            image = pdf[index].render(scale=dpi / 72).to_pil()
+            with image:
+                buffer = io.BytesIO()
+                image.convert("RGB").save(buffer, format="JPEG", quality=90)
+            pages.append(buffer.getvalue())
+        if len(pdf) > max_pages:
+            logger.warning(f"PDF has {len(pdf)} pages, only the first {max_pages} are processed")
+        return pages
+    finally:
+        pdf.close()
+
+def split_pages(files: list[bytes], max_pages: int = MAX_PAGES) -> list[bytes]:
+    """
+    Turns uploaded files into the page images to OCR, rendering PDFs page by page.
+
+    Args:
+        files: Uploaded images and PDFs, in page order
+        max_pages: Pages beyond this are ignored
+
+    Returns:
+        list[bytes]: Page images in order
+    """
+    pages = []
+    for data in files:
+        if sniff_mime_type(data) == "application/pdf":
+            pages.extend(rasterize_pdf(data, max_pages=max_pages))
+        else:
+            pages.append(data)
+    if len(pages) > max_pages:
+        logger.warning(f"Prescription has {len(pages)} pages, only the first {max_pages} are processed")
+    return pages[:max_pages]
+
+def pack_pages(pages: list[bytes]) -> bytes:
+    """
+    Combines page images into one blob for session storage.
+
+    A single page is stored as is, so existing sessions and image endpoints keep
+    working, unless it starts like a blob itself.
+
+    Args:
+        pages: Page images in order
+
+    Returns:
+        bytes: The blob
+    """
+    if len(pages) == 1 and not pages[0].startswith(PAGES_MAGIC):
+        return pages[0]
+    header = struct.pack(f">I{len(pages)}I", len(pages), *(len(page) for page in pages))
+    return PAGES_MAGIC + header + b"".join(pages)
+
+def unpack_pages(blob: bytes) -> list[bytes]:
+    """
+    Splits a blob made by pack_pages back into page images.
+
+    Args:
+        blob: Stored blob, or a single image
+
+    Returns:
+        list[bytes]: Page images in order
+
+    Raises:
+        ValueError: The blob's header or page lengths don't match its size
+    """
+    if not blob.startswith(PAGES_MAGIC):
+        return [blob]
+    offset = len(PAGES_MAGIC)
+    if len(blob) < offset + 4:
+        raise ValueError("Page blob is too short for its header")
+    (count,) = struct.unpack_from(">I", blob, offset)
+    offset += 4
+    if count == 0 or len(blob) < offset + 4 * count:
+        raise ValueError(f"Page blob header declares {count} pages but is only {len(blob)} bytes long")
+    sizes = struct.unpack_from(f">{count}I", blob, offset)
+    offset += 4 * count
+    if offset + sum(sizes) != len(blob):
+        raise ValueError(f"Page blob holds {len(blob) - offset} bytes of pages, its header declares {sum(sizes)}")
+    pages = []
+    for size in sizes:
+        pages.append(blob[offset:offset + size])
+        offset += size
+    return pages
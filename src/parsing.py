@@ -0,0 +1,181 @@
+import json
+import re
+from pydantic import ValidationError
+from loguru import logger
+from .schema import MedicationResponse, SpellCheck
+
+# Fenced code blocks, preferring ones tagged as JSON
+FENCED_BLOCK = re.compile(r"```(json)?[ \t]*\n(.*?)```", re.DOTALL | re.IGNORECASE)
+
+# "Key: value" labels in line-oriented output, mapped to MedicationResponse fields
+LINE_FIELDS = {
+    "medication name": "medication_name",
+    "medication": "medication_name",
+    "name": "medication_name",
+    "dosage": "dosage",
+    "quantity": "quantity",
+    "quantity to be ordered": "quantity",
+    "how": "how",
+    "how to take": "how",
+    "how much": "how_much",
+    "how much to take": "how_much",
+    "when": "when",
+    "when to take": "when",
+}
+LINE_PATTERN = re.compile(r"^[\s>*\-•\d.)]*\**\s*([A-Za-z ]+?)\s*\**\s*:\s*\**\s*(.*?)\s*$")
+
+def extract_json_candidates(text: str) -> list[str]:
+    """
+    Finds the pieces of a model response that may hold JSON.
+
+    Args:
+        text: Model response text
+
+    Returns:
+        list[str]: JSON-tagged fenced blocks first, then other fenced blocks, then the
+                   outermost {...} span of the whole text
+    """
+    tagged, untagged = [], []
+    for match in FENCED_BLOCK.finditer(text):
+        (tagged if match.group(1) else untagged).append(match.group(2))
+    candidates = tagged + untagged
+    start, end = text.find("{"), text.rfind("}")
+    if start != -1 and end > start:
+        candidates.append(text[start:end + 1])
+    return candidates
+
+def coerce_quantity(value) -> int | None:
+    """
+    Turns a quantity such as "30 tablets" into the integer the schema expects.
+
+    Args:
+        value: Quantity as written by the model
+
+    Returns:
+        int | None: The first whole number in the value, or None if there is none
+    """
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+    match = re.search(r"\d+", str(value))
+    return int(match.group()) if match else None
+
+def coerce_medications(data) -> MedicationResponse | None:
+    """
+    Validates decoded JSON as a MedicationResponse, fixing the quantity format on the way.
+
+    Args:
+        data: Decoded JSON, either {"medications": [...]} or a bare list of medications
+
+    Returns:
+        MedicationResponse | None: The validated response, or None if it doesn't fit the schema
+    """
+    if isinstance(data, list):
+        data = {"medications": data}
+    if not isinstance(data, dict) or not isinstance(data.get("medications"), list):
+        return None
+    for medication in data["medications"]:
+        if isinstance(medication, dict) and "quantity" in medication:
+            quantity = coerce_quantity(medication["quantity"])
+            if quantity is None:
+                return None
+            medication["quantity"] = quantity
+    try:
+        return MedicationResponse.model_validate(data)
+    except ValidationError:
+        return None
+
+def parse_medication_lines(text: str) -> MedicationResponse | None:
+    """
+    Parses line-oriented "Medication Name: ...", "Dosage: ..." output into a MedicationResponse.
+
+    A new medication starts at every medication name line.
+
+    Args:
+        text: Model response text
+
+    Returns:
+        MedicationResponse | None: The parsed response, or None if no complete medication was found
+    """
+    records, current = [], None
+    for line in text.splitlines():
+        match = LINE_PATTERN.match(line)
+        if not match:
+            continue
+        field = LINE_FIELDS.get(match.group(1).strip().lower())
+        value = match.group(2).strip().strip("*").strip()
+        if not field or not value:
+            continue
+        if field == "medication_name":
+            current = {"medication_name": value}
+            records.append(current)
+        elif current is not None:
+            current.setdefault(field, value)
+
+    medications = []
+    for record in records:
+        if not all(key in record for key in ("dosage", "quantity", "how", "how_much", "when")):
+            return None
+        medications.append({
+            "medication_name": record["medication_name"],
+            "dosage": record["dosage"],
+            "quantity": record["quantity"],
+            "instructions": {"how": record["how"], "how_much": record["how_much"], "when": record["when"]},
+        })
+    return coerce_medications(medications) if medications else None
+
+def parse_medication_response(text: str) -> MedicationResponse | None:
+    """
+    Tries to build a MedicationResponse from free-text OCR output without another model call.
+
+    Args:
+        text: First pass OCR response text
+
+    Returns:
+        MedicationResponse | None: The parsed response, or None if the text couldn't be parsed
+    """
+    if not text:
+        return None
+    for candidate in extract_json_candidates(text):
+        try:
+            data = json.loads(candidate)
+        except json.JSONDecodeError:
+            continue
+        response = coerce_medications(data)
+        if response is not None:
+            return response
+    response = parse_medication_lines(text)
+    if response is None:
+        logger.info("Could not parse OCR text locally")
+    return response
+
+def parse_spell_check_entries(text: str) -> list[SpellCheck]:
+    """
+    Extracts the valid spell check entries from a free-text model response.
+
+    Entries are validated one at a time, so a single malformed drug doesn't
+    discard the others.
+
+    Args:
+        text: Model response text holding {"drugs": [...]} JSON
+
+    Returns:
+        list[SpellCheck]: The entries that fit the schema
+    """
+    for candidate in extract_json_candidates(text or ""):
+        try:
+            data = json.loads(candidate)
+        except json.JSONDecodeError:
+            continue
+        drugs = data.get("drugs") if isinstance(data, dict) else data
+        if not isinstance(drugs, list):
+            continue
+        entries = []
+        for drug in drugs:
+            try:
+                entries.append(SpellCheck.model_validate(drug))
+            except ValidationError:
+                logger.warning(f"Discarding invalid spell check entry: {drug}")
+        return entries
+    return []
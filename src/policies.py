@@ -0,0 +1,122 @@
+import asyncio
+import os
+import random
+import statistics
+from collections import deque
+from .keys import is_rate_limited
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+try:
+    import requests
+except ImportError:
+    requests = None
+
+# Latencies kept per stage to estimate the p95 hedging delay from
+LATENCY_WINDOW = 100
+# Latencies needed before the observed p95 replaces the configured hedging delay
+MIN_LATENCY_SAMPLES = 20
+
+def is_retryable(error: BaseException) -> bool:
+    """
+    Tells whether a failed Gemini call is worth trying again.
+
+    Args:
+        error: Exception raised by the call
+
+    Returns:
+        bool: True for timeouts, connection errors, rate limits and server errors
+    """
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError, ConnectionError)):
+        return True
+    if httpx is not None and isinstance(error, httpx.TransportError):
+        return True
+    if requests is not None and isinstance(error, (requests.ConnectionError, requests.Timeout)):
+        return True
+    code = getattr(error, "code", None)
+    return is_rate_limited(error) or (isinstance(code, int) and code >= 500)
+
+class CallPolicy:
+    """
+    Timeouts, retries and hedging for the Gemini calls of one pipeline stage.
+
+    Settings are read from GEMINI_<STAGE>_<SETTING> environment variables,
+    e.g. GEMINI_OCR_TIMEOUT, falling back to the defaults given.
+
+    Attributes:
+        stage: Pipeline stage the policy applies to
+        timeout: Seconds a single attempt may take
+        deadline: Seconds all attempts together may take
+        attempts: Maximum number of attempts
+        backoff: Base delay in seconds before a retry; doubles with each retry, with full jitter
+        max_backoff: Longest delay before a retry
+        hedge: Whether a slow attempt gets a duplicate on another key, the first answer winning
+        hedge_delay: Seconds before hedging until enough latencies are known to use their p95
+    """
+    def __init__(self, stage: str, timeout: float, deadline: float, attempts: int = 3, backoff: float = 1.0,
+                 max_backoff: float = 20.0, hedge: bool = False, hedge_delay: float = 10.0):
+        prefix = f"GEMINI_{stage.upper()}_"
+        self.stage = stage
+        self.timeout = float(os.getenv(prefix + "TIMEOUT", str(timeout)))
+        self.deadline = float(os.getenv(prefix + "DEADLINE", str(deadline)))
+        self.attempts = int(os.getenv(prefix + "ATTEMPTS", str(attempts)))
+        self.backoff = float(os.getenv(prefix + "BACKOFF", str(backoff)))
+        self.max_backoff = float(os.getenv(prefix + "MAX_BACKOFF", str(max_backoff)))
+        self.hedge = os.getenv(prefix + "HEDGE", str(hedge)).lower() == "true"
+        self.hedge_delay = float(os.getenv(prefix + "HEDGE_DELAY", str(hedge_delay)))
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.failures = 0
+
+    def backoff_delay(self, attempt: int) -> float:
+        """
+        Returns how long to wait before retrying.
+
+        Args:
+            attempt: Number of the attempt that just failed, starting at 1
+
+        Returns:
+            float: A random delay up to the exponential backoff for this attempt
+        """
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** (attempt - 1)))
+
+    def current_hedge_delay(self) -> float:
+        """
+        Returns how long to wait for an attempt before hedging it.
+
+        Returns:
+            float: The p95 of recent successful attempts, or hedge_delay until enough are known
+        """
+        if len(self.latencies) < MIN_LATENCY_SAMPLES:
+            return self.hedge_delay
+        return statistics.quantiles(self.latencies, n=20)[-1]
+
+    def stats(self) -> dict:
+        """
+        Returns latency and retry counters for the stage.
+
+        Returns:
+            dict: Latency percentiles, retries, hedges and failed calls
+        """
+        latencies = list(self.latencies)
+        return {
+            "latency_p50": statistics.median(latencies) if latencies else None,
+            "latency_p95": statistics.quantiles(latencies, n=20)[-1] if len(latencies) > 1 else None,
+            "hedge_delay": self.current_hedge_delay() if self.hedge else None,
+            "retries": self.retries,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "failures": self.failures,
+        }
+
+# OCR runs on the pro model, whose quota is too small to spend on hedging
+call_policies = {
+    "ocr": CallPolicy("ocr", timeout=90, deadline=180, hedge=False, hedge_delay=30),
+    "structuring": CallPolicy("structuring", timeout=30, deadline=60, hedge=True, hedge_delay=10),
+    "spell_check": CallPolicy("spell_check", timeout=45, deadline=120, hedge=True, hedge_delay=15),
+}
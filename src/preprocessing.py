@@ -0,0 +1,81 @@
+import io
+import os
+import PIL.Image
+import PIL.ImageOps
+from loguru import logger
+
+# Image preprocessing settings
+IMAGE_PREPROCESS = os.getenv("IMAGE_PREPROCESS", "true").lower() == "true"
+IMAGE_MAX_EDGE = int(os.getenv("IMAGE_MAX_EDGE", "2048"))
+IMAGE_GRAYSCALE = os.getenv("IMAGE_GRAYSCALE", "true").lower() == "true"
+IMAGE_JPEG_QUALITY = int(os.getenv("IMAGE_JPEG_QUALITY", "85"))
+
+# Identifies the settings above, so results for differently preprocessed images are cached apart
+PREPROCESS_VERSION = f"{IMAGE_PREPROCESS}:{IMAGE_MAX_EDGE}:{IMAGE_GRAYSCALE}:{IMAGE_JPEG_QUALITY}"
+
+def sniff_mime_type(data: bytes, default: str = "image/jpeg") -> str:
+    """
+    Detects an image's MIME type from its leading bytes.
+
+    Args:
+        data: Image bytes
+        default: MIME type to return when the format is not recognized
+
+    Returns:
+        str: The detected MIME type
+    """
+    if data[:3] == b"\xff\xd8\xff":
+        return "image/jpeg"
+    if data[:8] == b"\x89PNG\r\n\x1a\n":
+        return "image/png"
+    if data[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    if data[4:8] == b"ftyp" and data[8:12] in (b"heic", b"heix", b"mif1", b"msf1"):
+        return "image/heic"
+    if data[:4] == b"%PDF":
+        return "application/pdf"
+    return default
+
+def preprocess_image(image_bytes: bytes, max_edge: int = IMAGE_MAX_EDGE, grayscale: bool = IMAGE_GRAYSCALE,
+                     quality: int = IMAGE_JPEG_QUALITY) -> tuple[bytes, str]:
+    """
+    Shrinks a prescription photo before it is sent to Gemini.
+
+    Applies the EXIF orientation, downscales so the longest edge is at most
+    max_edge, optionally converts to grayscale and re-encodes as JPEG. The
+    original is returned unchanged if it can't be decoded or re-encoding
+    wouldn't make it smaller.
+
+    Args:
+        image_bytes: Original image bytes
+        max_edge: Longest edge in pixels after downscaling
+        grayscale: Whether to drop colour information
+        quality: JPEG quality; 85 keeps handwriting strokes legible
+
+    Returns:
+        tuple: (bytes, str) containing the image bytes to send and their MIME type
+    """
+    mime_type = sniff_mime_type(image_bytes)
+    try:
+        with PIL.Image.open(io.BytesIO(image_bytes)) as image:
+            original_size = image.size
+            image = PIL.ImageOps.exif_transpose(image)
+            image = image.convert("L" if grayscale else "RGB")
+            image.thumbnail((max_edge, max_edge), PIL.Image.Resampling.LANCZOS)
+            output = io.BytesIO()
+            image.save(output, format="JPEG", quality=quality, optimize=True)
+    except Exception as e:
+        logger.warning(f"Could not preprocess image, sending it unchanged: {e}")
+        return image_bytes, mime_type
+
+    processed = output.getvalue()
+    if len(processed) >= len(image_bytes) and image.size == original_size:
+        logger.info(f"Preprocessing would not shrink the {len(image_bytes)} byte image, sending it unchanged")
+        return image_bytes, mime_type
+    logger.info(
+        f"Preprocessed image from {original_size[0]}x{original_size[1]} ({len(image_bytes)} bytes) "
+        f"to {image.size[0]}x{image.size[1]} ({len(processed)} bytes)"
+    )
+    return processed, "image/jpeg"
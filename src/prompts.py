@@ -116,6 +116,10 @@ spell_structured_output_prompt = r"""Provide all the above responses in the foll
 ---
 
 """
+
+## Batched Spell Check
+spell_batched_prompt=r"For each medicine name in the following list, check its spelling as instructed and list all known brand names under which the drug is marketed in India. Use grounding with Google search for each drug name to ensure accuracy. Return exactly one entry per input name, using the input name exactly as given for input_name."
+
 # OCR
 
 ## System Prompt for OCR
@@ -348,4 +352,7 @@ Sertraline 50mg, take 1 tablet every morning (p.o.)
 
 ---"""
 
-ocr_structured_output_prompt="""Provide only the json output"""
\ No newline at end of file
+ocr_structured_output_prompt="""Provide only the json output"""
+
+## Single Pass Structured Output
+ocr_single_pass_prompt="""Extract every medication on this prescription and provide only the json output"""
@@ -0,0 +1,160 @@
+import gzip
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from .schema import MedicationResponse, SpellCheckResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Result payload settings
+RESULT_GZIP_MIN_BYTES = int(os.getenv("RESULT_GZIP_MIN_BYTES", "1024"))
+RESULT_GZIP_CACHE_SIZE = int(os.getenv("RESULT_GZIP_CACHE_SIZE", "256"))
+
+# Parts of the combined result, each encoded once and served alone by the older endpoints
+RESULT_VIEWS = {
+    "result": ("medications", "spell_check"),
+    "medications": ("medications",),
+    "spell_check": ("spell_check",),
+}
+
+def dumps(value) -> str:
+    """
+    Encodes a value as compact JSON, with orjson when it is installed.
+
+    Args:
+        value: JSON-serializable value
+
+    Returns:
+        str: The JSON text
+    """
+    if orjson is not None:
+        return orjson.dumps(value).decode()
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+def medication_rows(final_data: MedicationResponse) -> list[dict]:
+    """
+    Lays out medications as the rows of the prescription table.
+
+    Args:
+        final_data: Medications after spell check
+
+    Returns:
+        list[dict]: One row per medication, keyed by column title
+    """
+    return [
+        {
+            "Medication Name": med.medication_name,
+            "Dosage": med.dosage,
+            "Quantity": med.quantity,
+            "How to Take": med.instructions.how,
+            "How Much": med.instructions.how_much,
+            "When to Take": med.instructions.when,
+        }
+        for med in final_data.medications
+    ]
+
+def spell_check_rows(spell_check_data: SpellCheckResponse) -> list[dict]:
+    """
+    Lays out spell check results as the rows of the spell check table.
+
+    Args:
+        spell_check_data: Spell check results
+
+    Returns:
+        list[dict]: One row per medicine, keyed by column title
+    """
+    return [
+        {
+            "Original Name": drug.input_name,
+            "Corrected Name": drug.corrected_name,
+            "Generic Names": ", ".join(drug.generic_name),
+            "Brand Names": ", ".join(drug.brand_names),
+            "Correctly Spelled": "✓" if drug.is_correct else "✗",
+            "Is Generic": "Yes" if drug.is_generic else "No",
+            "Notes": drug.notes,
+        }
+        for drug in spell_check_data.drugs
+    ]
+
+def encode_result(final_data: MedicationResponse | None, spell_check_data: SpellCheckResponse | None) -> dict:
+    """
+    Encodes a prescription's tables once, when the result is produced.
+
+    The encoded parts are plain strings, so every session backend can store
+    them, and every view of the result is served by joining them.
+
+    Args:
+        final_data: Medications after spell check, if any
+        spell_check_data: Spell check results, if any
+
+    Returns:
+        dict: JSON text of each part ("medications", "spell_check"; None where there is no data)
+              and the ETag of each view in RESULT_VIEWS under "etags"
+    """
+    parts = {
+        "medications": dumps(medication_rows(final_data)) if final_data is not None else None,
+        "spell_check": dumps(spell_check_rows(spell_check_data)) if spell_check_data is not None else None,
+    }
+    etags = {}
+    for view, names in RESULT_VIEWS.items():
+        digest = hashlib.sha256()
+        for name in names:
+            digest.update(name.encode() + b"\0" + (parts[name] or "null").encode() + b"\0")
+        etags[view] = f'"{digest.hexdigest()[:32]}"'
+    return {**parts, "etags": etags}
+
+def gzip_etag(etag: str) -> str:
+    """
+    Builds the ETag of a result's gzipped body, which differs from the plain body's as RFC 9110 requires.
+
+    Args:
+        etag: Quoted ETag of the plain body
+
+    Returns:
+        str: The quoted ETag with a "-gz" suffix
+    """
+    return etag[:-1] + '-gz"'
+
+def result_body(result: dict, view: str) -> bytes:
+    """
+    Joins the encoded parts of a result into the body of one view, without encoding anything again.
+
+    Args:
+        result: Output of encode_result
+        view: One of RESULT_VIEWS
+
+    Returns:
+        bytes: JSON object holding the view's parts
+    """
+    members = ",".join(f'"{name}":{result[name] or "null"}' for name in RESULT_VIEWS[view])
+    return ("{" + members + "}").encode()
+
+_gzipped: OrderedDict[str, bytes] = OrderedDict()
+_gzipped_lock = threading.Lock()
+
+def gzip_body(etag: str, body: bytes) -> bytes:
+    """
+    Compresses a result body once per ETag, keeping the most recently used ones.
+
+    Args:
+        etag: ETag of the body, which identifies its content
+        body: The body to compress
+
+    Returns:
+        bytes: The gzipped body
+    """
+    with _gzipped_lock:
+        if etag in _gzipped:
+            _gzipped.move_to_end(etag)
+            return _gzipped[etag]
+    compressed = gzip.compress(body, compresslevel=6, mtime=0)
+    with _gzipped_lock:
+        _gzipped[etag] = compressed
+        while len(_gzipped) > RESULT_GZIP_CACHE_SIZE:
+            _gzipped.popitem(last=False)
+    return compressed
@@ -0,0 +1,820 @@
+import asyncio
+import json
+from abc import ABC, abstractmethod
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from loguru import logger
+from pydantic import BaseModel
+from .schema import MedicationResponse, SpellCheckResponse
+from .cache import CACHE_DIR
+
+# Session store settings
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "memory")
+SESSION_TTL = float(os.getenv("SESSION_TTL", str(6 * 3600)))
+SESSION_MAX_BYTES = int(os.getenv("SESSION_MAX_BYTES", str(512 * 1024 * 1024)))
+SESSION_SWEEP_INTERVAL = float(os.getenv("SESSION_SWEEP_INTERVAL", "60"))
+SESSION_DB_PATH = os.getenv("SESSION_DB_PATH", os.path.join(CACHE_DIR, "sessions.sqlite3"))
+SESSION_REDIS_URL = os.getenv("SESSION_REDIS_URL", "redis://localhost:6379/0")
+
+# Session fields stored as pydantic models, and the model each one is loaded back into
+SESSION_MODELS = {
+    "final_data": MedicationResponse,
+    "spell_check_data": SpellCheckResponse,
+}
+
+# Keep the SQLite backend's entry and byte totals current on every write, from any worker
+SQLITE_TOTALS_TRIGGERS = [
+    "CREATE TRIGGER IF NOT EXISTS sessions_inserted AFTER INSERT ON sessions BEGIN "
+    "UPDATE session_totals SET entries = entries + 1, bytes = bytes + LENGTH(NEW.data); END",
+    "CREATE TRIGGER IF NOT EXISTS sessions_updated AFTER UPDATE OF data ON sessions BEGIN "
+    "UPDATE session_totals SET bytes = bytes + LENGTH(NEW.data) - LENGTH(OLD.data); END",
+    "CREATE TRIGGER IF NOT EXISTS sessions_deleted AFTER DELETE ON sessions BEGIN "
+    "UPDATE session_totals SET entries = entries - 1, bytes = bytes - LENGTH(OLD.data); END",
+    "CREATE TRIGGER IF NOT EXISTS session_images_inserted AFTER INSERT ON session_images BEGIN "
+    "UPDATE session_totals SET bytes = bytes + LENGTH(NEW.image); END",
+    "CREATE TRIGGER IF NOT EXISTS session_images_deleted AFTER DELETE ON session_images BEGIN "
+    "UPDATE session_totals SET bytes = bytes - LENGTH(OLD.image); END",
+]
+
+# Writes a Redis session, updates the index and totals, and evicts the least recently used sessions over budget.
+# KEYS: session, image, index, sizes, totals. ARGV: session ID, data, image, mode ("image", "data" or "update"),
+# TTL, now, byte budget, session key prefix, image key prefix. Returns the sessions evicted, or -1 if an
+# updated session no longer exists.
+REDIS_STORE_SCRIPT = """
+local id, data, image, mode = ARGV[1], ARGV[2], ARGV[3], ARGV[4]
+local ttl, budget = tonumber(ARGV[5]), tonumber(ARGV[7])
+if mode == 'update' and redis.call('EXISTS', KEYS[1]) == 0 then
+    return -1
+end
+redis.call('SET', KEYS[1], data, 'EX', ttl)
+local size = #data
+if mode == 'image' then
+    redis.call('SET', KEYS[2], image, 'EX', ttl)
+    size = size + #image
+elseif mode == 'update' then
+    size = size + redis.call('STRLEN', KEYS[2])
+    redis.call('EXPIRE', KEYS[2], ttl)
+else
+    redis.call('DEL', KEYS[2])
+end
+local previous = tonumber(redis.call('HGET', KEYS[4], id) or '0')
+redis.call('HSET', KEYS[4], id, size)
+redis.call('ZADD', KEYS[3], ARGV[6], id)
+local total = redis.call('HINCRBY', KEYS[5], 'bytes', size - previous)
+local evicted = 0
+while total > budget do
+    local oldest = redis.call('ZRANGE', KEYS[3], 0, 0)[1]
+    if oldest == nil or oldest == id then
+        break
+    end
+    total = redis.call('HINCRBY', KEYS[5], 'bytes', -tonumber(redis.call('HGET', KEYS[4], oldest) or '0'))
+    redis.call('DEL', ARGV[8] .. oldest, ARGV[9] .. oldest)
+    redis.call('ZREM', KEYS[3], oldest)
+    redis.call('HDEL', KEYS[4], oldest)
+    evicted = evicted + 1
+end
+if evicted > 0 then
+    redis.call('HINCRBY', KEYS[5], 'evictions', evicted)
+end
+return evicted
+"""
+
+# Removes Redis sessions and takes them off the index and totals.
+# KEYS: index, sizes, totals. ARGV: session key prefix, image key prefix, totals counter to add the removed
+# sessions to ("" for none), then the session IDs. Returns the sessions removed.
+REDIS_REMOVE_SCRIPT = """
+local removed = 0
+for i = 4, #ARGV do
+    local id = ARGV[i]
+    redis.call('DEL', ARGV[1] .. id, ARGV[2] .. id)
+    if redis.call('ZREM', KEYS[1], id) == 1 then
+        redis.call('HINCRBY', KEYS[3], 'bytes', -tonumber(redis.call('HGET', KEYS[2], id) or '0'))
+        redis.call('HDEL', KEYS[2], id)
+        removed = removed + 1
+    end
+end
+if ARGV[3] ~= '' and removed > 0 then
+    redis.call('HINCRBY', KEYS[3], ARGV[3], removed)
+end
+return removed
+"""
+
+def serialize_session(data: dict) -> str:
+    """
+    Encodes session fields as JSON for backends that store them outside the process.
+
+    Args:
+        data: Session fields
+
+    Returns:
+        str: JSON document
+    """
+    return json.dumps({
+        key: value.model_dump() if isinstance(value, BaseModel) else value
+        for key, value in data.items()
+    })
+
+def deserialize_session(text: str) -> dict:
+    """
+    Decodes session fields written by serialize_session.
+
+    Args:
+        text: JSON document
+
+    Returns:
+        dict: Session fields, with pydantic models restored
+    """
+    data = json.loads(text)
+    for key, model in SESSION_MODELS.items():
+        if data.get(key) is not None:
+            data[key] = model.model_validate(data[key])
+    return data
+
+def estimate_size(data: dict, image: bytes | None) -> int:
+    """
+    Estimates the memory a session holds, dominated by the image bytes.
+
+    Args:
+        data: Session fields
+        image: Prescription image bytes, if any
+
+    Returns:
+        int: Approximate size in bytes
+    """
+    size = len(image) if image else 0
+    for value in data.values():
+        if isinstance(value, BaseModel):
+            size += len(value.model_dump_json())
+        elif value is not None:
+            size += len(json.dumps(value, default=str))
+    return size
+
+class SessionBackend(ABC):
+    """
+    Interface shared by the session backends.
+
+    Session fields are kept apart from the image bytes, so reading a session's
+    fields never loads its image. Backends also keep the status of background
+    jobs, so any worker can answer a status poll.
+
+    Attributes:
+        ttl: Seconds a session is kept after it was last used
+        sweep_interval: Seconds between background sweeps for expired sessions
+        blocking_io: Whether calls wait on disk or network I/O, so async code should make them from a worker thread
+    """
+    blocking_io = True
+
+    def __init__(self, ttl: float = SESSION_TTL, sweep_interval: float = SESSION_SWEEP_INTERVAL):
+        self.ttl = ttl
+        self.sweep_interval = sweep_interval
+        self._sweeper = None
+
+    def __contains__(self, session_id: str) -> bool:
+        return self.get(session_id) is not None
+
+    @abstractmethod
+    def put(self, session_id: str, data: dict, image: bytes | None = None):
+        """
+        Stores a session.
+
+        Args:
+            session_id: Unique session identifier
+            data: Session fields
+            image: Prescription image bytes, if any
+        """
+
+    @abstractmethod
+    def get(self, session_id: str) -> dict | None:
+        """
+        Returns a session's fields, refreshing its TTL.
+
+        Args:
+            session_id: Unique session identifier
+
+        Returns:
+            dict | None: The session fields, or None if unknown or expired
+        """
+
+    @abstractmethod
+    def get_image(self, session_id: str) -> bytes | None:
+        """
+        Returns a session's image bytes.
+
+        Args:
+            session_id: Unique session identifier
+
+        Returns:
+            bytes | None: The image, or None if the session is unknown or has no image
+        """
+
+    @abstractmethod
+    def has_image(self, session_id: str) -> bool:
+        """
+        Checks whether a session holds an image.
+
+        Args:
+            session_id: Unique session identifier
+
+        Returns:
+            bool: True if the session exists and has an image
+        """
+
+    @abstractmethod
+    def update(self, session_id: str, fields: dict) -> bool:
+        """
+        Updates some of a session's fields, leaving its image untouched.
+
+        Args:
+            session_id: Unique session identifier
+            fields: Fields to overwrite
+
+        Returns:
+            bool: False if the session is unknown or expired
+        """
+
+    @abstractmethod
+    def delete(self, session_id: str):
+        """
+        Removes a session and its image.
+
+        Args:
+            session_id: Unique session identifier
+        """
+
+    @abstractmethod
+    def put_job(self, job_id: str, status: dict):
+        """
+        Records the status of a background job.
+
+        Args:
+            job_id: Unique job identifier
+            status: JSON-serializable job status
+        """
+
+    @abstractmethod
+    def get_job(self, job_id: str) -> dict | None:
+        """
+        Returns the last recorded status of a background job.
+
+        Args:
+            job_id: Unique job identifier
+
+        Returns:
+            dict | None: The job status, or None if unknown or expired
+        """
+
+    def sweep(self) -> int:
+        """
+        Removes expired sessions and job statuses.
+
+        Returns:
+            int: Number of sessions removed
+        """
+        return 0
+
+    @abstractmethod
+    def stats(self) -> dict:
+        """
+        Returns the backend's size counters, without scanning the stored sessions.
+
+        Returns:
+            dict: Backend name, entry count, bytes held and eviction counters
+        """
+
+    async def start(self):
+        """Starts the background sweeper on the running event loop."""
+        self._sweeper = asyncio.create_task(self._sweep_forever())
+
+    async def stop(self):
+        """Stops the background sweeper."""
+        if self._sweeper:
+            self._sweeper.cancel()
+            await asyncio.gather(self._sweeper, return_exceptions=True)
+            self._sweeper = None
+
+    async def _sweep_forever(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                if self.blocking_io:
+                    await asyncio.to_thread(self.sweep)
+                else:
+                    self.sweep()
+            except Exception as e:
+                logger.error(f"Session sweep failed: {e}")
+
+class SessionEntry:
+    """
+    A stored session.
+
+    Attributes:
+        data: Session fields (final_data, spell_check_data, edited_data, whatsapp_message)
+        image: Prescription image bytes, kept apart from the fields
+        size: Approximate bytes held by the session
+        accessed_at: Time of the last read or write
+    """
+    def __init__(self, data: dict, image: bytes | None):
+        self.data = data
+        self.image = image
+        self.size = estimate_size(data, image)
+        self.accessed_at = time.time()
+
+class MemorySessionBackend(SessionBackend):
+    """
+    In-process session store with TTL expiry and LRU eviction under a total byte budget.
+
+    Sessions are only visible to the process that created them, so this backend
+    suits a single uvicorn worker.
+
+    Attributes:
+        ttl: Seconds a session is kept after it was last used
+        max_bytes: Total bytes held before the least recently used sessions are evicted
+        sweep_interval: Seconds between background sweeps for expired sessions
+        evictions: Sessions dropped to stay under max_bytes since start-up
+        expirations: Sessions dropped after their TTL since start-up
+    """
+    blocking_io = False
+
+    def __init__(self, ttl: float = SESSION_TTL, max_bytes: int = SESSION_MAX_BYTES,
+                 sweep_interval: float = SESSION_SWEEP_INTERVAL):
+        super().__init__(ttl, sweep_interval)
+        self.max_bytes = max_bytes
+        self.evictions = 0
+        self.expirations = 0
+        self._entries: OrderedDict[str, SessionEntry] = OrderedDict()
+        self._jobs: dict[str, tuple[float, dict]] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def __contains__(self, session_id: str) -> bool:
+        return self._touch(session_id) is not None
+
+    def put(self, session_id: str, data: dict, image: bytes | None = None):
+        """
+        Stores a session, evicting the least recently used ones if over budget.
+
+        Args:
+            session_id: Unique session identifier
+            data: Session fields
+            image: Prescription image bytes, if any
+        """
+        entry = SessionEntry(data, image)
+        with self._lock:
+            self._remove(session_id)
+            self._entries[session_id] = entry
+            self._bytes += entry.size
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                evicted_id, _ = next(iter(self._entries.items()))
+                self._remove(evicted_id)
+                self.evictions += 1
+                logger.info(f"Session evicted to stay under the memory budget: {evicted_id}")
+
+    def get(self, session_id: str) -> dict | None:
+        """
+        Returns a session's fields, refreshing its TTL and LRU position.
+
+        Args:
+            session_id: Unique session identifier
+
+        Returns:
+            dict | None: The session fields, or None if unknown or expired
+        """
+        entry = self._touch(session_id)
+        return entry.data if entry else None
+
+    def get_image(self, session_id: str) -> bytes | None:
+        """
+        Returns a session's image bytes.
+
+        Args:
+            session_id: Unique session identifier
+
+        Returns:
+            bytes | None: The image, or None if the session is unknown or has no image
+        """
+        entry = self._touch(session_id)
+        return entry.image if entry else None
+
+    def has_image(self, session_id: str) -> bool:
+        """
+        Checks whether a session holds an image.
+
+        Args:
+            session_id: Unique session identifier
+
+        Returns:
+            bool: True if the session exists and has an image
+        """
+        return self.get_image(session_id) is not None
+
+    def update(self, session_id: str, fields: dict) -> bool:
+        """
+        Updates some of a session's fields.
+
+        Args:
+            session_id: Unique session identifier
+            fields: Fields to overwrite
+
+        Returns:
+            bool: False if the session is unknown or expired
+        """
+        entry = self._touch(session_id)
+        if not entry:
+            return False
+        self.put(session_id, {**entry.data, **fields}, entry.image)
+        return True
+
+    def delete(self, session_id: str):
+        """
+        Removes a session.
+
+        Args:
+            session_id: Unique session identifier
+        """
+        with self._lock:
+            self._remove(session_id)
+
+    def put_job(self, job_id: str, status: dict):
+        with self._lock:
+            self._jobs[job_id] = (time.time(), status)
+
+    def get_job(self, job_id: str) -> dict | None:
+        with self._lock:
+            updated_at, status = self._jobs.get(job_id, (0, None))
+        return status if updated_at >= time.time() - self.ttl else None
+
+    def sweep(self) -> int:
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            self._jobs = {job_id: job for job_id, job in self._jobs.items() if job[0] >= cutoff}
+            # Entries are in access order, so expired ones are all at the front
+            expired = []
+            for session_id, entry in self._entries.items():
+                if entry.accessed_at >= cutoff:
+                    break
+                expired.append(session_id)
+            for session_id in expired:
+                self._remove(session_id)
+            self.expirations += len(expired)
+        if expired:
+            logger.info(f"Swept {len(expired)} expired sessions")
+        return len(expired)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "backend": "memory",
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "ttl": self.ttl,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+    def _touch(self, session_id: str) -> SessionEntry | None:
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is None:
+                return None
+            now = time.time()
+            if entry.accessed_at < now - self.ttl:
+                self._remove(session_id)
+                self.expirations += 1
+                return None
+            entry.accessed_at = now
+            self._entries.move_to_end(session_id)
+            return entry
+
+    def _remove(self, session_id: str):
+        entry = self._entries.pop(session_id, None)
+        if entry:
+            self._bytes -= entry.size
+
+class SQLiteSessionBackend(SessionBackend):
+    """
+    Session store in a SQLite file, shared by every worker process on the host.
+
+    Session fields and image bytes live in separate tables, so metadata reads
+    stay cheap however large the images are. Triggers keep the entry and byte
+    totals up to date for every worker, so stats never scans the tables, and
+    the least recently used sessions are evicted to stay under max_bytes.
+
+    Attributes:
+        path: Path to the SQLite database file
+        ttl: Seconds a session is kept after it was last used
+        max_bytes: Total bytes held before the least recently used sessions are evicted
+        sweep_interval: Seconds between background sweeps for expired sessions
+    """
+    def __init__(self, path: str = SESSION_DB_PATH, ttl: float = SESSION_TTL, max_bytes: int = SESSION_MAX_BYTES,
+                 sweep_interval: float = SESSION_SWEEP_INTERVAL):
+        super().__init__(ttl, sweep_interval)
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("BEGIN IMMEDIATE")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "session_id TEXT PRIMARY KEY, data TEXT NOT NULL, has_image INTEGER NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS session_images (session_id TEXT PRIMARY KEY, image BLOB NOT NULL)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs (job_id TEXT PRIMARY KEY, status TEXT NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS sessions_accessed_at ON sessions (accessed_at)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS session_totals (id INTEGER PRIMARY KEY CHECK (id = 0), entries INTEGER NOT NULL, "
+            "bytes INTEGER NOT NULL, evictions INTEGER NOT NULL DEFAULT 0, expirations INTEGER NOT NULL DEFAULT 0)"
+        )
+        # Counted once for databases written before the totals were kept
+        self._conn.execute(
+            "INSERT OR IGNORE INTO session_totals (id, entries, bytes) SELECT 0, (SELECT COUNT(*) FROM sessions), "
+            "(SELECT COALESCE(SUM(LENGTH(data)), 0) FROM sessions) + (SELECT COALESCE(SUM(LENGTH(image)), 0) FROM session_images)"
+        )
+        for trigger in SQLITE_TOTALS_TRIGGERS:
+            self._conn.execute(trigger)
+        self._conn.execute("COMMIT")
+        logger.info(f"SQLite session backend opened at {path}")
+
+    def put(self, session_id: str, data: dict, image: bytes | None = None):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            self._conn.execute(
+                "INSERT INTO sessions (session_id, data, has_image, accessed_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (session_id) DO UPDATE SET data = excluded.data, has_image = excluded.has_image, "
+                "accessed_at = excluded.accessed_at",
+                (session_id, serialize_session(data), image is not None, time.time()),
+            )
+            self._conn.execute("DELETE FROM session_images WHERE session_id = ?", (session_id,))
+            if image is not None:
+                self._conn.execute("INSERT INTO session_images (session_id, image) VALUES (?, ?)", (session_id, image))
+            evicted = self._evict(keep=session_id)
+            self._conn.execute("COMMIT")
+        if evicted:
+            logger.info(f"Evicted {evicted} sessions to stay under the session byte budget")
+
+    def get(self, session_id: str) -> dict | None:
+        row = self._touch(session_id, "data")
+        return deserialize_session(row[0]) if row else None
+
+    def get_image(self, session_id: str) -> bytes | None:
+        if not self._touch(session_id, "session_id"):
+            return None
+        with self._lock:
+            row = self._conn.execute("SELECT image FROM session_images WHERE session_id = ?", (session_id,)).fetchone()
+        return bytes(row[0]) if row else None
+
+    def has_image(self, session_id: str) -> bool:
+        row = self._touch(session_id, "has_image")
+        return bool(row and row[0])
+
+    def update(self, session_id: str, fields: dict) -> bool:
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            row = self._conn.execute(
+                "SELECT data FROM sessions WHERE session_id = ? AND accessed_at >= ?",
+                (session_id, time.time() - self.ttl),
+            ).fetchone()
+            if row:
+                data = {**deserialize_session(row[0]), **fields}
+                self._conn.execute(
+                    "UPDATE sessions SET data = ?, accessed_at = ? WHERE session_id = ?",
+                    (serialize_session(data), time.time(), session_id),
+                )
+                self._evict(keep=session_id)
+            self._conn.execute("COMMIT")
+        return row is not None
+
+    def delete(self, session_id: str):
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+            self._conn.execute("DELETE FROM session_images WHERE session_id = ?", (session_id,))
+            self._conn.execute("COMMIT")
+
+    def put_job(self, job_id: str, status: dict):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO jobs (job_id, status, updated_at) VALUES (?, ?, ?)",
+                (job_id, json.dumps(status), time.time()),
+            )
+
+    def get_job(self, job_id: str) -> dict | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT status FROM jobs WHERE job_id = ? AND updated_at >= ?",
+                (job_id, time.time() - self.ttl),
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def sweep(self) -> int:
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.execute(
+                "DELETE FROM session_images WHERE session_id IN (SELECT session_id FROM sessions WHERE accessed_at < ?)",
+                (cutoff,),
+            )
+            removed = self._conn.execute("DELETE FROM sessions WHERE accessed_at < ?", (cutoff,)).rowcount
+            self._conn.execute("UPDATE session_totals SET expirations = expirations + ?", (removed,))
+            self._conn.execute("DELETE FROM jobs WHERE updated_at < ?", (cutoff,))
+            self._conn.execute("COMMIT")
+        if removed:
+            logger.info(f"Swept {removed} expired sessions")
+        return removed
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries, total_bytes, evictions, expirations = self._conn.execute(
+                "SELECT entries, bytes, evictions, expirations FROM session_totals"
+            ).fetchone()
+        return {
+            "backend": "sqlite",
+            "entries": entries,
+            "bytes": total_bytes,
+            "max_bytes": self.max_bytes,
+            "ttl": self.ttl,
+            "evictions": evictions,
+            "expirations": expirations,
+        }
+
+    def _evict(self, keep: str) -> int:
+        # Runs inside the caller's transaction, which holds the lock
+        total = self._conn.execute("SELECT bytes FROM session_totals").fetchone()[0]
+        if total <= self.max_bytes:
+            return 0
+        evicted = []
+        rows = self._conn.execute(
+            "SELECT s.session_id, LENGTH(s.data) + COALESCE(LENGTH(i.image), 0) FROM sessions s "
+            "LEFT JOIN session_images i ON i.session_id = s.session_id WHERE s.session_id != ? ORDER BY s.accessed_at",
+            (keep,),
+        )
+        for session_id, size in rows:
+            evicted.append((session_id,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+        rows.close()
+        self._conn.executemany("DELETE FROM session_images WHERE session_id = ?", evicted)
+        self._conn.executemany("DELETE FROM sessions WHERE session_id = ?", evicted)
+        self._conn.execute("UPDATE session_totals SET evictions = evictions + ?", (len(evicted),))
+        return len(evicted)
+
+    def _touch(self, session_id: str, column: str) -> tuple | None:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {column} FROM sessions WHERE session_id = ? AND accessed_at >= ?",
+                (session_id, now - self.ttl),
+            ).fetchone()
+            if row:
+                self._conn.execute("UPDATE sessions SET accessed_at = ? WHERE session_id = ?", (now, session_id))
+        return row
+
+class RedisSessionBackend(SessionBackend):
+    """
+    Session store in Redis (or any Redis-compatible server), shared across hosts.
+
+    Sessions are indexed by last use in a sorted set, with their sizes and
+    the running totals in hashes, all updated by Lua scripts so every worker
+    sees the same counters. The sweeper removes expired sessions from the
+    index; key TTLs, refreshed on every read, remove anything it misses.
+    Requires the optional redis package.
+
+    Attributes:
+        url: Redis connection URL
+        ttl: Seconds a session is kept after it was last used
+        max_bytes: Total bytes held before the least recently used sessions are evicted
+        sweep_interval: Seconds between background sweeps for expired sessions
+        prefix: Prefix for every key written
+    """
+    # Sessions removed per script call when sweeping, so Redis is never blocked for long
+    SWEEP_BATCH = 500
+
+    def __init__(self, url: str = SESSION_REDIS_URL, ttl: float = SESSION_TTL, max_bytes: int = SESSION_MAX_BYTES,
+                 sweep_interval: float = SESSION_SWEEP_INTERVAL, prefix: str = "pharma-autobot", client=None):
+        super().__init__(ttl, sweep_interval)
+        if client is None:
+            try:
+                import redis
+            except ImportError:
+                raise ImportError("The redis session backend requires the redis package: pip install redis")
+            client = redis.Redis.from_url(url)
+        self.url = url
+        self.max_bytes = max_bytes
+        self.prefix = prefix
+        self._redis = client
+        self._ttl = max(1, int(ttl))
+        self._index = self._key("index", "sessions")
+        self._sizes = self._key("index", "sizes")
+        self._totals = self._key("index", "totals")
+        self._store = self._redis.register_script(REDIS_STORE_SCRIPT)
+        self._remove = self._redis.register_script(REDIS_REMOVE_SCRIPT)
+        logger.info(f"Redis session backend connected to {url}")
+
+    def _key(self, kind: str, identifier: str) -> str:
+        return f"{self.prefix}:{kind}:{identifier}"
+
+    def _write(self, session_id: str, data: dict, image: bytes | None, mode: str) -> int:
+        return self._store(
+            keys=[self._key("session", session_id), self._key("image", session_id), self._index, self._sizes, self._totals],
+            args=[session_id, serialize_session(data), image or b"", mode, self._ttl, repr(time.time()), self.max_bytes,
+                  self._key("session", ""), self._key("image", "")],
+        )
+
+    def put(self, session_id: str, data: dict, image: bytes | None = None):
+        evicted = self._write(session_id, data, image, "image" if image is not None else "data")
+        if evicted:
+            logger.info(f"Evicted {evicted} sessions to stay under the session byte budget")
+
+    def get(self, session_id: str) -> dict | None:
+        pipe = self._redis.pipeline()
+        pipe.getex(self._key("session", session_id), ex=self._ttl)
+        pipe.expire(self._key("image", session_id), self._ttl)
+        pipe.zadd(self._index, {session_id: time.time()}, xx=True)
+        value, _, _ = pipe.execute()
+        return deserialize_session(value) if value is not None else None
+
+    def get_image(self, session_id: str) -> bytes | None:
+        pipe = self._redis.pipeline()
+        pipe.getex(self._key("image", session_id), ex=self._ttl)
+        pipe.zadd(self._index, {session_id: time.time()}, xx=True)
+        value, _ = pipe.execute()
+        return value
+
+    def has_image(self, session_id: str) -> bool:
+        return bool(self._redis.exists(self._key("image", session_id)))
+
+    def update(self, session_id: str, fields: dict) -> bool:
+        data = self.get(session_id)
+        if data is None:
+            return False
+        return self._write(session_id, {**data, **fields}, None, "update") >= 0
+
+    def delete(self, session_id: str):
+        self._remove(keys=[self._index, self._sizes, self._totals],
+                     args=[self._key("session", ""), self._key("image", ""), "", session_id])
+
+    def put_job(self, job_id: str, status: dict):
+        self._redis.set(self._key("job", job_id), json.dumps(status), ex=self._ttl)
+
+    def get_job(self, job_id: str) -> dict | None:
+        value = self._redis.get(self._key("job", job_id))
+        return json.loads(value) if value is not None else None
+
+    def sweep(self) -> int:
+        cutoff = time.time() - self.ttl
+        removed = 0
+        while True:
+            expired = self._redis.zrangebyscore(self._index, "-inf", f"({cutoff!r}", start=0, num=self.SWEEP_BATCH)
+            if not expired:
+                break
+            removed += self._remove(keys=[self._index, self._sizes, self._totals],
+                                    args=[self._key("session", ""), self._key("image", ""), "expirations", *expired])
+            if len(expired) < self.SWEEP_BATCH:
+                break
+        if removed:
+            logger.info(f"Swept {removed} expired sessions")
+        return removed
+
+    def stats(self) -> dict:
+        pipe = self._redis.pipeline()
+        pipe.zcard(self._index)
+        pipe.hmget(self._totals, "bytes", "evictions", "expirations")
+        entries, (total_bytes, evictions, expirations) = pipe.execute()
+        return {
+            "backend": "redis",
+            "entries": entries,
+            "bytes": int(total_bytes or 0),
+            "max_bytes": self.max_bytes,
+            "ttl": self.ttl,
+            "evictions": int(evictions or 0),
+            "expirations": int(expirations or 0),
+        }
+
+def create_session_backend(name: str = SESSION_BACKEND) -> SessionBackend:
+    """
+    Creates the session backend selected by SESSION_BACKEND.
+
+    Args:
+        name: "memory", "sqlite" or "redis"
+
+    Returns:
+        SessionBackend: The configured backend
+    """
+    if name == "memory":
+        return MemorySessionBackend()
+    if name == "sqlite":
+        return SQLiteSessionBackend()
+    if name == "redis":
+        return RedisSessionBackend()
+    raise ValueError(f"Unknown session backend: {name}")
@@ -0,0 +1,697 @@
+import argparse
+import asyncio
+import datetime
+import hashlib
+import ipaddress
+import json
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+from collections import Counter
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from loguru import logger
+from .prompts import (
+    ocr_single_pass_prompt,
+    ocr_structured_output_prompt,
+    ocr_system_prompt,
+    spell_batched_prompt,
+    spell_list_brand_name_prompt,
+    spell_structured_output_prompt,
+    spell_system_prompt,
+)
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+# Default upstream when recording
+GEMINI_UPSTREAM = "https://generativelanguage.googleapis.com"
+# Characters per chunk when a whole response is replayed as a stream
+STREAM_CHUNK_CHARS = 200
+
+# Medicines the synthetic responder puts on every prescription, as (written, correct, brands)
+SYNTHETIC_MEDICINES = [
+    ("Paracetomol", "Paracetamol", ["Crocin", "Dolo 650", "Calpol"]),
+    ("Amoxcillin", "Amoxicillin", ["Mox", "Novamox"]),
+    ("Pantoprazol", "Pantoprazole", ["Pan", "Pantocid"]),
+    ("Cetrizine", "Cetirizine", ["Okacet", "Alerid"]),
+    ("Azithromicin", "Azithromycin", ["Azithral", "Azee"]),
+]
+
+def get_field(data: dict, name: str):
+    """Reads a request field by its camelCase or snake_case name."""
+    snake = re.sub(r"(?<!^)(?=[A-Z])", "_", name).lower()
+    return data.get(name, data.get(snake))
+
+def request_parts(body: dict) -> list[dict]:
+    """Returns the parts of every content in a generateContent request body."""
+    return [part for content in body.get("contents") or [] for part in content.get("parts") or []]
+
+def system_text(body: dict) -> str:
+    instruction = get_field(body, "systemInstruction") or get_field(get_field(body, "generationConfig") or {}, "systemInstruction")
+    if isinstance(instruction, dict):
+        return "".join(part.get("text", "") for part in instruction.get("parts") or [])
+    return instruction or ""
+
+def normalize_request(body: dict) -> dict:
+    """
+    Replaces inline data with a hash of it, so recordings stay small and images match by content.
+
+    Args:
+        body: generateContent request body
+
+    Returns:
+        dict: The body with every inline data blob replaced by its SHA-256
+    """
+    def normalize(value):
+        if isinstance(value, dict):
+            inline = get_field(value, "inlineData")
+            if isinstance(inline, dict) and "data" in inline:
+                return {"inlineData": {"mimeType": get_field(inline, "mimeType"),
+                                       "sha256": hashlib.sha256(inline["data"].encode()).hexdigest()}}
+            return {key: normalize(item) for key, item in value.items()}
+        if isinstance(value, list):
+            return [normalize(item) for item in value]
+        return value
+    return normalize(body)
+
+def request_fingerprint(model: str, body: dict) -> str:
+    """
+    Identifies a request exactly, with images compared by content.
+
+    Args:
+        model: Model name from the URL
+        body: generateContent request body
+
+    Returns:
+        str: SHA-256 of the model and the normalized body
+    """
+    canonical = json.dumps([model, normalize_request(body)], sort_keys=True)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+def request_shape(model: str, body: dict) -> str:
+    """
+    Identifies the kind of call a request makes, ignoring the input it carries.
+
+    Every pipeline call puts its prompt first and its input after, except
+    single part calls, whose only part is the input. The shape is the model,
+    system instruction, tools, response type, number of parts and, for multi
+    part calls, the first text part.
+
+    Args:
+        model: Model name from the URL
+        body: generateContent request body
+
+    Returns:
+        str: SHA-256 of the request's shape
+    """
+    parts = request_parts(body)
+    config = get_field(body, "generationConfig") or {}
+    prompt = parts[0].get("text", "") if len(parts) > 1 else ""
+    shape = [model, system_text(body), bool(body.get("tools")), get_field(config, "responseMimeType"), len(parts), prompt]
+    return hashlib.sha256(json.dumps(shape).encode()).hexdigest()
+
+def response_text(response: dict) -> str:
+    """Returns the text of a response's first candidate."""
+    candidates = response.get("candidates") or [{}]
+    return "".join(part.get("text", "") for part in (candidates[0].get("content") or {}).get("parts") or [])
+
+def text_response(text: str, prompt_tokens: int = 0) -> dict:
+    """
+    Builds a generateContent response holding the given text.
+
+    Args:
+        text: Response text
+        prompt_tokens: Tokens to report for the request
+
+    Returns:
+        dict: The response body
+    """
+    output_tokens = max(1, len(text) // 4)
+    return {
+        "candidates": [{"content": {"parts": [{"text": text}], "role": "model"}, "finishReason": "STOP", "index": 0}],
+        "usageMetadata": {
+            "promptTokenCount": prompt_tokens,
+            "candidatesTokenCount": output_tokens,
+            "totalTokenCount": prompt_tokens + output_tokens,
+        },
+    }
+
+def merge_chunks(chunks: list[dict]) -> dict:
+    """Combines streamed chunks into one response, keeping the last usage metadata."""
+    response = text_response("".join(response_text(chunk) for chunk in chunks))
+    for chunk in chunks:
+        if chunk.get("usageMetadata"):
+            response["usageMetadata"] = chunk["usageMetadata"]
+    return response
+
+def split_response(response: dict, chunk_chars: int = STREAM_CHUNK_CHARS) -> list[dict]:
+    """Splits a response into stream chunks, with usage metadata on the last one."""
+    text = response_text(response)
+    pieces = [text[i:i + chunk_chars] for i in range(0, len(text), chunk_chars)] or [""]
+    chunks = [text_response(piece) for piece in pieces]
+    for chunk in chunks:
+        del chunk["usageMetadata"]
+    if response.get("usageMetadata"):
+        chunks[-1]["usageMetadata"] = response["usageMetadata"]
+    return chunks
+
+class Recording:
+    """
+    A recorded Gemini response.
+
+    Attributes:
+        model: Model the request was made to
+        fingerprint: request_fingerprint of the request
+        shape: request_shape of the request
+        stream: Whether the response was streamed
+        chunks: Response bodies; a single one unless streamed
+        chunk_times: Seconds after the request each chunk arrived
+        status: HTTP status of the response
+    """
+    def __init__(self, model: str, fingerprint: str, shape: str, stream: bool, chunks: list[dict],
+                 chunk_times: list[float], status: int = 200):
+        self.model = model
+        self.fingerprint = fingerprint
+        self.shape = shape
+        self.stream = stream
+        self.chunks = chunks
+        self.chunk_times = chunk_times
+        self.status = status
+
+    @property
+    def latency(self) -> float:
+        return self.chunk_times[0] if self.chunk_times else 0.0
+
+    def to_dict(self) -> dict:
+        return dict(self.__dict__)
+
+class Cassette:
+    """
+    Recorded responses, looked up by exact request first and by request shape second.
+
+    Requests that match no recording exactly are answered round-robin from
+    recordings of the same shape, so a few recorded prescriptions can stand
+    in for any number of uploads.
+
+    Attributes:
+        path: JSONL file recordings are read from and appended to (None to keep them in memory)
+        recordings: Every recording loaded or added
+    """
+    def __init__(self, path: str = None):
+        self.path = path
+        self.recordings: list[Recording] = []
+        self._by_fingerprint: dict[str, Recording] = {}
+        self._by_shape: dict[str, list[Recording]] = {}
+        self._next: Counter = Counter()
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    if line.strip():
+                        self._index(Recording(**json.loads(line)))
+            logger.info(f"Loaded {len(self.recordings)} recordings from {path}")
+
+    def _index(self, recording: Recording):
+        self.recordings.append(recording)
+        self._by_fingerprint[recording.fingerprint] = recording
+        self._by_shape.setdefault(recording.shape, []).append(recording)
+
+    def find(self, model: str, body: dict) -> tuple[Recording | None, str]:
+        """
+        Finds the recording to replay for a request.
+
+        Args:
+            model: Model name from the URL
+            body: generateContent request body
+
+        Returns:
+            tuple: (Recording | None, str) with the recording and how it matched: "exact", "shape" or "miss"
+        """
+        recording = self._by_fingerprint.get(request_fingerprint(model, body))
+        if recording:
+            return recording, "exact"
+        shape = request_shape(model, body)
+        with self._lock:
+            candidates = self._by_shape.get(shape)
+            if not candidates:
+                return None, "miss"
+            recording = candidates[self._next[shape] % len(candidates)]
+            self._next[shape] += 1
+        return recording, "shape"
+
+    def add(self, recording: Recording):
+        """
+        Adds a recording and appends it to the cassette file.
+
+        Args:
+            recording: The recording to add
+        """
+        with self._lock:
+            self._index(recording)
+            if self.path:
+                with open(self.path, "a") as f:
+                    f.write(json.dumps(recording.to_dict()) + "\n")
+
+class LatencyModel:
+    """
+    How long the stand-in takes to answer.
+
+    Specs are "recorded" (the recorded latency, optionally scaled as
+    "recorded*0.5"), "none", "fixed:SECONDS", "uniform:LOW:HIGH",
+    "lognormal:MEDIAN:SIGMA" or "cycle:SECONDS:SECONDS:..." (the given
+    latencies in turn, e.g. a slow request followed by a fast one).
+
+    Attributes:
+        spec: The spec the model was parsed from
+    """
+    def __init__(self, spec: str = "recorded"):
+        self.spec = spec
+        name, _, args = spec.partition(":")
+        self._scale = 1.0
+        if name.startswith("recorded*"):
+            name, self._scale = "recorded", float(name.partition("*")[2])
+        self._kind = name
+        self._args = [float(arg) for arg in args.split(":")] if args else []
+        self._count = 0
+        expected = {"recorded": 0, "none": 0, "fixed": 1, "uniform": 2, "lognormal": 2}
+        if name == "cycle" and self._args:
+            return
+        if name not in expected or len(self._args) != expected[name]:
+            raise ValueError(f"Invalid latency spec: {spec}")
+
+    def sample(self, recorded: float) -> float:
+        """
+        Draws a latency.
+
+        Args:
+            recorded: Latency of the recording being replayed
+
+        Returns:
+            float: Seconds to wait before the first byte of the response
+        """
+        if self._kind == "recorded":
+            return recorded * self._scale
+        if self._kind == "none":
+            return 0.0
+        if self._kind == "fixed":
+            return self._args[0]
+        if self._kind == "uniform":
+            return random.uniform(*self._args)
+        if self._kind == "cycle":
+            self._count += 1
+            return self._args[(self._count - 1) % len(self._args)]
+        median, sigma = self._args
+        return random.lognormvariate(0, sigma) * median
+
+class FaultModel:
+    """
+    Errors injected instead of answering.
+
+    Attributes:
+        rate: Fraction of requests that fail
+        codes: HTTP status codes to fail with, picked at random
+        timeout_rate: Fraction of requests that hang until the client gives up
+        first: Requests that fail before the others are answered, with codes in turn
+    """
+    ERRORS = {
+        400: "INVALID_ARGUMENT",
+        429: "RESOURCE_EXHAUSTED",
+        500: "INTERNAL",
+        503: "UNAVAILABLE",
+        504: "DEADLINE_EXCEEDED",
+    }
+
+    def __init__(self, rate: float = 0.0, codes: list[int] = (429, 503), timeout_rate: float = 0.0, first: int = 0):
+        self.rate = rate
+        self.codes = list(codes)
+        self.timeout_rate = timeout_rate
+        self.first = first
+        self._failed_first = 0
+
+    def pick(self) -> int | str | None:
+        """
+        Decides whether a request fails.
+
+        Returns:
+            int | str | None: A status code to fail with, "timeout" to hang, or None to answer
+        """
+        if self._failed_first < self.first:
+            self._failed_first += 1
+            return self.codes[(self._failed_first - 1) % len(self.codes)]
+        roll = random.random()
+        if roll < self.timeout_rate:
+            return "timeout"
+        if roll < self.timeout_rate + self.rate:
+            return random.choice(self.codes)
+        return None
+
+    def error_body(self, code: int) -> dict:
+        return {"error": {"code": code, "message": "Injected by the stand-in server", "status": self.ERRORS.get(code, "UNKNOWN")}}
+
+def synthetic_names(text: str) -> list[str]:
+    """Finds the synthetic medicine names mentioned in a text, in order."""
+    lowered = text.lower()
+    found = []
+    for written, correct, _ in SYNTHETIC_MEDICINES:
+        if written.lower() in lowered or correct.lower() in lowered:
+            found.append(written if written.lower() in lowered else correct)
+    return found
+
+def synthetic_spell_check(name: str) -> dict:
+    correct, brands = name, []
+    for written, fixed, medicine_brands in SYNTHETIC_MEDICINES:
+        if name.lower() in (written.lower(), fixed.lower()):
+            correct, brands = fixed, medicine_brands
+    return {
+        "input_name": name,
+        "corrected_name": correct,
+        "generic_name": [correct],
+        "brand_names": brands,
+        "is_correct": correct == name,
+        "is_generic": True,
+        "notes": "",
+    }
+
+def synthetic_medications(count: int) -> list[dict]:
+    return [
+        {
+            "medication_name": written,
+            "dosage": "500mg",
+            "quantity": 10,
+            "instructions": {"how": "After food", "how_much": "1 tablet", "when": "Twice a day"},
+        }
+        for written, _, _ in SYNTHETIC_MEDICINES[:count]
+    ]
+
+def synthetic_response(body: dict, medications: int = 3) -> dict | None:
+    """
+    Makes up a plausible answer for a pipeline call, for benchmarks without recordings.
+
+    The call is recognised by its prompt. Spell checks echo the names they
+    were asked about, so the pipeline's results stay consistent.
+
+    Args:
+        body: generateContent request body
+        medications: Number of medicines on every synthetic prescription
+
+    Returns:
+        dict | None: The response body, or None if the call isn't one the pipeline makes
+    """
+    parts = [part.get("text", "") for part in request_parts(body) if "text" in part]
+    system = system_text(body)
+    first = parts[0] if parts else ""
+    prompt_tokens = sum(len(part) for part in parts + [system]) // 4 + 258 * any(
+        get_field(part, "inlineData") for part in request_parts(body)
+    )
+    if first == ocr_single_pass_prompt or first == ocr_structured_output_prompt:
+        return text_response(json.dumps({"medications": synthetic_medications(medications)}), prompt_tokens)
+    if system == ocr_system_prompt:
+        lines = []
+        for medication in synthetic_medications(medications):
+            lines += [
+                f"Medication name: {medication['medication_name']}",
+                f"Dosage: {medication['dosage']}",
+                f"Quantity: {medication['quantity']}",
+                f"How: {medication['instructions']['how']}",
+                f"How much: {medication['instructions']['how_much']}",
+                f"When: {medication['instructions']['when']}",
+                "",
+            ]
+        return text_response("\n".join(lines), prompt_tokens)
+    if first == spell_batched_prompt:
+        names = json.loads(parts[-1])
+        drugs = [synthetic_spell_check(name) for name in names]
+        return text_response("```json\n" + json.dumps({"drugs": drugs}) + "\n```", prompt_tokens)
+    if first == spell_list_brand_name_prompt:
+        brands = [brand for name in synthetic_names(parts[1]) for brand in synthetic_spell_check(name)["brand_names"]]
+        return text_response("Brand names: " + ", ".join(brands), prompt_tokens)
+    if first == spell_structured_output_prompt:
+        inputs = re.findall(r"^Input name: (.+)$", parts[1], re.MULTILINE)
+        return text_response(json.dumps({"drugs": [synthetic_spell_check(name) for name in inputs]}), prompt_tokens)
+    if system == spell_system_prompt and len(parts) == 1:
+        spell_check = synthetic_spell_check(parts[0])
+        return text_response(
+            f"Input name: {parts[0]}\nCorrected name: {spell_check['corrected_name']}\n"
+            f"Generic name: {spell_check['corrected_name']}",
+            prompt_tokens,
+        )
+    return None
+
+class StubStats:
+    """Counters the stand-in keeps about the requests it answered."""
+    def __init__(self):
+        self.matches = Counter()
+        self.errors = Counter()
+        self.models = Counter()
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def to_dict(self) -> dict:
+        return {
+            "matches": dict(self.matches),
+            "errors": {str(code): count for code, count in self.errors.items()},
+            "models": dict(self.models),
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+        }
+
+def create_app(cassette: Cassette, latency: dict[str, LatencyModel] = None, faults: FaultModel = None,
+               synthetic: bool = True, medications: int = 3, upstream: str = None) -> FastAPI:
+    """
+    Builds the stand-in for the Gemini REST API.
+
+    Serves generateContent and streamGenerateContent (as server-sent events,
+    like the real API) from the cassette. Requests without a recording are
+    answered synthetically if enabled, forwarded to upstream and recorded if
+    set, or refused with 404.
+
+    Args:
+        cassette: Recorded responses
+        latency: Latency model per model name, with "*" as the default
+        faults: Errors to inject
+        synthetic: Make up answers for pipeline calls that have no recording
+        medications: Number of medicines on every synthetic prescription
+        upstream: Gemini base URL to forward unrecorded requests to and record them from
+
+    Returns:
+        FastAPI: The stand-in app; GET /stub/stats reports what it answered
+    """
+    latency = latency or {"*": LatencyModel()}
+    faults = faults or FaultModel()
+    stats = StubStats()
+    app = FastAPI(title="Gemini stand-in")
+
+    async def forward(request: Request, model: str, body: dict, stream: bool) -> Recording:
+        if httpx is None:
+            raise RuntimeError("Recording requires the httpx package")
+        headers = {name: value for name, value in request.headers.items() if name.lower() in ("x-goog-api-key", "content-type")}
+        url = f"{upstream.rstrip('/')}{request.url.path}"
+        start = time.monotonic()
+        chunks, chunk_times = [], []
+        async with httpx.AsyncClient(timeout=300) as client:
+            async with client.stream("POST", url, params=request.query_params, headers=headers, json=body) as response:
+                if stream and response.status_code == 200:
+                    async for line in response.aiter_lines():
+                        if line.startswith("data: "):
+                            chunks.append(json.loads(line[len("data: "):]))
+                            chunk_times.append(time.monotonic() - start)
+                else:
+                    chunks.append(json.loads(await response.aread()))
+                    chunk_times.append(time.monotonic() - start)
+        recording = Recording(model, request_fingerprint(model, body), request_shape(model, body), stream,
+                              chunks, chunk_times, response.status_code)
+        if response.status_code == 200:
+            cassette.add(recording)
+        return recording
+
+    async def answer(request: Request, model: str, stream: bool):
+        body = await request.json()
+        stats.models[model] += 1
+        fault = faults.pick()
+        if fault == "timeout":
+            stats.errors["timeout"] += 1
+            await asyncio.sleep(3600)
+        if fault:
+            stats.errors[fault] += 1
+            return JSONResponse(faults.error_body(fault), status_code=fault)
+
+        recording, match = cassette.find(model, body)
+        delay_model = latency.get(model, latency["*"])
+        if recording is None and synthetic:
+            response = synthetic_response(body, medications)
+            if response is not None:
+                recording, match = Recording(model, "", "", False, [response], [0.0]), "synthetic"
+        if recording is None and upstream:
+            recording, match = await forward(request, model, body, stream), "recorded"
+            # Recording already waited for the real latency
+            delay_model = LatencyModel("none")
+        stats.matches[match] += 1
+        if recording is None:
+            return JSONResponse({"error": {"code": 404, "message": f"No recording for this {model} request", "status": "NOT_FOUND"}},
+                                status_code=404)
+        if recording.status != 200:
+            return JSONResponse(recording.chunks[0], status_code=recording.status)
+
+        delay = delay_model.sample(recording.latency)
+        if not stream:
+            await asyncio.sleep(delay)
+            return JSONResponse(recording.chunks[0] if len(recording.chunks) == 1 else merge_chunks(recording.chunks))
+
+        if recording.stream:
+            chunks = recording.chunks
+            # Keep the recorded gaps between chunks, scaled like the time to the first one
+            scale = delay / recording.latency if recording.latency else 0.0
+            offsets = [(at - recording.latency) * scale for at in recording.chunk_times]
+        else:
+            chunks = split_response(recording.chunks[0])
+            offsets = [0.0] * len(chunks)
+
+        async def events():
+            await asyncio.sleep(delay)
+            sent = 0.0
+            for chunk, offset in zip(chunks, offsets):
+                if offset > sent:
+                    await asyncio.sleep(offset - sent)
+                    sent = offset
+                yield f"data: {json.dumps(chunk)}\r\n\r\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.middleware("http")
+    async def count_in_flight(request: Request, call_next):
+        stats.in_flight += 1
+        stats.max_in_flight = max(stats.max_in_flight, stats.in_flight)
+        try:
+            return await call_next(request)
+        finally:
+            stats.in_flight -= 1
+
+    @app.post("/{version}/models/{model_call}")
+    async def generate(version: str, model_call: str, request: Request):
+        model, _, method = model_call.partition(":")
+        if method == "generateContent":
+            return await answer(request, model, stream=False)
+        if method == "streamGenerateContent":
+            return await answer(request, model, stream=True)
+        return JSONResponse({"error": {"code": 404, "message": f"Unsupported method {method}", "status": "NOT_FOUND"}},
+                            status_code=404)
+
+    @app.get("/stub/stats")
+    async def get_stats():
+        return JSONResponse(stats.to_dict())
+
+    return app
+
+def self_signed_certificate(directory: str, host: str = "127.0.0.1") -> tuple[str, str]:
+    """
+    Writes a self-signed certificate, so the stand-in can be served over TLS like the real API.
+
+    Clients have to be told to trust it, e.g. with SSL_CERT_FILE (httpx) and
+    REQUESTS_CA_BUNDLE (requests) pointing at the certificate file. Requires
+    the cryptography package.
+
+    Args:
+        directory: Where to write the files
+        host: IP address or host name the certificate is valid for, besides localhost
+
+    Returns:
+        tuple[str, str]: Paths of the certificate and of its private key, both PEM
+    """
+    try:
+        from cryptography import x509
+        from cryptography.hazmat.primitives import hashes, serialization
+        from cryptography.hazmat.primitives.asymmetric import ec
+        from cryptography.x509.oid import NameOID
+    except ImportError:
+        raise ImportError("Serving the stand-in over TLS requires the cryptography package: pip install cryptography")
+
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "Gemini stand-in")])
+    try:
+        alt_names = [x509.IPAddress(ipaddress.ip_address(host))]
+    except ValueError:
+        alt_names = [x509.DNSName(host)]
+    now = datetime.datetime.now(datetime.timezone.utc)
+    certificate = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(minutes=5))
+        .not_valid_after(now + datetime.timedelta(days=30))
+        .add_extension(x509.SubjectAlternativeName([x509.DNSName("localhost"), *alt_names]), critical=False)
+        .add_extension(x509.BasicConstraints(ca=True, path_length=None), critical=True)
+        .sign(key, hashes.SHA256())
+    )
+    os.makedirs(directory, exist_ok=True)
+    certfile, keyfile = os.path.join(directory, "stub-cert.pem"), os.path.join(directory, "stub-key.pem")
+    with open(certfile, "wb") as f:
+        f.write(certificate.public_bytes(serialization.Encoding.PEM))
+    with open(keyfile, "wb") as f:
+        f.write(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                  serialization.NoEncryption()))
+    return certfile, keyfile
+
+def parse_latency(specs: list[str]) -> dict[str, LatencyModel]:
+    """
+    Parses --latency options.
+
+    Args:
+        specs: "SPEC" for the default or "MODEL=SPEC" for one model
+
+    Returns:
+        dict[str, LatencyModel]: Latency models by model name, with "*" as the default
+    """
+    latency = {"*": LatencyModel()}
+    for spec in specs:
+        model, _, model_spec = spec.rpartition("=")
+        latency[model or "*"] = LatencyModel(model_spec)
+    return latency
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Serve recorded Gemini responses for tests and benchmarks")
+    parser.add_argument("cassette", nargs="?", help="JSONL file of recordings to replay and append to")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--latency", action="append", default=[],
+                        help="Latency spec, optionally per model as MODEL=SPEC: recorded[*SCALE], none, fixed:S, "
+                             "uniform:LOW:HIGH, lognormal:MEDIAN:SIGMA or cycle:S:S:...")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with an error")
+    parser.add_argument("--error-codes", default="429,503", help="Comma separated status codes to inject")
+    parser.add_argument("--timeout-rate", type=float, default=0.0, help="Fraction of requests that never answer")
+    parser.add_argument("--error-first", type=int, default=0, help="Requests answered with an error before any other")
+    parser.add_argument("--no-synthetic", action="store_true", help="Refuse requests without a recording")
+    parser.add_argument("--medications", type=int, default=3, help="Medicines on every synthetic prescription")
+    parser.add_argument("--record", action="store_true", help="Forward requests without a recording to Gemini and record them")
+    parser.add_argument("--upstream", default=GEMINI_UPSTREAM, help="Gemini API to record from")
+    parser.add_argument("--tls", action="store_true", help="Serve over HTTPS with a self-signed certificate")
+
+    args = parser.parse_args()
+    app = create_app(
+        Cassette(args.cassette),
+        latency=parse_latency(args.latency),
+        faults=FaultModel(args.error_rate, [int(code) for code in args.error_codes.split(",")], args.timeout_rate,
+                          args.error_first),
+        synthetic=not args.no_synthetic and not args.record,
+        medications=args.medications,
+        upstream=args.upstream if args.record else None,
+    )
+    ssl_options, scheme = {}, "http"
+    if args.tls:
+        certfile, keyfile = self_signed_certificate(tempfile.mkdtemp(prefix="gemini-stub-"), args.host)
+        ssl_options, scheme = {"ssl_certfile": certfile, "ssl_keyfile": keyfile}, "https"
+        logger.info(f"Trust the stand-in with SSL_CERT_FILE={certfile} REQUESTS_CA_BUNDLE={certfile}")
+    logger.info(f"Point GEMINI_BASE_URL at {scheme}://{args.host}:{args.port}/ to use the stand-in")
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning", **ssl_options)
+
+if __name__ == "__main__":
+    main()
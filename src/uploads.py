@@ -0,0 +1,310 @@
+import asyncio
+import hashlib
+import os
+import tempfile
+from urllib.parse import parse_qsl
+from pathlib import Path
+from loguru import logger
+from python_multipart import MultipartParser
+from python_multipart.multipart import parse_options_header
+from .exceptions import UploadTooLarge
+from .pages import MAX_PAGES
+from .preprocessing import sniff_mime_type
+
+# Upload intake settings
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(20 * 1024 * 1024)))
+UPLOAD_SPOOL_THRESHOLD = int(os.getenv("UPLOAD_SPOOL_THRESHOLD", str(1024 * 1024)))
+UPLOAD_SPOOL_DIR = os.getenv("UPLOAD_SPOOL_DIR", "") or None
+
+# Limits on the plain form fields sent alongside the files, e.g. use_dummy
+UPLOAD_MAX_FIELDS = 16
+UPLOAD_MAX_FIELD_BYTES = 64 * 1024
+
+class SpooledUpload:
+    """
+    An uploaded file, kept in memory when small and in a spool file on disk otherwise.
+
+    Behaves like the file-like objects read_image accepts, so it can be
+    handed to the pipeline as it is, and holds no memory until it is read.
+
+    Attributes:
+        filename: Name the client gave the file
+        content_type: MIME type sniffed from the file's first bytes
+        size: Size in bytes
+        sha256: Hash of the content, computed while it was received
+        path: Spool file, or None if the content is held in memory
+    """
+    def __init__(self, filename: str, content_type: str, size: int, sha256: str,
+                 data: bytes = None, path: str = None):
+        self.filename = filename
+        self.content_type = content_type
+        self.size = size
+        self.sha256 = sha256
+        self.path = path
+        self._data = data
+
+    def read(self) -> bytes:
+        """
+        Returns the content, reading the spool file if there is one.
+
+        Returns:
+            bytes: The uploaded file
+        """
+        if self.path is None:
+            return self._data
+        return Path(self.path).read_bytes()
+
+    def close(self):
+        """Deletes the spool file, if any. The upload can't be read afterwards."""
+        if self.path is not None:
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+            self.path = None
+        self._data = None
+
+class UploadSpool:
+    """
+    Receives one uploaded file in chunks, hashing it and enforcing the size limit as it goes.
+
+    Files up to spool_threshold stay in memory; bigger ones are written to a
+    spool file as they arrive, so a queued upload holds no memory and is
+    written to disk once.
+
+    Attributes:
+        filename: Name the client gave the file
+        max_bytes: Largest file accepted
+        spool_threshold: Largest file kept in memory
+        spool_dir: Directory for spool files (defaults to the system temp directory)
+        size: Bytes received so far
+    """
+    def __init__(self, filename: str, max_bytes: int = UPLOAD_MAX_BYTES,
+                 spool_threshold: int = UPLOAD_SPOOL_THRESHOLD, spool_dir: str = UPLOAD_SPOOL_DIR):
+        self.filename = filename
+        self.max_bytes = max_bytes
+        self.spool_threshold = spool_threshold
+        self.spool_dir = spool_dir
+        self.size = 0
+        self._digest = hashlib.sha256()
+        self._head = b""
+        self._pending = []
+        self._file = None
+
+    def add(self, chunk: bytes):
+        """
+        Takes the next chunk of the file. It is kept pending until flush.
+
+        Raises:
+            UploadTooLarge: The file is now bigger than max_bytes
+        """
+        self.size += len(chunk)
+        if self.size > self.max_bytes:
+            raise UploadTooLarge(f"{self.filename} is larger than {self.max_bytes // (1024 * 1024)} MB")
+        self._digest.update(chunk)
+        if len(self._head) < 16:
+            self._head += chunk[:16]
+        self._pending.append(chunk)
+
+    async def flush(self):
+        """Writes the pending chunks to the spool file once the file is past spool_threshold"""
+        if self._file is None and self.size <= self.spool_threshold:
+            return
+        chunks, self._pending = self._pending, []
+        await asyncio.to_thread(self._write, chunks)
+
+    def _write(self, chunks: list[bytes]):
+        if self._file is None:
+            if self.spool_dir:
+                os.makedirs(self.spool_dir, exist_ok=True)
+            self._file = tempfile.NamedTemporaryFile(prefix="upload-", dir=self.spool_dir, delete=False)
+        self._file.writelines(chunks)
+
+    async def finish(self) -> SpooledUpload:
+        """
+        Completes the file once its last chunk has arrived.
+
+        Returns:
+            SpooledUpload: The received file
+        """
+        await self.flush()
+        content_type, sha256 = sniff_mime_type(self._head), self._digest.hexdigest()
+        if self._file is None:
+            data = self._pending[0] if len(self._pending) == 1 else b"".join(self._pending)
+            self._pending = []
+            return SpooledUpload(self.filename, content_type, self.size, sha256, data=data)
+        await asyncio.to_thread(self._file.close)
+        logger.info(f"Spooled {self.filename} ({self.size} bytes) to {self._file.name}")
+        return SpooledUpload(self.filename, content_type, self.size, sha256, path=self._file.name)
+
+    def discard(self):
+        """Drops whatever has been received, deleting the spool file if there is one"""
+        self._pending = []
+        if self._file is not None:
+            self._file.close()
+            try:
+                os.unlink(self._file.name)
+            except FileNotFoundError:
+                pass
+            self._file = None
+
+class UploadForm:
+    """
+    Receives a multipart/form-data body as python_multipart parses it, one UploadSpool per file.
+
+    Attributes:
+        fields: Plain form fields by name
+        files: Received files by field name, in the order they were sent
+    """
+    def __init__(self, max_bytes: int = UPLOAD_MAX_BYTES, max_files: int = MAX_PAGES,
+                 spool_threshold: int = UPLOAD_SPOOL_THRESHOLD, spool_dir: str = UPLOAD_SPOOL_DIR):
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self.spool_threshold = spool_threshold
+        self.spool_dir = spool_dir
+        self.fields = {}
+        self.files = {}
+        self.complete = False
+        self._parts = 0
+        self._spools = []
+        self._finished = []
+        self._headers = {}
+        self._header_field = b""
+        self._header_value = b""
+        self._name = None
+        self._value = None
+        self._spool = None
+
+    def callbacks(self) -> dict:
+        """Returns the callbacks to hand python_multipart's MultipartParser"""
+        return {
+            "on_part_begin": self.on_part_begin,
+            "on_header_field": self.on_header_field,
+            "on_header_value": self.on_header_value,
+            "on_header_end": self.on_header_end,
+            "on_headers_finished": self.on_headers_finished,
+            "on_part_data": self.on_part_data,
+            "on_part_end": self.on_part_end,
+            "on_end": self.on_end,
+        }
+
+    def on_part_begin(self):
+        self._parts += 1
+        if self._parts > self.max_files + UPLOAD_MAX_FIELDS:
+            raise ValueError("Too many parts in the upload form")
+        self._headers, self._name, self._value, self._spool = {}, None, None, None
+
+    def on_header_field(self, data: bytes, start: int, end: int):
+        self._header_field += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+
+    def on_header_end(self):
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field, self._header_value = b"", b""
+
+    def on_headers_finished(self):
+        disposition, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        if disposition != b"form-data" or b"name" not in options:
+            raise ValueError("Upload form part has no field name")
+        self._name = options[b"name"].decode("utf-8", "replace")
+        if b"filename" not in options:
+            self._value = bytearray()
+            return
+        if len(self._spools) >= self.max_files:
+            raise ValueError(f"At most {self.max_files} files can be uploaded at once")
+        filename = options[b"filename"].decode("utf-8", "replace") or "upload"
+        self._spool = UploadSpool(filename, self.max_bytes, self.spool_threshold, self.spool_dir)
+        self._spools.append(self._spool)
+
+    def on_part_data(self, data: bytes, start: int, end: int):
+        if self._spool is not None:
+            self._spool.add(data[start:end])
+            return
+        self._value += data[start:end]
+        if len(self._value) > UPLOAD_MAX_FIELD_BYTES:
+            raise ValueError(f"Form field {self._name} is too large")
+
+    def on_part_end(self):
+        if self._spool is not None:
+            self._finished.append((self._name, self._spool))
+        else:
+            self.fields[self._name] = self._value.decode("utf-8", "replace")
+
+    def on_end(self):
+        self.complete = True
+
+    async def flush(self):
+        """Writes what the parser has handed over so far to the spool files that need it"""
+        for spool in self._spools:
+            await spool.flush()
+
+    async def finish(self):
+        """Completes every received file into SpooledUpload objects in files"""
+        for name, spool in self._finished:
+            self.files.setdefault(name, []).append(await spool.finish())
+        self._finished = []
+
+    def discard(self):
+        """Drops every file received so far"""
+        for spool in self._spools:
+            spool.discard()
+        for uploads in self.files.values():
+            for upload in uploads:
+                upload.close()
+
+async def receive_upload_form(request, max_bytes: int = UPLOAD_MAX_BYTES, max_files: int = MAX_PAGES,
+                              spool_threshold: int = UPLOAD_SPOOL_THRESHOLD,
+                              spool_dir: str = UPLOAD_SPOOL_DIR) -> UploadForm:
+    """
+    Parses a multipart/form-data request as its body streams in.
+
+    Files are hashed, size-checked and spooled chunk by chunk as they arrive,
+    so an oversized file is refused before the rest of the request is read
+    and each file is written to disk at most once.
+
+    Args:
+        request: Starlette or FastAPI Request
+        max_bytes: Largest file accepted
+        max_files: Most files accepted
+        spool_threshold: Largest file kept in memory
+        spool_dir: Directory for spool files (defaults to the system temp directory)
+
+    Returns:
+        UploadForm: The form's fields and files. The caller owns the files and must close them.
+
+    Raises:
+        UploadTooLarge: A file is bigger than max_bytes
+        ValueError: The request isn't a well-formed multipart/form-data (or, without files,
+            application/x-www-form-urlencoded) body within the limits
+    """
+    content_type, options = parse_options_header(request.headers.get("content-type", ""))
+    form = UploadForm(max_bytes, max_files, spool_threshold, spool_dir)
+    if content_type == b"application/x-www-form-urlencoded":
+        # A form without files, e.g. use_dummy alone
+        body = bytearray()
+        async for chunk in request.stream():
+            body += chunk
+            if len(body) > UPLOAD_MAX_FIELDS * UPLOAD_MAX_FIELD_BYTES:
+                raise ValueError("The upload form is too large")
+        form.fields = dict(parse_qsl(body.decode("utf-8", "replace"), keep_blank_values=True))
+        form.complete = True
+        return form
+    if content_type != b"multipart/form-data" or not options.get(b"boundary"):
+        raise ValueError("Expected a multipart/form-data request")
+
+    parser = MultipartParser(options[b"boundary"], form.callbacks())
+    try:
+        async for chunk in request.stream():
+            if chunk:
+                parser.write(chunk)
+                await form.flush()
+        parser.finalize()
+        if not form.complete:
+            raise ValueError("The upload form ended early")
+        await form.finish()
+    except BaseException:
+        form.discard()
+        raise
+    return form
@@ -0,0 +1,87 @@
+import asyncio
+import pytest
+from src.benchmark import StubServerThread
+from src.clients import GeminiClientPool
+from src.stub_server import Cassette, FaultModel, LatencyModel, create_app
+
+def run_on_new_loop(coro):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        # Let cancelled calls, e.g. a hedge's loser, finish cancelling
+        tasks = asyncio.all_tasks(loop)
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            loop.run_until_complete(asyncio.wait(tasks))
+        loop.close()
+
+@pytest.fixture
+def run():
+    """
+    Runs a coroutine on a new event loop.
+
+    Unlike asyncio.run, closing the loop doesn't wait for worker threads, so
+    a Gemini call abandoned by a timeout doesn't hold up the test.
+    """
+    return run_on_new_loop
+
+@pytest.fixture
+def gemini_stub():
+    """
+    Starts a Gemini stand-in; call it with latency and faults, get back a client pool pointed at it.
+    """
+    servers = []
+
+    def start(latency: str = "none", faults: FaultModel = None) -> GeminiClientPool:
+        server = StubServerThread(create_app(Cassette(), latency={"*": LatencyModel(latency)}, faults=faults))
+        server.start()
+        servers.append(server)
+        return GeminiClientPool(base_url=server.url)
+
+    yield start
+    for server in servers:
+        server.stop()
+
+@pytest.fixture
+def app_client(gemini_stub, monkeypatch, tmp_path):
+    """
+    Starts the web app against a Gemini stand-in; call it with the stand-in's latency and
+    faults and the job queue's size, get back a running TestClient.
+
+    Caches, the brand index and the lexicon are left out so every upload reaches the
+    stand-in, and sessions and renditions live only as long as the test.
+    """
+    from fastapi.testclient import TestClient
+    from src import app_alt, lexicon, ocr
+    from src.images import RenditionStore
+    from src.jobs import JobQueue
+    from src.keys import KeyScheduler
+    from src.policies import call_policies
+    from src.clients import ScheduledClient
+    from src.sessions import MemorySessionBackend
+    clients = []
+
+    def start(latency: str = "none", faults: FaultModel = None, concurrency: int = 4,
+              max_queue_size: int = 100) -> TestClient:
+        scheduler = KeyScheduler({f"API_KEY{i}": f"test-key-{i}" for i in range(4)})
+        monkeypatch.setattr(ocr, "gemini_client", ScheduledClient(
+            gemini_stub(latency, faults), scheduler, call_policies["spell_check"]))
+        for name in ("result_cache", "spell_check_cache", "brand_index"):
+            monkeypatch.setattr(ocr, name, None)
+        monkeypatch.setattr(lexicon, "_drug_lexicon", None)
+        monkeypatch.setattr(lexicon, "_drug_lexicon_loaded", True)
+        monkeypatch.setattr(app_alt, "session_store", MemorySessionBackend())
+        monkeypatch.setattr(app_alt, "rendition_store", RenditionStore(str(tmp_path / "renditions")))
+        monkeypatch.setattr(app_alt, "job_queue", JobQueue(
+            app_alt.run_prescription_job, concurrency=concurrency, max_queue_size=max_queue_size,
+            on_update=app_alt.record_job_status))
+        client = TestClient(app_alt.app)
+        client.__enter__()
+        clients.append(client)
+        return client
+
+    yield start
+    for client in clients:
+        client.__exit__(None, None, None)
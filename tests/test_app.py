@@ -0,0 +1,82 @@
+import json
+import time
+from src.benchmark import synthetic_prescription
+from src.stub_server import FaultModel
+
+def upload(client, index: int = 0):
+    return client.post("/upload", files={"file": (f"{index}.jpg", synthetic_prescription(index), "image/jpeg")})
+
+def wait_for(client, job_id: str, timeout: float = 30) -> dict:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        status = client.get(f"/api/jobs/{job_id}").json()
+        if status["status"] in ("done", "failed"):
+            return status
+        time.sleep(0.05)
+    raise TimeoutError(f"Job {job_id} didn't finish")
+
+def read_events(client, job_id: str) -> list[tuple[str, dict]]:
+    with client.stream("GET", f"/api/jobs/{job_id}/events") as response:
+        assert response.headers["content-type"].startswith("text/event-stream")
+        body = "".join(response.iter_text())
+    events = []
+    for message in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in message.splitlines() if not line.startswith(":"))
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+def test_upload_is_processed_in_the_background(app_client):
+    client = app_client()
+
+    response = upload(client)
+    assert response.status_code == 202
+    job_id = response.json()["job_id"]
+
+    assert wait_for(client, job_id)["status"] == "done"
+    result = client.get(f"/api/prescription/{response.json()['session_id']}")
+    assert result.status_code == 200 and result.json()["medications"]
+
+def test_concurrent_jobs_make_progress_together(app_client):
+    client = app_client(latency="fixed:0.3", concurrency=3)
+
+    job_ids = [upload(client, index).json()["job_id"] for index in range(3)]
+    busiest = 0
+    while not all(client.get(f"/api/jobs/{job_id}").json()["status"] in ("done", "failed") for job_id in job_ids):
+        counts = client.get("/api/jobs").json()["jobs"]
+        busiest = max(busiest, counts["extracting"] + counts["spell_checking"] + counts["structuring"])
+        time.sleep(0.05)
+
+    assert [wait_for(client, job_id)["status"] for job_id in job_ids] == ["done"] * 3
+    assert busiest > 1
+
+def test_full_queue_is_refused_with_429(app_client):
+    client = app_client(latency="fixed:1", concurrency=1, max_queue_size=1)
+
+    # One job runs and one waits, so at most the third upload finds the queue full
+    statuses = [upload(client, index).status_code for index in range(4)]
+
+    assert statuses[0] == 202 and 429 in statuses[1:4]
+    refused = upload(client, 9)
+    assert refused.status_code == 429 and "queue is full" in refused.json()["detail"]
+
+def test_events_end_with_done(app_client):
+    client = app_client()
+
+    job_id = upload(client).json()["job_id"]
+    events = read_events(client, job_id)
+
+    names = [event for event, _ in events]
+    assert {"status", "medications", "spell_check"} <= set(names)
+    statuses = [data["status"] for event, data in events if event == "status"]
+    assert "extracting" in statuses
+    event, data = events[-1]
+    assert event == "status" and data["status"] == "done"
+
+def test_events_end_with_failed(app_client):
+    client = app_client(faults=FaultModel(rate=1.0, codes=[400]))
+
+    job_id = upload(client).json()["job_id"]
+    events = read_events(client, job_id)
+
+    event, data = events[-1]
+    assert event == "status" and data["status"] == "failed" and data["error"]
@@ -0,0 +1,80 @@
+import json
+import pytest
+from fastapi.testclient import TestClient
+from starlette.applications import Starlette
+from starlette.routing import Mount
+from src import assets
+from src.assets import IMMUTABLE_CACHE_CONTROL, SHORT_CACHE_CONTROL, StaticAssets, accepted_encodings, build
+
+SCRIPT = b"function hello() {\n  return 'hello';\n}\n" * 50
+
+@pytest.fixture
+def static(tmp_path):
+    source, build_dir = tmp_path / "public", tmp_path / "build" / "static"
+    (source / "vendor").mkdir(parents=True)
+    (source / "vendor" / "app.js").write_bytes(SCRIPT)
+    (source / "Animation.json").write_text(json.dumps({"frames": list(range(200))}, indent=4))
+    (source / "logo.png").write_bytes(b"\x89PNG\r\n\x1a\n" + bytes(range(256)) * 4)
+    manifest = build(str(source), str(build_dir))
+    static_assets = StaticAssets(str(source), str(build_dir))
+    client = TestClient(Starlette(routes=[Mount("/static", static_assets.files())]))
+    return static_assets, manifest, client
+
+def test_accept_encoding_is_parsed():
+    assert accepted_encodings("gzip, deflate, br;q=0.5") == {"gzip", "deflate", "br"}
+    assert accepted_encodings("br;q=0, GZIP;q=1.0, identity;q=bad") == {"gzip"}
+    assert accepted_encodings(None) == set()
+
+def test_build_fingerprints_minifies_and_precompresses(static, tmp_path):
+    static_assets, manifest, _ = static
+    built = tmp_path / "build" / "static"
+
+    assert static_assets.directory == str(built) and static_assets.manifest == manifest
+    assert manifest["vendor/app.js"].startswith("vendor/app.") and manifest["vendor/app.js"].endswith(".js")
+    assert b"\n" not in (built / manifest["Animation.json"]).read_bytes()
+    assert (built / (manifest["vendor/app.js"] + ".gz")).exists()
+    assert not (built / (manifest["logo.png"] + ".gz")).exists()
+    assert static_assets.url("vendor/app.js") == "/static/" + manifest["vendor/app.js"]
+
+@pytest.mark.parametrize("accept, encoding", [
+    ("gzip, br", "br" if assets.brotli else "gzip"),
+    ("gzip", "gzip"),
+    ("br;q=0, gzip", "gzip"),
+    ("identity", None),
+    (None, None),
+])
+def test_precompressed_variant_is_chosen_by_accept_encoding(static, accept, encoding):
+    _, manifest, client = static
+
+    response = client.get("/static/" + manifest["vendor/app.js"], headers={"Accept-Encoding": accept or ""})
+
+    assert response.status_code == 200 and response.content == SCRIPT
+    assert response.headers.get("content-encoding") == encoding
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert "javascript" in response.headers["content-type"] and response.headers["content-type"].endswith("charset=utf-8")
+    assert response.headers["cache-control"] == IMMUTABLE_CACHE_CONTROL
+
+def test_plain_names_get_the_latest_build_for_a_short_time(static):
+    _, _, client = static
+
+    response = client.get("/static/vendor/app.js", headers={"Accept-Encoding": "gzip"})
+
+    assert response.content == SCRIPT and response.headers["content-encoding"] == "gzip"
+    assert response.headers["cache-control"] == SHORT_CACHE_CONTROL
+
+def test_incompressible_assets_are_served_without_vary(static):
+    _, manifest, client = static
+
+    response = client.get("/static/" + manifest["logo.png"], headers={"Accept-Encoding": "gzip, br"})
+
+    assert response.status_code == 200 and "content-encoding" not in response.headers
+    assert "vary" not in response.headers
+
+def test_vendored_script_falls_back_to_its_pinned_url_until_downloaded(tmp_path):
+    static_assets = StaticAssets(str(tmp_path / "public"), str(tmp_path / "build"))
+    name, url = next(iter(assets.VENDOR_ASSETS.items()))
+
+    assert static_assets.url(name) == url
+    (tmp_path / "public" / name).parent.mkdir(parents=True)
+    (tmp_path / "public" / name).write_text("// vendored")
+    assert static_assets.url(name) == "/static/" + name
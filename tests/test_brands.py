@@ -0,0 +1,80 @@
+import time
+import pytest
+from src.brands import BrandIndex, brand_key
+from src.schema import SpellCheck
+
+@pytest.fixture
+def index(tmp_path):
+    return BrandIndex(str(tmp_path / "brands.sqlite3"), empty_ttl=60)
+
+def spell_check(generic: str, brands: list[str]) -> SpellCheck:
+    return SpellCheck(input_name=generic, corrected_name=generic, generic_name=[generic], brand_names=brands,
+                      is_correct=True, is_generic=True, notes="")
+
+def test_brand_key_normalizes_combinations():
+    assert brand_key(["Clavulanic Acid + Amoxicillin"]) == brand_key(["amoxicillin", "clavulanic acid"])
+    assert brand_key([]) == ""
+
+def test_lookups_and_fill(index):
+    index.put_many([(["Paracetamol"], ["Dolo 650", "Crocin", "Crocin"])], "csv")
+    assert index.get(["paracetamol"]) == ["Crocin", "Dolo 650"]
+    assert index.get(["Ibuprofen"]) is None
+    assert index.fill(spell_check("Paracetamol", [])).brand_names == ["Crocin", "Dolo 650"]
+    assert index.fill(spell_check("Ibuprofen", ["Brufen"])) is None
+    assert (index.hits, index.misses) == (2, 2)
+
+def test_learn_keeps_known_brand_names(index):
+    index.put_many([(["Paracetamol"], ["Crocin"])], "csv")
+    index.learn([spell_check("Paracetamol", ["Other"]), spell_check("Cetirizine", ["Okacet"])])
+    assert index.get(["Paracetamol"]) == ["Crocin"]
+    assert index.get(["Cetirizine"]) == ["Okacet"]
+
+def test_generic_without_brands_is_known_until_it_expires(index):
+    index.learn([spell_check("Vitamin D3", [])])
+    assert index.get(["Vitamin D3"]) == []
+    assert index.fill(spell_check("Vitamin D3", [])).brand_names == []
+
+    index.empty_ttl = 0
+    time.sleep(0.01)
+    assert index.get(["Vitamin D3"]) is None
+
+def test_brand_names_replace_an_empty_entry(index):
+    index.learn([spell_check("Vitamin D3", [])])
+    index.learn([spell_check("Vitamin D3", ["Calcirol"])])
+    assert index.get(["Vitamin D3"]) == ["Calcirol"]
+    # But an empty answer never replaces brand names
+    index.learn([spell_check("Vitamin D3", [])])
+    assert index.get(["Vitamin D3"]) == ["Calcirol"]
+
+def test_touch_refreshes_an_entry(index):
+    index.put_many([(["Paracetamol"], ["Crocin"])], "gemini")
+    time.sleep(0.01)
+    assert index.stale(0.005) == [["Paracetamol"]]
+    index.touch(["Paracetamol"])
+    assert index.stale(0.005) == []
+    assert index.get(["Paracetamol"]) == ["Crocin"]
+
+def test_import_and_refresh_change_the_version(index, tmp_path, run, monkeypatch):
+    from src import brands, ocr
+
+    assert index.version == 0
+    path = tmp_path / "drugs.csv"
+    path.write_text("generic_name,brand_name\nParacetamol,Crocin\nParacetamol,Dolo 650\n")
+    assert brands.import_csv(index, str(path)) == 1
+    assert index.version == 1
+
+    async def answer(name, client, use_brand_index=True):
+        return ocr.SpellCheckResponse(drugs=[spell_check(name, ["Calpol"])])
+    monkeypatch.setattr(ocr, "spell_check_medicine_name_async", answer)
+    index.put_many([(["Paracetamol"], ["Crocin"])], "gemini")
+    assert run(brands.refresh(index, older_than=0)) == 1
+    assert index.version == 2
+    assert index.get(["Paracetamol"]) == ["Calpol"]
+
+def test_result_cache_key_follows_the_index_version(index, monkeypatch):
+    from src import ocr
+
+    monkeypatch.setattr(ocr, "brand_index", index)
+    before = ocr.result_cache_key(b"\xff\xd8image")
+    index.bump_version()
+    assert ocr.result_cache_key(b"\xff\xd8image") != before
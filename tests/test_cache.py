@@ -0,0 +1,110 @@
+import pytest
+from src import cache, ocr
+from src.cache import ResultCache, SQLiteCache, SpellCheckCache, normalize_drug_name
+from src.dummydata import generate_dummy_data
+from src.metrics import stage_duration
+from src.schema import SpellCheck, SpellCheckResponse
+
+class Clock:
+    def __init__(self, now: float = 1_000_000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache.time, "time", clock)
+    return clock
+
+def spell_check(name: str, corrected: str = None) -> SpellCheck:
+    return SpellCheck(input_name=name, corrected_name=corrected or name, generic_name=[corrected or name],
+                      brand_names=[], is_correct=corrected is None, is_generic=True, notes="")
+
+def test_entries_expire_after_the_ttl(tmp_path, clock):
+    store = SQLiteCache(str(tmp_path / "cache.sqlite3"), "entries", ttl=60, max_entries=10)
+    store.set("a", "1")
+
+    clock.now += 59
+    assert store.get("a") == "1"
+    clock.now += 2
+    assert store.get("a") is None
+    assert (store.hits, store.misses) == (1, 1)
+
+def test_least_recently_used_entries_are_evicted(tmp_path, clock):
+    store = SQLiteCache(str(tmp_path / "cache.sqlite3"), "entries", ttl=3600, max_entries=2)
+    store.set("a", "1")
+    clock.now += 1
+    store.set("b", "2")
+    clock.now += 1
+    assert store.get("a") == "1"
+    clock.now += 1
+    store.set("c", "3")
+
+    assert store.get_many(["a", "b", "c"]) == {"a": "1", "c": "3"}
+    assert store.stats()["entries"] == 2
+
+def test_size_limit_evicts_the_least_recently_used(tmp_path, clock):
+    store = SQLiteCache(str(tmp_path / "cache.sqlite3"), "entries", ttl=3600, max_entries=10, max_bytes=10)
+    for key in "abc":
+        store.set(key, key * 4)
+        clock.now += 1
+
+    assert store.get_many(["a", "b", "c"]) == {"b": "bbbb", "c": "cccc"}
+    assert store.stats()["bytes"] == 8
+
+def test_spell_checks_are_shared_by_spelling_variants(tmp_path, clock):
+    checks = SpellCheckCache(str(tmp_path / "spell_checks.sqlite3"))
+    checks.put_spell_checks({"Amoxicillin + Clavulanate": spell_check("Amoxicillin + Clavulanate")})
+
+    found = checks.get_spell_checks(["amoxicillin  clavulanate", "Paracetamol"])
+
+    assert list(found) == ["amoxicillin  clavulanate"]
+    assert found["amoxicillin  clavulanate"].input_name == "amoxicillin  clavulanate"
+    assert normalize_drug_name("Amoxicillin + Clavulanate") == "amoxicillin clavulanate"
+
+def test_result_cache_round_trip(tmp_path):
+    medications, spell_checks = generate_dummy_data()
+    results = ResultCache(str(tmp_path / "results.sqlite3"))
+    assert results.get_result("key") is None
+
+    results.put_result("key", medications, spell_checks)
+
+    assert results.get_result("key") == (medications, spell_checks)
+    assert results.stats()["hits"] == 1 and results.stats()["misses"] == 1
+
+def test_repeated_prescription_is_answered_from_the_result_cache(run, tmp_path, monkeypatch):
+    medications, _ = generate_dummy_data()
+    extractions = []
+
+    async def extract(page, mime_type=None, on_event=None):
+        extractions.append(page)
+        return medications.model_copy(deep=True)
+
+    async def spell_check_names(names, client, on_stage=None, on_event=None):
+        return SpellCheckResponse(drugs=[spell_check(name) for name in dict.fromkeys(names)])
+
+    monkeypatch.setattr(ocr, "result_cache", ResultCache(str(tmp_path / "results.sqlite3")))
+    monkeypatch.setattr(ocr, "extract_text_from_image_async", extract)
+    monkeypatch.setattr(ocr, "spell_check_medicine_names_async", spell_check_names)
+    monkeypatch.setattr(ocr, "get_drug_lexicon", lambda: None)
+    monkeypatch.setattr(ocr, "brand_index", None)
+
+    def prescriptions() -> int:
+        return sum(value for suffix, labels, value in stage_duration.samples()
+                   if suffix == "_count" and labels == {"stage": "prescription"})
+
+    first = run(ocr.process_prescription_with_spell_check_async(b"\xff\xd8\xffimage"))
+    timed = prescriptions()
+    events = []
+    second = run(ocr.process_prescription_with_spell_check_async(
+        b"\xff\xd8\xffimage", on_event=lambda event, data: events.append(event)))
+
+    assert second == first and len(extractions) == 1
+    assert events == ["medications", "spell_check"]
+    # Cache hits are timed as prescriptions too
+    assert prescriptions() == timed + 1
+
+    run(ocr.process_prescription_with_spell_check_async(b"\xff\xd8\xffimage", force=True))
+    assert len(extractions) == 2
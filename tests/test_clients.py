@@ -0,0 +1,145 @@
+import asyncio
+import time
+import pytest
+from google.genai import errors
+from src.clients import AsyncScheduledModels, ScheduledStream
+from src.exceptions import GeminiError
+from src.keys import KeyScheduler
+from src.policies import CallPolicy
+from src.prompts import ocr_system_prompt, spell_system_prompt
+from src.stub_server import FaultModel
+
+MODEL = "gemini-2.0-flash"
+
+class RateLimited(Exception):
+    code = 429
+
+def spell_check_request() -> dict:
+    """A spell check call, which the stand-in answers synthetically."""
+    return {"model": MODEL, "contents": "Paracetomol", "config": {"system_instruction": spell_system_prompt}}
+
+def scheduled_models(pool, keys: int = 1, **policy) -> AsyncScheduledModels:
+    scheduler = KeyScheduler({f"API_KEY{i}": f"test-key-{i}" for i in range(keys)}, cooldown=0.1)
+    settings = {"timeout": 5, "deadline": 10, "attempts": 3, "backoff": 0.05, "hedge": False} | policy
+    return AsyncScheduledModels(pool, scheduler, CallPolicy("test", **settings))
+
+def test_retries_rate_limits_and_server_errors(gemini_stub, run):
+    models = scheduled_models(gemini_stub(faults=FaultModel(codes=[429, 503], first=2)))
+
+    response = run(models.generate_content(**spell_check_request()))
+
+    assert response.text
+    assert models._policy.retries == 2
+    assert models._policy.failures == 0
+
+def test_does_not_retry_client_errors(gemini_stub, run):
+    models = scheduled_models(gemini_stub(faults=FaultModel(rate=1.0, codes=[400])))
+
+    with pytest.raises(errors.ClientError):
+        run(models.generate_content(**spell_check_request()))
+
+    assert models._policy.retries == 0
+    assert models._policy.failures == 1
+
+def test_meets_deadline_when_every_attempt_is_slow(gemini_stub, run):
+    models = scheduled_models(gemini_stub(latency="fixed:3"), timeout=0.4, deadline=1.0, attempts=5)
+
+    start = time.monotonic()
+    with pytest.raises(GeminiError):
+        run(models.generate_content(**spell_check_request()))
+
+    assert time.monotonic() - start < 1.5
+
+def test_meets_deadline_while_waiting_for_a_key(gemini_stub, run):
+    models = scheduled_models(gemini_stub(), timeout=1.0, deadline=1.0)
+    scheduler = models._scheduler
+    scheduler.cooldown = 8
+    scheduler.release(scheduler.acquire(), error=RateLimited())
+
+    start = time.monotonic()
+    with pytest.raises(GeminiError):
+        run(models.generate_content(**spell_check_request()))
+
+    assert time.monotonic() - start < 1.5
+
+def test_hedge_wins_over_slow_attempt(gemini_stub, run):
+    models = scheduled_models(gemini_stub(latency="cycle:3:0.05"), keys=2, hedge=True, hedge_delay=0.2)
+
+    start = time.monotonic()
+    response = run(models.generate_content(**spell_check_request()))
+
+    assert response.text
+    assert time.monotonic() - start < 1.5
+    assert models._policy.hedges == 1
+    assert models._policy.hedge_wins == 1
+
+def test_cooling_down_key_does_not_stall_primary(gemini_stub, run):
+    models = scheduled_models(gemini_stub(latency="fixed:1"), keys=2, hedge=True, hedge_delay=0.2)
+    scheduler = models._scheduler
+    scheduler.cooldown = 8
+    scheduler.release(scheduler.acquire(exclude={"test-key-0"}), error=RateLimited())
+
+    start = time.monotonic()
+    response = run(models.generate_content(**spell_check_request()))
+
+    assert response.text
+    assert time.monotonic() - start < 2
+    assert models._policy.hedges == 0
+
+def ocr_request() -> dict:
+    """An OCR call, which the stand-in answers with text it can stream in several chunks."""
+    return {"model": MODEL, "contents": ["this", "prescription"], "config": {"system_instruction": ocr_system_prompt}}
+
+def in_flight(models) -> int:
+    return sum(key["in_flight"] for key in models._scheduler.stats()["keys"].values())
+
+def test_stream_releases_its_key_when_read_to_the_end(gemini_stub, run):
+    models = scheduled_models(gemini_stub())
+
+    async def read():
+        stream = await models.generate_content_stream(**ocr_request())
+        assert in_flight(models) == 1
+        return [chunk async for chunk in stream]
+
+    assert run(read())
+    assert in_flight(models) == 0
+
+@pytest.mark.parametrize("ending", ["aclose", "async_with", "dropped"])
+def test_stream_releases_its_key_when_abandoned(gemini_stub, run, ending):
+    models = scheduled_models(gemini_stub())
+
+    async def abandon():
+        stream = await models.generate_content_stream(**ocr_request())
+        assert in_flight(models) == 1
+        if ending == "aclose":
+            await stream.aclose()
+        elif ending == "async_with":
+            async with stream:
+                await anext(stream)
+        else:
+            del stream
+
+    run(abandon())
+    assert in_flight(models) == 0
+
+def test_stream_releases_its_key_when_the_reader_is_cancelled(run):
+    scheduler = KeyScheduler({"API_KEY0": "test-key-0"})
+
+    async def stalled():
+        yield "first"
+        await asyncio.sleep(60)
+
+    async def cancel_reader():
+        chunks = stalled()
+        stream = ScheduledStream(scheduler, scheduler.acquire(), chunks, await anext(chunks),
+                                 CallPolicy("test", timeout=60, deadline=60), MODEL, 0.1)
+        assert await anext(stream) == "first"
+        reader = asyncio.create_task(anext(stream))
+        await asyncio.sleep(0.05)
+        reader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await reader
+        assert scheduler.stats()["keys"]["API_KEY0"]["errors"] == 0
+
+    run(cancel_reader())
+    assert scheduler.stats()["keys"]["API_KEY0"]["in_flight"] == 0
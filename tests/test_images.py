@@ -0,0 +1,80 @@
+import hashlib
+import os
+import time
+import pytest
+from src.benchmark import synthetic_prescription
+from src.images import RenditionStore, etag_matches, image_etag, parse_range
+from tests.test_app import upload, wait_for
+
+def test_if_none_match_uses_weak_comparison():
+    etag = image_etag("abc")
+    assert etag == '"abc"' and image_etag("abc", "thumb").startswith('"abc-thumb')
+    assert etag_matches('"abc"', etag) and etag_matches('W/"abc"', etag)
+    assert etag_matches('"other", W/"abc"', etag) and etag_matches("*", etag)
+    assert etag_matches('"abc-gzip"', etag, '"abc-gzip"')
+    assert not etag_matches(None, etag) and not etag_matches('"abd"', etag)
+
+@pytest.mark.parametrize("header, expected", [
+    (None, None),
+    ("bytes=0-9", (0, 9)),
+    ("bytes=90-", (90, 99)),
+    ("bytes=-10", (90, 99)),
+    ("bytes=-500", (0, 99)),
+    ("bytes=95-500", (95, 99)),
+    ("bytes=0-1,5-6", None),
+    ("items=0-1", None),
+])
+def test_single_byte_ranges_are_parsed(header, expected):
+    assert parse_range(header, 100) == expected
+
+@pytest.mark.parametrize("header", ["bytes=100-", "bytes=20-10", "bytes=-0"])
+def test_unsatisfiable_ranges_raise_value_error(header):
+    with pytest.raises(ValueError):
+        parse_range(header, 100)
+
+def test_renditions_are_made_once_and_pruned(tmp_path):
+    store = RenditionStore(str(tmp_path))
+    page = synthetic_prescription(0)
+
+    [sha256] = store.render_pages([page])
+
+    assert sha256 == hashlib.sha256(page).hexdigest()
+    thumb, screen = store.get(sha256, "thumb"), store.get(sha256, "screen")
+    assert store.mime_type(thumb) == "image/jpeg" and os.path.getsize(thumb) < os.path.getsize(screen)
+    made = os.path.getmtime(thumb)
+    store.render(page, sha256)
+    assert os.path.getmtime(thumb) == made
+
+    assert store.prune(3600) == 0
+    os.utime(thumb, (time.time() - 7200,) * 2)
+    assert store.prune(3600) == 1 and store.get(sha256, "thumb") is None
+
+def test_prescription_image_supports_etags_and_ranges(app_client):
+    client = app_client()
+    image = synthetic_prescription(0)
+    response = upload(client)
+    wait_for(client, response.json()["job_id"])
+    url = f"/api/prescription-image/{response.json()['session_id']}"
+
+    original = client.get(url)
+    etag = original.headers["etag"]
+    assert original.content == image and etag == image_etag(hashlib.sha256(image).hexdigest())
+    assert "immutable" in original.headers["cache-control"] and original.headers["accept-ranges"] == "bytes"
+    assert client.get(url, headers={"If-None-Match": etag}).status_code == 304
+
+    part = client.get(url, headers={"Range": "bytes=10-19"})
+    assert part.status_code == 206 and part.content == image[10:20]
+    assert part.headers["content-range"] == f"bytes 10-19/{len(image)}"
+    assert client.get(url, headers={"Range": "bytes=10-19", "If-Range": etag}).status_code == 206
+    assert client.get(url, headers={"Range": "bytes=10-19", "If-Range": '"stale"'}).status_code == 200
+    unsatisfiable = client.get(url, headers={"Range": f"bytes={len(image)}-"})
+    assert unsatisfiable.status_code == 416 and unsatisfiable.headers["content-range"] == f"bytes */{len(image)}"
+
+    thumb = client.get(url, params={"size": "thumb"})
+    assert thumb.status_code == 200 and thumb.headers["content-type"] == "image/jpeg"
+    assert thumb.headers["etag"] != etag and len(thumb.content) < len(image)
+    assert client.get(url, params={"size": "thumb"}, headers={"If-None-Match": thumb.headers["etag"]}).status_code == 304
+    thumb_part = client.get(url, params={"size": "thumb"}, headers={"Range": "bytes=0-99"})
+    assert thumb_part.status_code == 206 and thumb_part.content == thumb.content[:100]
+
+    assert client.get(url, params={"page": 1}).status_code == 404
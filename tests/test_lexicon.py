@@ -0,0 +1,70 @@
+from src import lexicon
+from src.lexicon import DrugLexicon, deletes, edit_distance
+
+CSV = """generic_name,brand_name
+Paracetamol,Crocin
+Paracetamol,Dolo 650
+Paracetamol,Dolo 500
+Amoxicillin + Clavulanic Acid,Augmentin
+Metformin,
+Cefixime,Taxim
+Cefuroxime,
+"""
+
+def make_lexicon(tmp_path, index_dir=None) -> DrugLexicon:
+    path = tmp_path / "lexicon.csv"
+    path.write_text(CSV)
+    return DrugLexicon.from_csv(str(path), index_dir=index_dir)
+
+def test_edit_distance():
+    assert edit_distance("paracetamol", "paracetamol", 1) == 0
+    assert edit_distance("paracetomol", "paracetamol", 1) == 1
+    assert edit_distance("paracetaoml", "paracetamol", 1) == 1
+    assert edit_distance("parcetomol", "paracetamol", 1) == 2
+    assert deletes("abc", 1) == {"abc", "bc", "ac", "ab"}
+
+def test_exact_and_corrected_lookups(tmp_path):
+    drugs = make_lexicon(tmp_path)
+    exact = drugs.spell_check("paracetamol")
+    assert exact.is_correct and exact.is_generic and exact.corrected_name == "paracetamol"
+    assert exact.brand_names == ["Crocin", "Dolo 500", "Dolo 650"]
+
+    corrected = drugs.spell_check("Paracetomol")
+    assert not corrected.is_correct and corrected.corrected_name == "Paracetamol"
+
+    brand = drugs.spell_check("Augmentn")
+    assert brand.corrected_name == "Augmentin" and not brand.is_generic
+    assert brand.generic_name == ["Amoxicillin", "Clavulanic Acid"]
+
+def test_unknown_short_and_ambiguous_names_are_left_to_gemini(tmp_path):
+    drugs = make_lexicon(tmp_path)
+    # Too far from anything, too short to correct, and one edit from two names
+    assert drugs.spell_check("Ibuprofen") is None
+    assert drugs.spell_check("Taxi") is None
+    matches, distance = drugs.lookup("Dolo 600")
+    assert sorted(entry.name for entry in matches) == ["Dolo 500", "Dolo 650"] and distance == 1
+    assert drugs.spell_check("Dolo 600") is None
+    matched, remaining = drugs.spell_check_names(["Metformn", "Ibuprofen", "Metformn", "Crocin"])
+    assert list(matched) == ["Metformn", "Crocin"] and remaining == ["Ibuprofen"]
+
+def test_saved_index_is_reused_until_the_csv_changes(tmp_path):
+    built = make_lexicon(tmp_path, index_dir=str(tmp_path / "index"))
+    [saved] = (tmp_path / "index").iterdir()
+    reloaded = make_lexicon(tmp_path, index_dir=str(tmp_path / "index"))
+    assert reloaded.version == built.version and reloaded.entries == built.entries
+
+    (tmp_path / "lexicon.csv").write_text(CSV + "Ibuprofen,Brufen\n")
+    changed = DrugLexicon.from_csv(str(tmp_path / "lexicon.csv"), index_dir=str(tmp_path / "index"))
+    assert changed.version != built.version and changed.spell_check("Ibuprofen")
+    assert len(list((tmp_path / "index").iterdir())) == 2 and saved.exists()
+
+def test_lexicon_is_loaded_once_on_first_use(tmp_path, monkeypatch):
+    path = tmp_path / "lexicon.csv"
+    path.write_text(CSV)
+    loads = []
+    monkeypatch.setattr(lexicon, "_drug_lexicon", None)
+    monkeypatch.setattr(lexicon, "_drug_lexicon_loaded", False)
+    monkeypatch.setattr(lexicon, "load_drug_lexicon",
+                        lambda: loads.append(1) or DrugLexicon.from_csv(str(path), index_dir=None))
+    first = lexicon.get_drug_lexicon()
+    assert first.spell_check("Crocin") and lexicon.get_drug_lexicon() is first and len(loads) == 1
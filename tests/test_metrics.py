@@ -0,0 +1,59 @@
+import pytest
+from src.metrics import Counter, Gauge, Histogram, MetricsRegistry, format_labels, format_value
+
+def test_values_and_labels_are_formatted_for_prometheus():
+    assert [format_value(value) for value in (3, 2.0, 0.25, float("inf"))] == ["3", "2", "0.25", "+Inf"]
+    assert format_labels({}) == ""
+    assert format_labels({"path": 'C:\\a "b"\nc'}) == '{path="C:\\\\a \\"b\\"\\nc"}'
+
+def test_registry_renders_the_text_exposition_format():
+    registry = MetricsRegistry()
+    calls = registry.register(Counter("app_calls_total", "Calls made", ("outcome",)))
+    in_flight = registry.register(Gauge("app_in_flight", "Calls in flight"))
+    duration = registry.register(Histogram("app_duration_seconds", "Call duration", ("stage",), buckets=(0.1, 1.0)))
+    calls.inc(outcome="ok")
+    calls.inc(2, outcome="ok")
+    in_flight.inc()
+    for seconds in (0.05, 0.5, 5):
+        duration.observe(seconds, stage="ocr")
+
+    assert registry.render() == "\n".join([
+        "# HELP app_calls_total Calls made",
+        "# TYPE app_calls_total counter",
+        'app_calls_total{outcome="ok"} 3',
+        "# HELP app_in_flight Calls in flight",
+        "# TYPE app_in_flight gauge",
+        "app_in_flight 1",
+        "# HELP app_duration_seconds Call duration",
+        "# TYPE app_duration_seconds histogram",
+        'app_duration_seconds_bucket{stage="ocr",le="0.1"} 1',
+        'app_duration_seconds_bucket{stage="ocr",le="1"} 2',
+        'app_duration_seconds_bucket{stage="ocr",le="+Inf"} 3',
+        'app_duration_seconds_sum{stage="ocr"} 5.55',
+        'app_duration_seconds_count{stage="ocr"} 3',
+    ]) + "\n"
+
+def test_collectors_run_before_every_render():
+    registry = MetricsRegistry()
+    sessions = registry.register(Gauge("app_sessions", "Sessions held"))
+    held = iter([4, 2])
+    registry.add_collector(lambda: sessions.set(next(held)))
+
+    assert "app_sessions 4\n" in registry.render()
+    assert "app_sessions 2\n" in registry.render()
+
+def test_samples_need_exactly_the_declared_labels():
+    calls = Counter("app_calls_total", "Calls made", ("outcome",))
+    with pytest.raises(ValueError):
+        calls.inc()
+    with pytest.raises(ValueError):
+        calls.inc(outcome="ok", key="API_KEY0")
+
+def test_metrics_endpoint_serves_the_text_format(app_client):
+    client = app_client()
+
+    response = client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert "# TYPE pharma_stage_duration_seconds histogram" in response.text
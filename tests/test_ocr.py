@@ -0,0 +1,88 @@
+import asyncio
+from types import SimpleNamespace
+import pytest
+from src import ocr
+from src.dummydata import generate_dummy_data
+from src.lexicon import DrugLexicon
+from src.schema import SpellCheck, SpellCheckResponse
+
+class FakeModels:
+    """Answers the per-drug spell check calls, with a slow first call for some names"""
+    def __init__(self, delays: dict[str, float]):
+        self.delays = delays
+        self.checked = set()
+
+    async def generate_content(self, model, contents, config=None):
+        if len(contents) == 1:
+            name = contents[0]
+            await asyncio.sleep(self.delays.get(name, 0))
+            self.checked.add(name)
+            return SimpleNamespace(text=f"Input name: {name}")
+        if contents[0] == ocr.spell_list_brand_name_prompt:
+            return SimpleNamespace(text="Brand names: none")
+        name = contents[1].removeprefix("Input name: ")
+        return SimpleNamespace(text="", parsed=SpellCheckResponse(drugs=[SpellCheck(
+            input_name=name, corrected_name=name, generic_name=[name], brand_names=[],
+            is_correct=True, is_generic=True, notes="",
+        )]))
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(ocr, "brand_index", None)
+    monkeypatch.setattr(ocr, "spell_check_cache", None)
+    models = FakeModels({"Paracetamol": 0.2})
+    return SimpleNamespace(models=models, aio=SimpleNamespace(models=models))
+
+@pytest.mark.parametrize("mode", ["per_drug", "batched"])
+def test_structuring_starts_once_every_name_is_checked(run, client, mode, monkeypatch):
+    names = ["Paracetamol", "Cetirizine", "Amoxicillin"]
+    stages = []
+
+    async def batch_answers_nothing(names, client, on_stage=None):
+        return {}
+    monkeypatch.setattr(ocr, "spell_check_batch_async", batch_answers_nothing)
+
+    def on_stage(stage):
+        stages.append((stage, set(client.aio.models.checked)))
+
+    response = run(ocr.spell_check_medicine_names_async(names, client, on_stage=on_stage, mode=mode))
+
+    assert [drug.input_name for drug in response.drugs] == names
+    assert stages == [("structuring", set(names))]
+
+def test_unknown_mode_is_refused(run, client):
+    with pytest.raises(ValueError):
+        run(ocr.spell_check_medicine_names_async(["Paracetamol"], client, mode="bached"))
+
+def test_structuring_is_reported_when_the_cache_answers_every_name(run, client, monkeypatch):
+    cached = {name: SpellCheck(input_name=name, corrected_name=name, generic_name=[name], brand_names=[],
+                               is_correct=True, is_generic=True, notes="") for name in ["Cetirizine", "Amoxicillin"]}
+    monkeypatch.setattr(ocr, "spell_check_cache", SimpleNamespace(
+        get_spell_checks=lambda names: {name: cached[name] for name in names if name in cached},
+        put_spell_checks=lambda results: None,
+    ))
+    stages = []
+
+    response = run(ocr.spell_check_medicine_names_async(list(cached), client, on_stage=stages.append))
+
+    assert [drug.input_name for drug in response.drugs] == list(cached)
+    assert client.aio.models.checked == set()
+    assert stages == ["structuring"]
+
+def test_structuring_is_reported_when_the_lexicon_answers_every_name(run, client, monkeypatch, tmp_path):
+    medications, _ = generate_dummy_data()
+    names = ocr.get_medicine_names(medications)
+    path = tmp_path / "lexicon.csv"
+    path.write_text("generic_name,brand_name\n" + "".join(f"{name},\n" for name in names))
+    monkeypatch.setattr(ocr, "get_drug_lexicon", lambda: DrugLexicon.from_csv(str(path), index_dir=None))
+    monkeypatch.setattr(ocr, "result_cache", None)
+
+    async def extract(page, mime_type=None, on_event=None):
+        return medications
+    monkeypatch.setattr(ocr, "extract_text_from_image_async", extract)
+    stages = []
+
+    _, spell_checks = run(ocr.process_prescription_with_spell_check_async(b"\xff\xd8\xff", on_stage=stages.append))
+
+    assert len(spell_checks.drugs) == len(set(names)) and client.aio.models.checked == set()
+    assert stages == ["extracting", "spell_checking", "structuring"]
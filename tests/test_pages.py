@@ -0,0 +1,25 @@
+import struct
+import pytest
+from src.pages import PAGES_MAGIC, pack_pages, unpack_pages
+
+def test_pages_round_trip():
+    pages = [b"\xff\xd8first", b"\x89PNGsecond", b""]
+    assert unpack_pages(pack_pages(pages)) == pages
+    assert pack_pages([b"\xff\xd8only"]) == b"\xff\xd8only"
+    assert unpack_pages(b"\xff\xd8only") == [b"\xff\xd8only"]
+
+def test_single_page_that_looks_like_a_blob_round_trips():
+    page = PAGES_MAGIC + b"not really a header"
+    assert unpack_pages(pack_pages([page])) == [page]
+
+@pytest.mark.parametrize("blob", [
+    PAGES_MAGIC,
+    PAGES_MAGIC + b"\0\0",
+    PAGES_MAGIC + struct.pack(">I", 0),
+    PAGES_MAGIC + struct.pack(">I", 1_000_000) + b"\0" * 8,
+    PAGES_MAGIC + struct.pack(">II", 1, 10) + b"short",
+    PAGES_MAGIC + struct.pack(">II", 1, 2) + b"too long",
+])
+def test_corrupt_blob_raises_value_error(blob):
+    with pytest.raises(ValueError):
+        unpack_pages(blob)
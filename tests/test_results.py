@@ -0,0 +1,52 @@
+import json
+from src.dummydata import generate_dummy_data
+from src.results import encode_result, gzip_body, gzip_etag, result_body
+
+def test_result_is_encoded_once_with_an_etag_per_view():
+    medications, spell_checks = generate_dummy_data()
+    result = encode_result(medications, spell_checks)
+
+    assert json.loads(result_body(result, "result")) == {
+        "medications": json.loads(result["medications"]),
+        "spell_check": json.loads(result["spell_check"]),
+    }
+    assert json.loads(result_body(result, "medications"))["medications"][0]["Medication Name"]
+    assert len(set(result["etags"].values())) == 3
+    assert encode_result(medications, spell_checks)["etags"] == result["etags"]
+
+    medications.medications[0].quantity += 1
+    changed = encode_result(medications, spell_checks)["etags"]
+    assert changed["spell_check"] == result["etags"]["spell_check"]
+    assert changed["medications"] != result["etags"]["medications"]
+
+def test_missing_parts_are_encoded_as_null():
+    medications, _ = generate_dummy_data()
+    result = encode_result(medications, None)
+
+    assert result["spell_check"] is None
+    assert json.loads(result_body(result, "result"))["spell_check"] is None
+
+def test_gzipped_body_has_its_own_etag_and_is_compressed_once():
+    assert gzip_etag('"abc"') == '"abc-gz"'
+    body = b'{"medications":[]}' * 100
+    assert gzip_body('"abc"', body) is gzip_body('"abc"', body)
+
+def test_result_endpoint_serves_gzip_with_its_own_etag(app_client):
+    client = app_client()
+    session_id = client.post("/upload", data={"use_dummy": "true"}).json()["session_id"]
+    url = f"/api/result/{session_id}"
+
+    plain = client.get(url, headers={"Accept-Encoding": "identity"})
+    gzipped = client.get(url, headers={"Accept-Encoding": "gzip"})
+
+    etag = plain.headers["etag"]
+    assert "content-encoding" not in plain.headers and plain.headers["vary"] == "Accept-Encoding"
+    assert gzipped.headers["content-encoding"] == "gzip" and gzipped.headers["etag"] == gzip_etag(etag)
+    assert gzipped.json() == plain.json()
+    # Either ETag proves the client's copy current, whichever encoding it asks for now
+    for if_none_match in (etag, gzip_etag(etag), f'W/{gzip_etag(etag)}'):
+        for accept in ("identity", "gzip"):
+            response = client.get(url, headers={"Accept-Encoding": accept, "If-None-Match": if_none_match})
+            assert response.status_code == 304
+    assert client.get(url, headers={"If-None-Match": '"stale"'}).status_code == 200
+    assert client.get("/api/result/unknown").status_code == 404
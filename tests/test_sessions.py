@@ -0,0 +1,56 @@
+import time
+import pytest
+from src.dummydata import generate_dummy_data
+from src.sessions import MemorySessionBackend, RedisSessionBackend, SQLiteSessionBackend
+
+IMAGE = b"\xff\xd8" + b"\0" * 10_000
+
+@pytest.fixture(params=["memory", "sqlite", "redis"])
+def backend(request, tmp_path):
+    if request.param == "memory":
+        return MemorySessionBackend(max_bytes=100_000)
+    if request.param == "sqlite":
+        return SQLiteSessionBackend(str(tmp_path / "sessions.sqlite3"), max_bytes=100_000)
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa")
+    return RedisSessionBackend(client=fakeredis.FakeRedis(), max_bytes=100_000)
+
+def session_data() -> dict:
+    final_data, spell_check_data = generate_dummy_data()
+    return {"final_data": final_data, "spell_check_data": spell_check_data, "edited_data": None}
+
+def test_evicts_least_recently_used_sessions_over_budget(backend):
+    for i in range(5):
+        backend.put(f"session-{i}", session_data(), IMAGE)
+    backend.get("session-0")
+    for i in range(5, 20):
+        backend.put(f"session-{i}", session_data(), IMAGE)
+
+    stats = backend.stats()
+    assert stats["bytes"] <= 100_000
+    assert stats["evictions"] == 20 - stats["entries"]
+    assert backend.get("session-1") is None
+    assert backend.get("session-19")["final_data"].medications
+
+def test_totals_follow_updates_and_deletes(backend):
+    backend.put("kept", session_data(), IMAGE)
+    backend.put("deleted", session_data(), IMAGE)
+    one_session = backend.stats()["bytes"] // 2
+
+    assert backend.update("kept", {"edited_data": [{"Medication Name": "Paracetamol"}]})
+    backend.delete("deleted")
+
+    stats = backend.stats()
+    assert stats["entries"] == 1
+    assert one_session < stats["bytes"] < one_session + 200
+    assert backend.get_image("kept") == IMAGE
+    assert not backend.update("deleted", {"edited_data": []})
+
+def test_sweep_counts_expired_sessions(backend):
+    backend.put("expired", session_data(), IMAGE)
+    backend.ttl = 0.0
+    time.sleep(0.01)
+
+    assert backend.sweep() == 1
+    stats = backend.stats()
+    assert (stats["entries"], stats["bytes"], stats["expirations"]) == (0, 0, 1)
@@ -0,0 +1,105 @@
+import hashlib
+import pytest
+from src import app_alt
+from src.exceptions import UploadTooLarge
+from src.pages import MAX_PAGES
+from src.uploads import UPLOAD_MAX_BYTES, receive_upload_form
+
+BOUNDARY = b"x7boundary"
+
+class StreamedRequest:
+    """Stands in for a Starlette Request, streaming a body in chunks and counting how many were read"""
+    def __init__(self, body: bytes, content_type: str = f"multipart/form-data; boundary={BOUNDARY.decode()}",
+                 chunk_size: int = 4096):
+        self.headers = {"content-type": content_type}
+        self.chunks = [body[i:i + chunk_size] for i in range(0, len(body), chunk_size)]
+        self.read = 0
+
+    async def stream(self):
+        for chunk in self.chunks:
+            self.read += 1
+            yield chunk
+
+def multipart(*parts) -> bytes:
+    body = b""
+    for name, value, filename in parts:
+        disposition = f'form-data; name="{name}"' + (f'; filename="{filename}"' if filename else "")
+        body += b"--" + BOUNDARY + f"\r\nContent-Disposition: {disposition}\r\n\r\n".encode() + value + b"\r\n"
+    return body + b"--" + BOUNDARY + b"--\r\n"
+
+def test_small_files_stay_in_memory(run, tmp_path):
+    image = b"\xff\xd8\xff" + b"a" * 1000
+    request = StreamedRequest(multipart(("file", image, "a.jpg"), ("use_dummy", b"false", None)))
+    form = run(receive_upload_form(request, spool_dir=str(tmp_path)))
+    [upload] = form.files["file"]
+    assert (upload.filename, upload.content_type, upload.size) == ("a.jpg", "image/jpeg", len(image))
+    assert upload.sha256 == hashlib.sha256(image).hexdigest()
+    assert upload.path is None and upload.read() == image
+    assert form.fields == {"use_dummy": "false"}
+    assert not list(tmp_path.iterdir())
+
+def test_large_files_are_spooled_once(run, tmp_path):
+    first, second = b"\x89PNG\r\n\x1a\n" + b"p" * 50_000, b"%PDF" + b"d" * 30_000
+    request = StreamedRequest(multipart(("files", first, "1.png"), ("files", second, "2.pdf")))
+    form = run(receive_upload_form(request, spool_threshold=20_000, spool_dir=str(tmp_path)))
+    uploads = form.files["files"]
+    assert [upload.content_type for upload in uploads] == ["image/png", "application/pdf"]
+    assert [upload.read() for upload in uploads] == [first, second]
+    assert sorted(p.name for p in tmp_path.iterdir()) == sorted(
+        upload.path.rsplit("/", 1)[-1] for upload in uploads)
+    for upload in uploads:
+        upload.close()
+    assert not list(tmp_path.iterdir())
+
+def test_oversized_file_is_refused_before_the_body_is_read(run, tmp_path):
+    request = StreamedRequest(multipart(("file", b"\xff\xd8\xff" + b"z" * 200_000, "big.jpg")))
+    with pytest.raises(UploadTooLarge):
+        run(receive_upload_form(request, max_bytes=50_000, spool_threshold=10_000, spool_dir=str(tmp_path)))
+    assert request.read < len(request.chunks) / 2
+    assert not list(tmp_path.iterdir())
+
+@pytest.mark.parametrize("body, content_type", [
+    (multipart(*[("files", b"\xff\xd8\xff", f"{i}.jpg") for i in range(4)]), None),
+    (multipart(("file", b"\xff\xd8\xff", "a.jpg"))[:-20], None),
+    (b"--other\r\n\r\n", None),
+    (b"{}", "application/json"),
+])
+def test_malformed_forms_raise_value_error(run, tmp_path, body, content_type):
+    request = StreamedRequest(body, **({"content_type": content_type} if content_type else {}))
+    with pytest.raises(ValueError):
+        run(receive_upload_form(request, max_files=3, spool_threshold=0, spool_dir=str(tmp_path)))
+    assert not list(tmp_path.iterdir())
+
+def test_url_encoded_form_without_files(run):
+    request = StreamedRequest(b"use_dummy=true", content_type="application/x-www-form-urlencoded")
+    form = run(receive_upload_form(request))
+    assert form.fields == {"use_dummy": "true"} and form.files == {}
+
+def test_upload_endpoint_refuses_oversized_files(app_client, monkeypatch):
+    client = app_client()
+    image = b"\xff\xd8\xff" + b"z" * (UPLOAD_MAX_BYTES + 1)
+
+    def body():
+        yield b"--" + BOUNDARY + b'\r\nContent-Disposition: form-data; name="file"; filename="big.jpg"\r\n\r\n'
+        for start in range(0, len(image), 1024 * 1024):
+            yield image[start:start + 1024 * 1024]
+        yield b"\r\n--" + BOUNDARY + b"--\r\n"
+
+    # Sent without a Content-Length, so only the per-file limit can catch it
+    response = client.post("/upload", content=body(),
+                           headers={"content-type": f"multipart/form-data; boundary={BOUNDARY.decode()}"})
+    assert response.status_code == 413 and "big.jpg" in response.json()["detail"]
+
+    # A declared length beyond what MAX_PAGES files can add up to is refused before the body is read
+    monkeypatch.setattr(app_alt, "UPLOAD_MAX_BYTES", 1024)
+    response = client.post("/upload", files={"file": ("a.jpg", b"\xff\xd8\xff" + b"z" * 256 * 1024, "image/jpeg")})
+    assert response.status_code == 413
+
+def test_upload_endpoint_refuses_bad_forms(app_client):
+    client = app_client()
+
+    assert client.post("/upload", files=[("files", (f"{i}.jpg", b"\xff\xd8\xff", "image/jpeg"))
+                                         for i in range(MAX_PAGES + 1)]).status_code == 400
+    assert client.post("/upload", data={"use_dummy": "false"}).status_code == 400
+    assert client.post("/upload", content=b"{}", headers={"content-type": "application/json"}).status_code == 400
+    assert client.post("/upload", data={"use_dummy": "true"}).json()["status"] == "done"